@@ -13,7 +13,7 @@ bool move_to_position_blocking(float position1, float position2);
 void calculateEndingLengths(const Command& cmd, float& endA, float& endB);
 void four_corners();
 void printCurrentPositions();
-void determineStripeVelocities(float posA, float posB, float &velA, float &velB);
+void determineStripeVelocities(float posA, float posB, float &velA, float &velB, float direction = 1.0);
 
 /*** comms.cpp ***/
 void onDataSent(const uint8_t *mac_addr, esp_now_send_status_t status);
@@ -59,8 +59,9 @@ bool move_to_position_blocking(float position1, float position2) {
 
 // Helper function to calculate ending pulley lengths for a stripe command
 void calculateEndingLengths(const Command& cmd, float& endA, float& endB) {
-  // Get all required variables
-  float drop = cmd.drop;
+  // Get all required variables; a "(reverse)" stripe starts at the bottom and
+  // ends drop above its start
+  float drop = cmd.stripeName.endsWith("(reverse)") ? -cmd.drop : cmd.drop;
   float As = cmd.startPulleyA;
   float Bs = cmd.startPulleyB;
   float Psep = pulleySpacing;
@@ -104,6 +105,19 @@ void four_corners() {
   float firstEndA, firstEndB, lastEndA, lastEndB;
   calculateEndingLengths(*firstStripe, firstEndA, firstEndB);
   calculateEndingLengths(*lastStripe, lastEndA, lastEndB);
+
+  // Corners 1 and 2 are the top of the mural, 3 and 4 the bottom; a
+  // "(reverse)" stripe starts at the bottom, so its end is the top corner
+  float firstTopA = firstStripe->startPulleyA, firstTopB = firstStripe->startPulleyB;
+  float lastTopA = lastStripe->startPulleyA, lastTopB = lastStripe->startPulleyB;
+  if (firstStripe->stripeName.endsWith("(reverse)")) {
+    firstTopA = firstEndA; firstTopB = firstEndB;
+    firstEndA = firstStripe->startPulleyA; firstEndB = firstStripe->startPulleyB;
+  }
+  if (lastStripe->stripeName.endsWith("(reverse)")) {
+    lastTopA = lastEndA; lastTopB = lastEndB;
+    lastEndA = lastStripe->startPulleyA; lastEndB = lastStripe->startPulleyB;
+  }
   
   auto interruptibleDelay = [](unsigned long ms) -> bool {
     unsigned long t0 = millis();
@@ -116,29 +130,29 @@ void four_corners() {
     return true;
   };
 
-  // Corner 1: First stripe starting position
-  Serial.println("Moving to Corner 1 (First stripe start)");
-  if (!move_to_position_blocking(firstStripe->startPulleyA, firstStripe->startPulleyB)) return;
+  // Corner 1: First stripe top
+  Serial.println("Moving to Corner 1 (First stripe top)");
+  if (!move_to_position_blocking(firstTopA, firstTopB)) return;
   Serial.println("Triggering at Corner 1");
   sendSinglePaintBurst();
   if (!interruptibleDelay(5000)) return;
 
-  // Corner 3: First stripe ending position
-  Serial.println("Moving to Corner 3 (First stripe end)");
+  // Corner 3: First stripe bottom
+  Serial.println("Moving to Corner 3 (First stripe bottom)");
   if (!move_to_position_blocking(firstEndA, firstEndB)) return;
   Serial.println("Triggering at Corner 3");
   sendSinglePaintBurst();
   if (!interruptibleDelay(5000)) return;
 
-  // Corner 2: Last stripe starting position
-  Serial.println("Moving to Corner 2 (Last stripe start)");
-  if (!move_to_position_blocking(lastStripe->startPulleyA, lastStripe->startPulleyB)) return;
+  // Corner 2: Last stripe top
+  Serial.println("Moving to Corner 2 (Last stripe top)");
+  if (!move_to_position_blocking(lastTopA, lastTopB)) return;
   Serial.println("Triggering at Corner 2");
   sendSinglePaintBurst();
   if (!interruptibleDelay(5000)) return;
 
-  // Corner 4: Last stripe ending position
-  Serial.println("Moving to Corner 4 (Last stripe end)");
+  // Corner 4: Last stripe bottom
+  Serial.println("Moving to Corner 4 (Last stripe bottom)");
   if (!move_to_position_blocking(lastEndA, lastEndB)) return;
   Serial.println("Triggering at Corner 4");
   sendSinglePaintBurst();
@@ -163,9 +177,10 @@ void printCurrentPositions() {
   Serial.println(steps2);
 }
 
-void determineStripeVelocities(float posA, float posB, float &velA, float &velB) {
+// direction is 1 for stripes painted downward, -1 for "(reverse)" stripes painted upward
+void determineStripeVelocities(float posA, float posB, float &velA, float &velB, float direction) {
   float Vx = 0;
-  float Vy = stripeVelocity * stripeVelocityMultiplier * stepsPerMeter;
+  float Vy = direction * stripeVelocity * stripeVelocityMultiplier * stepsPerMeter;
 
   float pulleySpacingSteps = pulleySpacing * stepsPerMeter;
 
@@ -180,7 +195,7 @@ void determineStripeVelocities(float posA, float posB, float &velA, float &velB)
 
   float desiredXPositionSteps = stepsPerMeter * Vx * ((float)velocityCalcDelay / 1000)
                               + xPositionSteps;
-  float desiredYPositionSteps = stepsPerMeter * stripeVelocity * stripeVelocityMultiplier * ((float)velocityCalcDelay / 1000)
+  float desiredYPositionSteps = direction * stepsPerMeter * stripeVelocity * stripeVelocityMultiplier * ((float)velocityCalcDelay / 1000)
                               + yPositionSteps;
 
   float aLengthDesired = sqrt(desiredXPositionSteps * desiredXPositionSteps
@@ -280,12 +280,18 @@ void startNextCommand() {
       Serial.print("Executing STRIPE command #");
       Serial.println(currentCommandIndex + 1);
 
+      // serpentine gcode marks every other stripe "(reverse)": it starts at the
+      // bottom and is painted upward
+      bool reverseStripe = cmd.stripeName.endsWith("(reverse)");
+      float stripeDirection = reverseStripe ? -1.0 : 1.0;
+
       String stripeData = "{";
       stripeData += "\"stripeName\":\"" + cmd.stripeName + "\",";
       stripeData += "\"drop\":" + String(cmd.drop, 4) + ",";
       stripeData += "\"startPulleyA\":" + String(cmd.startPulleyA, 4) + ",";
       stripeData += "\"startPulleyB\":" + String(cmd.startPulleyB, 4) + ",";
       stripeData += "\"pattern\":" + cmd.pattern + ",";
+      stripeData += "\"reverse\":" + String(reverseStripe ? "true" : "false") + ",";
       stripeData += "\"stripeVelocity\":" + String(stripeVelocity * stripeVelocityMultiplier, 4);
       stripeData += "}";
 
@@ -344,7 +350,7 @@ void startNextCommand() {
           }
 
           float velocityA, velocityB;
-          determineStripeVelocities(posA, posB, velocityA, velocityB);
+          determineStripeVelocities(posA, posB, velocityA, velocityB, stripeDirection);
 
           stepper1.setSpeed(-1 * velocityA);
           stepper2.setSpeed(-1 * velocityB);
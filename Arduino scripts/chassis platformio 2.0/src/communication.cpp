@@ -132,6 +132,7 @@ void processReceivedString() {
     float startPulleyA         = doc["startPulleyA"] | 0.0f;
     float startPulleyB         = doc["startPulleyB"] | 0.0f;
     float stripeVelocity       = doc["stripeVelocity"] | 0.0f;
+    bool reverse               = doc["reverse"] | false;   // "(reverse)" stripe, painted upward
     JsonArray patternArray     = doc["pattern"].as<JsonArray>();
     int patternCount           = patternArray.size();
 
@@ -149,8 +150,9 @@ void processReceivedString() {
     Serial.print("Start Pulley B: ");   Serial.println(startPulleyB, 4);
     Serial.print("Stripe Velocity: ");  Serial.println(stripeVelocity, 4);
     Serial.print("Pattern Count: ");    Serial.println(patternCount);
+    Serial.print("Reverse: ");          Serial.println(reverse ? "yes" : "no");
 
-    sprayAndStripe(stripeVelocity, drop, patternList, patternCount);
+    sprayAndStripe(stripeVelocity, drop, patternList, patternCount, reverse);
     delete[] patternList;
 }
 
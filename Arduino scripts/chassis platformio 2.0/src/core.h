@@ -19,8 +19,8 @@ extern ledgerEntry ledger[MAX_LEDGER_SIZE];
 // Pattern interpreter functions
 void initLedger();
 void schedulePin(int solenoid, uint32_t delayFromNowMs, uint16_t widthMs = 0);
-void interpretPattern(const String& patternToProcess, float speed);
-void sprayAndStripe(float stripeVelocity, float drop, String* patternList, int patternCount);
+void interpretPattern(String* patternList, int patternCount, int row, float speed, double intervalMs, bool reverse);
+void sprayAndStripe(float stripeVelocity, float drop, String* patternList, int patternCount, bool reverse = false);
 
 // ESP-NOW message struct
 typedef struct struct_message {
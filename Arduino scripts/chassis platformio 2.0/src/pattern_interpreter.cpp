@@ -36,24 +36,40 @@ void schedulePin(int solenoid, uint32_t delayFromNowMs, uint16_t widthMs) {
                 solenoid, (unsigned long)t);
 }
 
-void interpretPattern(const String& patternToProcess, float speed) {
-    if (patternToProcess.length() < 1 || speed <= 0.0f) return;
-
-    const uint32_t block1DelayMs = (uint32_t)(BLOCK1_SPACING_M / speed * 1000.0f + 0.5f);
-    const uint32_t block2DelayMs = (uint32_t)(BLOCK2_SPACING_M / speed * 1000.0f + 0.5f);
+// Schedules the fires for pattern row `row`, the row under block 3 (the
+// reference block) now.  Painting downward, blocks 1 and 2 trail block 3 and
+// fire this row BLOCK{1,2}_SPACING_M / speed later.  Painting upward
+// ("(reverse)" stripes) they lead, so they fire the row block 3 reaches
+// spacing / speed from now, early by the fraction of a row interval it is
+// ahead; the bottom rows they had already passed at the start are lost, as
+// the downward trailing fires past the end of the stripe are.
+void interpretPattern(String* patternList, int patternCount, int row, float speed, double intervalMs, bool reverse) {
+    if (row < 0 || row >= patternCount || speed <= 0.0f) return;
+
+    const float blockSpacingM[3] = { BLOCK1_SPACING_M, BLOCK2_SPACING_M, 0.0f };
+    const String* blockPattern[3];
+    uint32_t blockDelayMs[3];
+    for (int b = 0; b < 3; b++) {
+        const float travelMs = blockSpacingM[b] / speed * 1000.0f;
+        int blockRow = row;
+        blockDelayMs[b] = (uint32_t)(travelMs + 0.5f);
+        if (reverse && blockSpacingM[b] > 0.0f) {
+            const int leadRows = (int)ceil(travelMs / intervalMs);
+            blockRow = row + leadRows;
+            blockDelayMs[b] = (uint32_t)(leadRows * intervalMs - travelMs + 0.5);
+        }
+        blockPattern[b] = blockRow < patternCount ? &patternList[blockRow] : nullptr;
+    }
 
     for (int i = 0; i < SR_SOLENOIDS_PER_BLOCK; i++) {
-        if (i >= (int)patternToProcess.length()) break;
-        char c = patternToProcess[i];
-        if (c == 'x' || c == 'X') continue;
-
-        if      (c == '1') schedulePin(i + 1,  block1DelayMs);
-        else if (c == '2') schedulePin(i + 11, block2DelayMs);
-        else if (c == '3') schedulePin(i + 21, 0);
+        for (int b = 0; b < 3; b++) {
+            if (!blockPattern[b] || i >= (int)blockPattern[b]->length()) continue;
+            if ((*blockPattern[b])[i] == '1' + b) schedulePin(i + 1 + b * SR_SOLENOIDS_PER_BLOCK, blockDelayMs[b]);
+        }
     }
 }
 
-void sprayAndStripe(float stripeVelocity, float drop, String* patternList, int patternCount) {
+void sprayAndStripe(float stripeVelocity, float drop, String* patternList, int patternCount, bool reverse) {
     initLedger();
 
     if (stripeVelocity <= 0.0f || patternCount <= 0) return;
@@ -79,7 +95,7 @@ void sprayAndStripe(float stripeVelocity, float drop, String* patternList, int p
         lastYellowStripe = yellowNow;
 
         if (triggerCount < patternCount && (double)now >= nextTriggerAt) {
-            interpretPattern(patternList[triggerCount++], stripeVelocity);
+            interpretPattern(patternList, patternCount, triggerCount++, stripeVelocity, intervalMs, reverse);
             nextTriggerAt += intervalMs;
         }
 
@@ -0,0 +1,333 @@
+import json
+import re
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+import gcode_writer
+import palette
+import stripe_engine
+
+
+# Binary gcode container
+# ----------------------
+# Same content as the text gcode, but every STRIPE block is stored as a fixed
+# record header followed by its pattern packed two nozzles per byte, and an
+# offset table at the end gives the position of every stripe record so any
+# stripe can be read with one seek.
+#
+#   header       HEADER (magic, version, flags, counts and section offsets)
+#   records      RECORD_HEADER + packed pattern, one per stripe, in file order
+#   color map    COLOR_ENTRY per "Index i => #hex" (multi) or
+#                "change color to:#hex" (mono) line
+#   text         every non-stripe line of the text file, UTF-8
+#   offset table one little-endian uint64 file offset per stripe record
+#
+# Each record remembers where it sat in the text (``text_cursor``, a byte
+# offset into the text section), which is what makes the conversion back to
+# text lossless.  Stripe blocks that would not reproduce exactly -- e.g.
+# patterns with nozzle indices above 9, which the text format writes as
+# multi-character tokens -- are simply kept in the text section.
+
+MAGIC = b"MGCB"
+VERSION = 1
+
+# Header flag: the file came from the mono-color (sequential colors) slicer.
+FLAG_MONO = 1
+
+HEADER = struct.Struct("<4sHHIIQQQQ")
+RECORD_HEADER = struct.Struct("<IIiiiiHBBdddI")
+COLOR_ENTRY = struct.Struct("<BBBB")
+
+# Record flag: a serpentine stripe painted bottom to top ("(reverse)" header).
+RECORD_REVERSE = 1
+
+# Nibble value -> pattern character.  0 is 'x' (do not paint).
+NIBBLE_CHARS = b"x123456789"
+
+_CHAR_TO_NIBBLE = np.full(256, 0xFF, dtype=np.uint8)
+for _value, _char in enumerate(NIBBLE_CHARS):
+    _CHAR_TO_NIBBLE[_char] = _value
+
+_STRIPE_LINE = re.compile(r"^STRIPE - column #(\d+)( \(reverse\))?\n$")
+_POSITION_LINE = re.compile(r"^starting/ending position pixel values:  \((-?\d+),(-?\d+)\),\((-?\d+),(-?\d+)\)\n$")
+_DROP_LINE = re.compile(r"^drop: (\S+)\n$")
+_PULLEY_LINE = re.compile(r"^starting pulley values:  ([^,\s]+),([^,\s]+)\n$")
+_INDEX_LINE = re.compile(r"^Index\s+(\d+)\s*=>\s*(#[0-9a-fA-F]{6})\s*$")
+_CHANGE_COLOR_LINE = re.compile(r"^change color to:(#[0-9a-fA-F]{6})\s*$")
+
+STRIPE_LINES = 5
+
+StripeRecord = namedtuple("StripeRecord", "column start end drop pulley color rows reverse", defaults=(False,))
+
+
+def is_binary_gcode(filepath):
+    """True when ``filepath`` starts with the binary container magic."""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def pack_pattern(rows):
+    """Pack pattern rows into nibbles, first nozzle in the high half of each byte.
+
+    Returns ``(row_width, packed_bytes)`` or ``None`` if the rows are ragged or
+    use characters that have no nibble value.
+    """
+    if not rows:
+        return 0, b""
+    width = len(rows[0])
+    if width == 0 or width > 0xFFFF or any(len(row) != width for row in rows):
+        return None
+    try:
+        raw = "".join(rows).encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    values = _CHAR_TO_NIBBLE[np.frombuffer(raw, dtype=np.uint8)]
+    if (values == 0xFF).any():
+        return None
+    if values.size % 2:
+        values = np.append(values, np.uint8(0))
+    return width, ((values[0::2] << 4) | values[1::2]).tobytes()
+
+
+def unpack_pattern(packed, row_count, width):
+    """Inverse of ``pack_pattern``: return the list of pattern row strings."""
+    if row_count == 0:
+        return []
+    data = np.frombuffer(packed, dtype=np.uint8)
+    values = np.empty(data.size * 2, dtype=np.uint8)
+    values[0::2] = data >> 4
+    values[1::2] = data & 0x0F
+    chars = np.frombuffer(NIBBLE_CHARS, dtype=np.uint8)[values[:row_count * width]]
+    rows = chars.view(f'S{width}')
+    return [row.decode('ascii') for row in rows.tolist()]
+
+
+def _parse_stripe(lines, color):
+    """Turn the five lines of a STRIPE block into a StripeRecord.
+
+    Returns ``None`` unless formatting the record again gives back exactly
+    the same text, so anything unusual stays in the text section untouched.
+    """
+    m_stripe = _STRIPE_LINE.match(lines[0])
+    m_pos = _POSITION_LINE.match(lines[1])
+    m_drop = _DROP_LINE.match(lines[3])
+    m_pulley = _PULLEY_LINE.match(lines[4])
+    if not (m_stripe and m_pos and m_drop and m_pulley and lines[2].startswith("pattern: ")):
+        return None
+    try:
+        rows = json.loads(lines[2][len("pattern: "):])
+        record = StripeRecord(
+            column=int(m_stripe.group(1)),
+            start=(int(m_pos.group(1)), int(m_pos.group(2))),
+            end=(int(m_pos.group(3)), int(m_pos.group(4))),
+            drop=float(m_drop.group(1)),
+            pulley=(float(m_pulley.group(1)), float(m_pulley.group(2))),
+            color=color,
+            rows=rows,
+            reverse=m_stripe.group(2) is not None,
+        )
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(rows, list) or not all(isinstance(row, str) for row in rows):
+        return None
+    if format_record(record) != "".join(lines):
+        return None
+    return record
+
+
+def format_record(record):
+    """Render a StripeRecord as the text STRIPE block."""
+    return stripe_engine.format_stripe_block(
+        record.column, record.start, record.end, record.rows,
+        record.drop, record.pulley[0], record.pulley[1], record.reverse,
+    )
+
+
+def _encode_record(record, text_cursor):
+    packed = pack_pattern(record.rows)
+    if packed is None:
+        return None
+    width, data = packed
+    fields = (record.column, text_cursor) + tuple(record.start) + tuple(record.end)
+    try:
+        flags = RECORD_REVERSE if record.reverse else 0
+        header = RECORD_HEADER.pack(*fields, width, record.color, flags, record.drop,
+                                    record.pulley[0], record.pulley[1], len(record.rows))
+    except struct.error:
+        return None
+    return header + data
+
+
+def text_to_binary(text_path, binary_path):
+    """Convert a text gcode file to the binary container. Returns the stripe count."""
+    text_parts = []
+    text_size = 0
+    colors = []
+    offsets = []
+    mono = False
+    mono_color = 0
+
+    with open(text_path, 'r') as src, gcode_writer.GcodeWriter(binary_path) as out:
+        out.write_bytes(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0, 0, 0, 0))
+
+        def keep_text(line):
+            nonlocal text_size, mono, mono_color
+            m_index = _INDEX_LINE.match(line)
+            m_change = _CHANGE_COLOR_LINE.match(line)
+            if m_index:
+                colors.append((int(m_index.group(1)), m_index.group(2)))
+            elif m_change:
+                colors.append((len(colors) + 1, m_change.group(1)))
+                mono_color = len(colors)
+            if line.startswith("BEGIN MONO COLOR VELOCITY SLICING"):
+                mono = True
+            encoded = line.encode('utf-8')
+            text_parts.append(encoded)
+            text_size += len(encoded)
+
+        pending = []
+        for line in src:
+            pending.append(line)
+            if not pending[0].startswith("STRIPE - column #"):
+                keep_text(pending.pop(0))
+                continue
+            if len(pending) < STRIPE_LINES:
+                continue
+
+            record = _parse_stripe(pending, min(mono_color, 0xFF))
+            encoded = None if record is None else _encode_record(record, text_size)
+            if encoded is None:
+                keep_text(pending.pop(0))
+                # the remaining lines may themselves start a stripe; re-scan them
+                rest, pending = pending, []
+                for line in rest:
+                    pending.append(line)
+                    while pending and not pending[0].startswith("STRIPE - column #"):
+                        keep_text(pending.pop(0))
+                continue
+            offsets.append(out.tell())
+            out.write_bytes(encoded)
+            pending = []
+        for line in pending:
+            keep_text(line)
+
+        color_offset = out.tell()
+        for index, hex_code in colors:
+            value = palette.hex_to_packed(hex_code)
+            out.write_bytes(COLOR_ENTRY.pack(index & 0xFF, (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF))
+        text_offset = out.tell()
+        out.write_bytes(b"".join(text_parts))
+        table_offset = out.tell()
+        out.write_bytes(np.asarray(offsets, dtype='<u8').tobytes())
+
+        out.patch(0, HEADER.pack(MAGIC, VERSION, FLAG_MONO if mono else 0, len(offsets), len(colors),
+                                 color_offset, text_offset, text_size, table_offset))
+    return len(offsets)
+
+
+class BinaryGcodeReader:
+    """Random-access reader for the binary container.
+
+    Only the header, color map and offset table are read up front;
+    ``read_stripe(i)`` seeks straight to record ``i``.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        try:
+            header = self._file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"{filepath} is too short to be a binary gcode file")
+            (magic, version, self.flags, self.stripe_count, color_count,
+             color_offset, self.text_offset, self.text_size, table_offset) = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"{filepath} is not a binary gcode file")
+            if version != VERSION:
+                raise ValueError(f"Unsupported binary gcode version {version} in {filepath}")
+
+            self._file.seek(color_offset)
+            entries = self._file.read(COLOR_ENTRY.size * color_count)
+            self.colors = [(index, "#{:02x}{:02x}{:02x}".format(r, g, b))
+                           for index, r, g, b in COLOR_ENTRY.iter_unpack(entries)]
+
+            self._file.seek(table_offset)
+            self.offsets = np.frombuffer(self._file.read(8 * self.stripe_count), dtype='<u8')
+        except Exception:
+            self._file.close()
+            raise
+
+    @property
+    def mono(self):
+        return bool(self.flags & FLAG_MONO)
+
+    @property
+    def color_map(self):
+        """Index -> hex color, later entries winning like in the text viewer."""
+        return {index: hex_code for index, hex_code in self.colors}
+
+    def _read_record(self, i):
+        self._file.seek(int(self.offsets[i]))
+        fields = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+        column, text_cursor, sx, sy, ex, ey, width, color, flags, drop, la, lb, row_count = fields
+        packed = self._file.read((row_count * width + 1) // 2)
+        rows = unpack_pattern(packed, row_count, width)
+        return text_cursor, StripeRecord(column, (sx, sy), (ex, ey), drop, (la, lb), color, rows,
+                                         bool(flags & RECORD_REVERSE))
+
+    def read_stripe(self, i):
+        if not 0 <= i < self.stripe_count:
+            raise IndexError(f"stripe {i} out of range (file has {self.stripe_count})")
+        return self._read_record(i)[1]
+
+    def iter_stripes(self):
+        for i in range(self.stripe_count):
+            yield self._read_record(i)[1]
+
+    def iter_text(self):
+        """Yield the original text gcode in chunks (stripe blocks and the text in between)."""
+        self._file.seek(self.text_offset)
+        text = self._file.read(self.text_size)
+        position = 0
+        for i in range(self.stripe_count):
+            text_cursor, record = self._read_record(i)
+            yield text[position:text_cursor].decode('utf-8')
+            position = text_cursor
+            yield format_record(record)
+        yield text[position:].decode('utf-8')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def binary_to_text(binary_path, text_path):
+    """Write the text gcode that ``binary_path`` was made from. Returns the stripe count."""
+    with BinaryGcodeReader(binary_path) as reader, gcode_writer.GcodeWriter(text_path) as out:
+        out.write_stripes(reader.iter_text())
+        return reader.stripe_count
+
+
+if __name__ == "__main__":
+    # python binary_gcode.py gcode.txt gcode.bin   (text -> binary)
+    # python binary_gcode.py gcode.bin gcode.txt   (binary -> text)
+    if len(sys.argv) != 3:
+        print("usage: binary_gcode.py <input> <output>")
+        sys.exit(1)
+    source, target = sys.argv[1], sys.argv[2]
+    if is_binary_gcode(source):
+        count = binary_to_text(source, target)
+    else:
+        count = text_to_binary(source, target)
+    print(f"Converted {count} stripes: {source} -> {target}")
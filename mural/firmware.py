@@ -0,0 +1,56 @@
+# Values mirrored from the base module firmware
+# (Arduino scripts/Base Module Platformio/src/main.cpp and parser.cpp) and the
+# chassis firmware so the Python side can estimate and simulate what the
+# robot will do with a gcode file.  Keep these in sync when the firmware
+# defaults change.
+
+# meters -> steps (main.cpp: artificially lowered ~5% from the calibrated 8835)
+STEPS_PER_METER = 8395
+
+# AccelStepper settings used for repositioning moves, in steps/s^2 and steps/s
+BASE_ACCELERATION = 3200.0
+BASE_MAX_SPEED = 1800.0
+
+# Vertical chassis speed while painting a stripe, in m/s
+STRIPE_VELOCITY = 0.125 * 1.7
+
+# Cable velocities are recomputed this often during a stripe, in ms
+VELOCITY_CALC_DELAY_MS = 100
+
+# parser.cpp: delay(2000) after reaching the top of a stripe, then pauseAtTheTop
+SETTLE_DELAY_MS = 2000
+PAUSE_AT_THE_TOP_MS = 5000
+
+# parser.cpp: delay(100) after every stripe in run mode
+POST_STRIPE_DELAY_MS = 100
+
+# state.h: commands held in memory at once
+MAX_COMMANDS = 200
+
+# Chassis firmware (Arduino scripts/chassis platformio/src)
+
+# hardware.h: slots in the solenoid fire ledger
+CHASSIS_MAX_LEDGER_SIZE = 100
+
+# hardware.h: entries in SOLENOID_PINS
+CHASSIS_NUM_SOLENOIDS = 13
+
+# main.cpp: default solenoid pulse width (durationMs), in ms
+CHASSIS_DURATION_MS = 10.0
+
+# pattern_interpreter.cpp: interpretPattern reads this many nozzle characters
+CHASSIS_PATTERN_WIDTH = 8
+
+# pattern_interpreter.cpp: interpretPattern ignores rows shorter than this
+CHASSIS_MIN_PATTERN_LENGTH = 4
+
+# Shift-register chassis (Arduino scripts/chassis platformio 2.0/src)
+
+# hardware.h: solenoids per nozzle block; block b drives solenoids
+# b * 10 + 1 .. b * 10 + 10 from pattern character '1' + b
+CHASSIS2_SOLENOIDS_PER_BLOCK = 10
+CHASSIS2_NUM_SOLENOIDS = 30
+
+# hardware.h: distance of blocks 1 and 2 from block 3, in meters
+CHASSIS2_BLOCK1_SPACING_M = 0.088
+CHASSIS2_BLOCK2_SPACING_M = 0.044
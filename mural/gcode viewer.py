@@ -3,10 +3,49 @@ import ast
 from PIL import Image, ImageDraw, ImageFont
 import matplotlib.pyplot as plt
 import math
+import numpy as np
+import palette
+import binary_gcode
+import stripe_engine
+
+def place_stripes(entries):
+    """
+    Turn parsed stripes into full-height, gap-free stripes for drawing.
+      - entries: list of (layer, column number, top y or None, rows top to bottom)
+    Trimmed stripes are padded with 'x' rows back to the mural height (the
+    highest top y seen), and columns left out because they had no paint are
+    filled with blank stripes.  Each run of entries with the same layer (the
+    'change color to:' section of mono files) is laid out next to the last.
+    """
+    if not entries:
+        return []
+    height = max(len(rows) if top is None else top for _, _, top, rows in entries)
+    max_column = max(column for _, column, _, _ in entries)
+    stripe_width = next((len(rows[0]) for _, _, _, rows in entries if rows), 0)
+    blank_row = 'x' * stripe_width
+
+    layers = []
+    previous_layer = None
+    for layer, column, top, rows in entries:
+        if not layers or layer != previous_layer:
+            layers.append({})
+        previous_layer = layer
+        top = height if top is None else top
+        padded = [blank_row] * (height - top) + list(rows)
+        padded += [blank_row] * (height - len(padded))
+        layers[-1][column] = padded
+
+    stripes = []
+    for layer in layers:
+        for column in range(1, max_column + 1):
+            stripes.append(layer.get(column, [blank_row] * height))
+    return stripes
+
 
 def parse_gcode_file(filepath):
     """
-    Reads the entire text file and extracts:
+    Reads the entire text file (or a binary container written by
+    binary_gcode.py) and extracts:
       - color_map: dict of { '1': '#xxxxxx', '2': '#xxxxxx', ... , 'x': '#ffffff' }
       - stripes: list of stripe patterns [ [row0, row1, ...], [row0, row1, ...], ... ]
         Each rowN is a 4-character string (e.g. "2223").
@@ -17,12 +56,27 @@ def parse_gcode_file(filepath):
     # Predefine 'x' => white in case it's missing from the file
     color_map['x'] = '#ffffff'
 
+    # Binary containers (binary_gcode.py) carry the same data pre-parsed
+    if binary_gcode.is_binary_gcode(filepath):
+        with binary_gcode.BinaryGcodeReader(filepath) as reader:
+            if not reader.mono:
+                for index, hex_color in reader.colors:
+                    color_map[str(index)] = hex_color
+            # mono records carry the index of their 'change color to:' line
+            entries = [(record.color, record.column, max(record.start[1], record.end[1]),
+                        record.rows[::-1] if record.reverse else record.rows)
+                       for record in reader.iter_stripes()]
+        return color_map, place_stripes(entries)
+
     # Regex to detect lines like: "Index 1 => #e59e60"
     color_line_regex = re.compile(r'Index\s+(\S+)\s*=>\s*(#[0-9a-fA-F]{6})')
 
     # Regex to detect start of a STRIPE block: "STRIPE - column #..."
     stripe_start_regex = re.compile(r'^STRIPE\s*-\s*column\s*#(\d+)')
 
+    # Regex for "starting/ending position pixel values:  (x,y),(x,y)"
+    position_regex = re.compile(r'^starting/ending position pixel values:\s*\((-?\d+),(-?\d+)\),\((-?\d+),(-?\d+)\)')
+
     # Regex to detect "pattern: [ ... ]" - to capture the whole bracketed list
     pattern_list_regex = re.compile(r'pattern:\s*(\[.*\])')
 
@@ -33,6 +87,11 @@ def parse_gcode_file(filepath):
     in_color_mapping = False
 
     current_stripe = None
+    current_reversed = False
+    current_column = 0
+    current_top = None
+    current_layer = 0
+    entries = []
 
     for line in lines:
         line_stripped = line.strip()
@@ -54,11 +113,26 @@ def parse_gcode_file(filepath):
                 color_map[index_value] = hex_color
             continue
 
+        # Mono files start every color layer with a 'change color to:' line
+        if line_stripped.startswith("change color to:"):
+            current_layer += 1
+            continue
+
         # Detect the start of a new stripe
         s_match = stripe_start_regex.search(line_stripped)
         if s_match:
             # We found a new stripe, prepare a holder for its pattern
             current_stripe = []
+            current_column = int(s_match.group(1))
+            current_top = None
+            # serpentine stripes list their rows bottom to top
+            current_reversed = line_stripped.endswith(stripe_engine.REVERSE_SUFFIX.strip())
+            continue
+
+        # Stripe ends in pixels; trimmed stripes do not start at the top
+        pos_match = position_regex.search(line_stripped)
+        if pos_match:
+            current_top = max(int(pos_match.group(2)), int(pos_match.group(4)))
             continue
 
         # Extract the pattern array if found in the line
@@ -75,10 +149,10 @@ def parse_gcode_file(filepath):
 
             # Each element in pattern_list is a string (width depends on num_nozzles, e.g. "222233" or "2223")
             # We'll store it in current_stripe
-            current_stripe = pattern_list
-            stripes.append(current_stripe)
+            current_stripe = pattern_list[::-1] if current_reversed else pattern_list
+            entries.append((current_layer, current_column, current_top, current_stripe))
 
-    return color_map, stripes
+    return color_map, place_stripes(entries)
 
 def create_image_from_stripes(color_map, stripes):
     """
@@ -101,22 +175,26 @@ def create_image_from_stripes(color_map, stripes):
     
     total_width = stripe_width * len(stripes)
 
-    # Create a new image (RGBA or RGB)
-    img = Image.new('RGB', (total_width, stripe_height), color='white')
-    draw = ImageDraw.Draw(img)
-
+    # Lay every pattern character out in one (height, width) array of ASCII
+    # codes, then color the whole thing with a single table lookup.
+    codes = np.full((stripe_height, total_width), ord('x'), dtype=np.uint8)
     for s_idx, stripe in enumerate(stripes):
-        for y, row_str in enumerate(stripe):
-            # row_str is something like "222233" or "x1x2x1" (width determined dynamically)
-            for x_offset, char in enumerate(row_str):
-                # Determine color
-                pixel_color = color_map.get(char, '#ffffff')  # default to white if unknown
-                # Compute real X position in final image
-                x = s_idx * stripe_width + x_offset
-                # Draw pixel
-                draw.point((x, y), fill=pixel_color)
-
-    return img
+        rows = [row_str[:stripe_width].ljust(stripe_width, 'x') for row_str in stripe[:stripe_height]]
+        if not rows:
+            continue
+        # rows are strings like "222233" or "x1x2x1" (width determined dynamically)
+        block = np.frombuffer(''.join(rows).encode('ascii', 'replace'), dtype=np.uint8)
+        x0 = s_idx * stripe_width
+        codes[:len(rows), x0:x0 + stripe_width] = block.reshape(len(rows), stripe_width)
+
+    # default to white if unknown
+    table = np.full((256, 3), 255, dtype=np.uint8)
+    for char, hex_color in color_map.items():
+        if len(char) == 1 and ord(char) < 256:
+            value = palette.hex_to_packed(hex_color)
+            table[ord(char)] = ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+
+    return Image.fromarray(table[codes], 'RGB')
 
 def add_legend_to_image(img, color_map):
     """
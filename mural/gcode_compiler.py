@@ -0,0 +1,221 @@
+import json
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+import binary_gcode
+import firmware
+import gcode_writer
+import palette
+import stripe_engine
+
+
+# Compiled gcode for the base module loader
+# -----------------------------------------
+# loadCommandsFromFile parses gcode.txt line by line and keeps every pattern
+# as a heap String.  The compiled file holds the same commands as fixed-size
+# records the loader can read straight into a struct, with the patterns
+# packed two nozzles per byte (binary_gcode.pack_pattern) in one block after
+# the records:
+#
+#   header    LOADER_HEADER: magic, version, record size, command count,
+#             number of drawn columns, pulley spacing, pattern block offset/size
+#   records   COMMAND_RECORD per command, in file order
+#   patterns  packed pattern bytes, one run per stripe
+#
+# All fields are little-endian; in C the record is
+#
+#   struct CompiledCommand {      // 32 bytes
+#     uint8_t  type;              // Command::Type (MOVE 0, COLOR_CHANGE 1, STRIPE 2)
+#     uint8_t  flags;             // bit 0: "(reverse)" stripe
+#     uint16_t column;            // STRIPE - column #N
+#     uint16_t patternWidth;      // nozzles per pattern row
+#     uint16_t reserved;
+#     uint32_t color;             // 0xRRGGBB for COLOR_CHANGE
+#     float    drop;
+#     float    startPulleyA;
+#     float    startPulleyB;
+#     uint32_t rowCount;
+#     uint32_t patternOffset;     // into the pattern block
+#   };
+#
+# The floats are what String::toFloat gives the firmware today, so compiling
+# does not change any value the robot uses.  Everything the loader skips
+# (comments, position lines, slicing markers) is not kept.
+#
+#   python gcode_compiler.py gcode.txt gcode.cmp   (compile and verify)
+
+LOADER_MAGIC = b"MGCL"
+LOADER_VERSION = 1
+
+LOADER_HEADER = struct.Struct("<4sHHIifII")
+COMMAND_RECORD = struct.Struct("<BBHHHIfffII")
+
+# state.h Command::Type
+COMMAND_MOVE = 0
+COMMAND_COLOR_CHANGE = 1
+COMMAND_STRIPE = 2
+
+# Record flag: a serpentine stripe painted bottom to top.
+COMMAND_REVERSE = 1
+
+_STRIPE_PREFIX = "STRIPE - column #"
+
+LoaderCommand = namedtuple("LoaderCommand", "type name color drop start_a start_b rows")
+CompiledGcode = namedtuple("CompiledGcode", "number_of_drawn_columns pulley_spacing commands")
+
+
+def parse_commands(text_path):
+    """Read a text gcode file the way loadCommandsFromFile does.
+
+    Returns a CompiledGcode whose commands carry the values as the firmware
+    sees them: float32 numbers, the trimmed stripe header as ``name``, the
+    color upper-cased and the pattern as a list of row strings.
+    """
+    number_of_drawn_columns = 0
+    pulley_spacing = np.float32(0.0)
+    commands = []
+    stripe = None
+    with open(text_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("//") or not line:
+                continue
+            if line.startswith("number of drawn columns ="):
+                number_of_drawn_columns = int(line.split("=", 1)[1])
+            elif line.startswith("pulley spacing ="):
+                pulley_spacing = np.float32(line.split("=", 1)[1])
+            elif line.startswith(_STRIPE_PREFIX):
+                stripe = {"name": line, "drop": np.float32(0.0), "rows": []}
+            elif stripe is not None and line.startswith("drop:"):
+                stripe["drop"] = np.float32(line[len("drop:"):])
+            elif stripe is not None and line.startswith("pattern:"):
+                stripe["rows"] = json.loads(line[len("pattern:"):])
+            elif stripe is not None and line.startswith("starting pulley values:"):
+                la, lb = line.split(":", 1)[1].split(",")
+                commands.append(LoaderCommand(COMMAND_STRIPE, stripe["name"], None, stripe["drop"],
+                                              np.float32(la), np.float32(lb), stripe["rows"]))
+                stripe = None
+            elif line.startswith("change color to:"):
+                color = line[len("change color to:"):].strip().upper()
+                commands.append(LoaderCommand(COMMAND_COLOR_CHANGE, None, color, None, None, None, None))
+    return CompiledGcode(number_of_drawn_columns, pulley_spacing, commands)
+
+
+def _stripe_column(name):
+    column, _, suffix = name[len(_STRIPE_PREFIX):].partition(" ")
+    reverse = name.endswith(stripe_engine.REVERSE_SUFFIX)
+    if suffix and not reverse:
+        raise ValueError(f"unexpected stripe header {name!r}")
+    return int(column), reverse
+
+
+def compile_gcode(text_path, compiled_path):
+    """Compile ``text_path`` to fixed-size records. Returns the command count.
+
+    Raises ValueError for stripes whose pattern cannot be packed (ragged
+    rows or nozzle indices above 9).
+    """
+    gcode = parse_commands(text_path)
+    if len(gcode.commands) > firmware.MAX_COMMANDS:
+        print(f"Warning: {len(gcode.commands)} commands, the base module holds {firmware.MAX_COMMANDS}.")
+    records = []
+    patterns = []
+    pattern_size = 0
+    for cmd in gcode.commands:
+        if cmd.type == COMMAND_COLOR_CHANGE:
+            records.append(COMMAND_RECORD.pack(COMMAND_COLOR_CHANGE, 0, 0, 0, 0,
+                                               palette.hex_to_packed(cmd.color), 0.0, 0.0, 0.0, 0, 0))
+            continue
+        column, reverse = _stripe_column(cmd.name)
+        packed = binary_gcode.pack_pattern(cmd.rows)
+        if packed is None:
+            raise ValueError(f"{cmd.name}: pattern cannot be packed (ragged rows or nozzle index above 9)")
+        width, data = packed
+        records.append(COMMAND_RECORD.pack(COMMAND_STRIPE, COMMAND_REVERSE if reverse else 0, column, width, 0, 0,
+                                           cmd.drop, cmd.start_a, cmd.start_b, len(cmd.rows), pattern_size))
+        patterns.append(data)
+        pattern_size += len(data)
+
+    pattern_offset = LOADER_HEADER.size + COMMAND_RECORD.size * len(records)
+    with gcode_writer.GcodeWriter(compiled_path) as out:
+        out.write_bytes(LOADER_HEADER.pack(LOADER_MAGIC, LOADER_VERSION, COMMAND_RECORD.size, len(records),
+                                           gcode.number_of_drawn_columns, gcode.pulley_spacing,
+                                           pattern_offset, pattern_size))
+        out.write_bytes(b"".join(records))
+        out.write_bytes(b"".join(patterns))
+    return len(records)
+
+
+def read_compiled(compiled_path):
+    """Reference decoder: the CompiledGcode stored in a compiled file."""
+    with open(compiled_path, 'rb') as f:
+        data = f.read()
+    if len(data) < LOADER_HEADER.size:
+        raise ValueError(f"{compiled_path} is too short to be a compiled gcode file")
+    (magic, version, record_size, command_count, number_of_drawn_columns, pulley_spacing,
+     pattern_offset, pattern_size) = LOADER_HEADER.unpack_from(data)
+    if magic != LOADER_MAGIC:
+        raise ValueError(f"{compiled_path} is not a compiled gcode file")
+    if version != LOADER_VERSION or record_size != COMMAND_RECORD.size:
+        raise ValueError(f"Unsupported compiled gcode version {version} (record size {record_size}) "
+                         f"in {compiled_path}")
+    if pattern_offset + pattern_size > len(data):
+        raise ValueError(f"{compiled_path} is truncated")
+
+    commands = []
+    for i in range(command_count):
+        (kind, flags, column, width, _, color, drop, start_a, start_b,
+         row_count, offset) = COMMAND_RECORD.unpack_from(data, LOADER_HEADER.size + i * record_size)
+        if kind == COMMAND_COLOR_CHANGE:
+            commands.append(LoaderCommand(kind, None, palette.packed_to_hex(color).upper(),
+                                          None, None, None, None))
+            continue
+        start = pattern_offset + offset
+        rows = binary_gcode.unpack_pattern(data[start:start + (row_count * width + 1) // 2], row_count, width)
+        name = f"{_STRIPE_PREFIX}{column}{stripe_engine.REVERSE_SUFFIX if flags & COMMAND_REVERSE else ''}"
+        commands.append(LoaderCommand(kind, name, None, np.float32(drop), np.float32(start_a),
+                                      np.float32(start_b), rows))
+    return CompiledGcode(number_of_drawn_columns, np.float32(pulley_spacing), commands)
+
+
+def verify_compiled(text_path, compiled_path):
+    """Round-trip check: compare what the loader would read from both files.
+
+    Returns a list of differences; empty means the compiled file is exact.
+    """
+    expected = parse_commands(text_path)
+    actual = read_compiled(compiled_path)
+    problems = []
+    if expected.number_of_drawn_columns != actual.number_of_drawn_columns:
+        problems.append(f"number of drawn columns {actual.number_of_drawn_columns} "
+                        f"!= {expected.number_of_drawn_columns}")
+    if expected.pulley_spacing != actual.pulley_spacing:
+        problems.append(f"pulley spacing {actual.pulley_spacing} != {expected.pulley_spacing}")
+    if len(expected.commands) != len(actual.commands):
+        problems.append(f"{len(actual.commands)} commands != {len(expected.commands)}")
+    for i, (want, got) in enumerate(zip(expected.commands, actual.commands)):
+        fields = [field for field in LoaderCommand._fields if getattr(want, field) != getattr(got, field)]
+        if fields:
+            problems.append(f"command {i + 1} ({want.name or want.color}): {', '.join(fields)} differ")
+    return problems
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: gcode_compiler.py <gcode.txt> <compiled output>")
+        sys.exit(1)
+    source, target = sys.argv[1], sys.argv[2]
+    try:
+        count = compile_gcode(source, target)
+        problems = verify_compiled(source, target)
+    except Exception as e:
+        print(f"Could not compile {source}: {e}")
+        sys.exit(1)
+    for problem in problems[:20]:
+        print(problem)
+    if problems:
+        print(f"Round trip FAILED: {len(problems)} differences")
+        sys.exit(1)
+    print(f"Compiled {count} commands to {target}; round trip OK")
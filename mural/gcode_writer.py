@@ -0,0 +1,132 @@
+import locale
+import os
+import shutil
+import tempfile
+import time
+
+
+# Default number of buffered bytes before the writer hands them to the OS.
+DEFAULT_FLUSH_BYTES = 1 << 20
+
+
+class GcodeWriter:
+    """Streaming sink for gcode text with one handle and an atomic finish.
+
+    Lines and stripe blocks are collected in a small in-memory buffer that is
+    written out whenever it grows past ``flush_bytes``, so memory use depends
+    on the flush threshold rather than on the size of the mural.  Everything
+    goes to a temp file next to ``gcode_filepath`` that replaces the real file
+    only when the writer is committed; if slicing fails half way, the
+    previous gcode.txt is left untouched.
+
+    With ``append=True`` the existing file's contents are copied into the
+    temp file first, which is how slicers add to the header written by
+    ``utils.create_text_file``.
+
+    Text is encoded the same way ``open(path, 'a')`` would (locale encoding,
+    platform newlines), so files are byte-identical to the old per-line
+    appends.
+
+    ``write_seconds`` / ``flush_count`` add up the time spent encoding and
+    writing buffered text, for callers that report it as a timing span.
+    """
+
+    def __init__(self, gcode_filepath, flush_bytes=DEFAULT_FLUSH_BYTES, append=False):
+        self.gcode_filepath = gcode_filepath
+        self.flush_bytes = flush_bytes
+        self.encoding = locale.getpreferredencoding(False)
+        self._buffer = []
+        self._buffered = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self.flush_count = 0
+
+        directory = os.path.dirname(os.path.abspath(gcode_filepath))
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".gcode-", suffix=".tmp")
+        self._file = os.fdopen(fd, 'wb')
+        try:
+            if append and os.path.exists(gcode_filepath):
+                with open(gcode_filepath, 'rb') as existing:
+                    shutil.copyfileobj(existing, self._file)
+        except Exception:
+            self.abort()
+            raise
+
+    def write(self, text):
+        """Queue raw text; it is flushed once the buffer passes ``flush_bytes``."""
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.flush_bytes:
+            self.flush()
+
+    def write_line(self, line):
+        self.write(line + "\n")
+
+    def write_stripes(self, stripes):
+        """Consume an iterable (typically a generator) of stripe text blocks."""
+        for block in stripes:
+            self.write(block)
+
+    def write_bytes(self, data):
+        """Write already-encoded bytes (binary containers) after any queued text."""
+        self.flush()
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def tell(self):
+        """Current byte offset in the output, counting anything copied by ``append``."""
+        self.flush()
+        return self._file.tell()
+
+    def patch(self, offset, data):
+        """Overwrite bytes at ``offset`` (e.g. a header whose fields are known only at the end)."""
+        self.flush()
+        end = self._file.tell()
+        self._file.seek(offset)
+        self._file.write(data)
+        self._file.seek(end)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        start = time.perf_counter()
+        data = "".join(self._buffer)
+        if os.linesep != "\n":
+            data = data.replace("\n", os.linesep)
+        encoded = data.encode(self.encoding)
+        self._file.write(encoded)
+        self.write_seconds += time.perf_counter() - start
+        self.flush_count += 1
+        self.bytes_written += len(encoded)
+        self._buffer = []
+        self._buffered = 0
+
+    def commit(self):
+        """Flush, close, and atomically move the temp file over the target."""
+        self.flush()
+        self._file.close()
+        # mkstemp creates owner-only files; keep the permissions a plain open() would give.
+        if os.path.exists(self.gcode_filepath):
+            shutil.copymode(self.gcode_filepath, self.temp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self.temp_path, 0o666 & ~umask)
+        os.replace(self.temp_path, self.gcode_filepath)
+
+    def abort(self):
+        """Discard everything written so far and leave the target untouched."""
+        self._buffer = []
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
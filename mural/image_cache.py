@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from PIL import Image
+
+
+# On-disk cache for the image stages (resize, color mode) of image_processing.ImagePipeline.
+#
+# Entries are PNG files named after a key that hashes the stage's input key,
+# the stage name and its parameters, starting from a hash of the source file's
+# bytes.  Because each key depends only on inputs and parameters, the final
+# stage's key is known before anything runs, so a hit there skips image
+# processing entirely.  Hits refresh the entry's mtime and the least recently
+# used entries are evicted once the directory grows past ``max_bytes``.
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+ENTRY_SUFFIX = ".png"
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImageStageCache:
+    """Content-addressed store of stage outputs with LRU eviction by total size."""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def key(input_key, stage, params=None):
+        """Key for ``stage`` run with ``params`` on the input identified by ``input_key``."""
+        payload = json.dumps([input_key, stage, params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def source_key(self, file_path):
+        """Key of a source file: the hash of its bytes."""
+        return file_hash(file_path)
+
+    def load_image(self, key):
+        """Return the cached image for ``key`` (fully loaded), or None on a miss."""
+        path = self.entry_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as img:
+                img.load()
+            os.utime(path)
+        except OSError as e:
+            print(f"Could not read image cache entry {path}: {e}")
+            return None
+        return img
+
+    def store_image(self, key, img):
+        """Save ``img`` under ``key`` and evict old entries if over budget."""
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format='PNG')
+            os.replace(temp_path, self.entry_path(key))
+        except OSError as e:
+            print(f"Could not write image cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits ``max_bytes``.
+
+        Several processes may share the cache directory, so entries another
+        process removes in the meantime are skipped; eviction never raises.
+        """
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError as e:
+            print(f"Could not list image cache {self.cache_dir}: {e}")
+            return
+        for name in names:
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Could not stat image cache entry {name}: {e}")
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                # another process evicted it first
+                pass
+            except OSError as e:
+                print(f"Could not evict image cache entry {name}: {e}")
+                continue
+            total -= size
@@ -0,0 +1,508 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+import instrumentation
+
+
+# Image stages of the gcode generator, moved out of mural gcode.py. Each stage
+# takes a PIL image and returns a new one; nothing is written to disk here.
+# ImagePipeline strings them together (source -> resized -> color mode) and
+# only dumps the intermediate PNGs when asked to.
+
+SUPPORTED_FORMATS = ['JPEG', 'PNG', 'BMP', 'GIF', 'TIFF']
+
+
+def load_source(file_path):
+    """Open the source image, keeping an alpha channel if it has one."""
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    with Image.open(file_path) as img:
+        # Validate image format
+        if img.format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported image format: {img.format}")
+        # Preserve the alpha channel if present
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            return img.convert('RGBA')
+        return img.convert('RGB')
+
+
+def load_as_is(file_path):
+    """Open the source image without any conversion (Exact Color Match)."""
+    img = Image.open(file_path)
+    img.load()
+    return img
+
+
+def resize_image(img, new_width):
+    """
+    Resizes the image to the specified width while maintaining the aspect ratio.
+    If the image is already at the desired width, it is returned unchanged.
+    """
+    original_width, original_height = img.size
+    if original_width == new_width:
+        print(f"Image is already at the desired width of {new_width}px. Resizing not needed.")
+        return img
+    new_height = int((new_width / original_width) * original_height)
+    print(f"Image resized to {new_width}x{new_height}")
+    return img.resize((new_width, new_height), Image.LANCZOS)
+
+
+def simplify_image_pillow(image, num_colors):
+    """
+    Simplifies the image by reducing it to a specified number of colors using the Pillow library.
+    """
+    # Preserve alpha channel if present
+    has_alpha = image.mode == 'RGBA'
+    if has_alpha:
+        alpha = image.split()[-1]
+        image = image.convert('RGB')
+    else:
+        alpha = None
+
+    # Quantize to N colors then convert back to RGBA/RGB so the result is a
+    # standard mode image.
+    simplified_image = image.convert(mode='P', palette=Image.ADAPTIVE, colors=num_colors)
+    if has_alpha:
+        simplified_image = simplified_image.convert('RGBA')
+        simplified_image.putalpha(alpha)
+    else:
+        simplified_image = simplified_image.convert('RGB')
+    print(f'Simplified image to {num_colors} colors')
+    return simplified_image
+
+
+def exact_color_match(image):
+    """
+    Like simplify_image_pillow but auto-detects the palette size from the image.
+    Errors out if the image has more than 10 unique colors.
+    """
+    has_alpha = image.mode == 'RGBA'
+    if has_alpha:
+        alpha = image.split()[-1]
+        rgb_image = image.convert('RGB')
+    else:
+        alpha = None
+        rgb_image = image.convert('RGB')
+
+    unique_colors = len(set(rgb_image.getdata()))
+    if unique_colors > 10:
+        raise ValueError(
+            f"this file is not meant for this mode reduce number of colors in your image "
+            f"(found {unique_colors} unique colors, max is 10)"
+        )
+
+    simplified_image = rgb_image.convert(mode='P', palette=Image.ADAPTIVE, colors=unique_colors)
+    if has_alpha:
+        simplified_image = simplified_image.convert('RGBA')
+        simplified_image.putalpha(alpha)
+    else:
+        simplified_image = simplified_image.convert('RGB')
+    print(f'Exact color match image ({unique_colors} colors)')
+    return simplified_image
+
+
+# Dithering onto an adaptive palette.  The palette is the one Simplify Image
+# would pick (Pillow's median cut with ``num_colors`` entries); the dithering
+# then mixes those colors so areas between them keep their tone.
+
+# error-diffusion kernels as (row offset, column offset, weight)
+FLOYD_STEINBERG = ((0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16))
+ATKINSON = ((0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8))
+
+
+def bayer_matrix(size):
+    """``size`` x ``size`` Bayer threshold matrix (size a power of two), values 0..size*size-1."""
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+
+def _split_alpha(image):
+    if image.mode == 'RGBA':
+        return image.convert('RGB'), image.split()[-1]
+    return image.convert('RGB'), None
+
+
+def _adaptive_palette(rgb_image, num_colors):
+    """The colors Pillow's adaptive quantizer picks, as a (k, 3) float32 array."""
+    quantized = rgb_image.convert(mode='P', palette=Image.ADAPTIVE, colors=num_colors)
+    palette = np.array(quantized.getpalette(), dtype=np.float32).reshape(-1, 3)
+    return palette[np.unique(np.asarray(quantized))]
+
+
+def _nearest_color(pixels, palette):
+    """Index of the closest palette color for every pixel of an (..., 3) array."""
+    # |p - c|^2 without the |p|^2 term, which is the same for every c
+    distance = (palette * palette).sum(axis=1) - 2.0 * (pixels @ palette.T)
+    return distance.argmin(axis=-1)
+
+
+def _palette_image(palette, index, alpha):
+    image = Image.fromarray(palette.astype(np.uint8)[index], 'RGB')
+    if alpha is not None:
+        image = image.convert('RGBA')
+        image.putalpha(alpha)
+    return image
+
+
+def process_image_ordered_dither(image, num_colors):
+    """Bayer-dither the image onto an adaptive palette of ``num_colors`` colors.
+
+    Every pixel is nudged by its 8x8 threshold (scaled to the spacing of the
+    palette colors) and mapped to the nearest color, all in one array pass.
+    """
+    rgb_image, alpha = _split_alpha(image)
+    rgb = np.asarray(rgb_image, dtype=np.float32)
+    palette = _adaptive_palette(rgb_image, num_colors)
+    h, w = rgb.shape[:2]
+
+    # typical distance between neighbouring palette colors, per channel
+    if len(palette) > 1:
+        gaps = np.sqrt(((palette[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2))
+        np.fill_diagonal(gaps, np.inf)
+        spread = float(gaps.min(axis=1).mean()) / np.sqrt(3.0)
+    else:
+        spread = 0.0
+    bayer = bayer_matrix(8)
+    threshold = (bayer[np.arange(h)[:, None] % 8, np.arange(w) % 8] + 0.5) / bayer.size - 0.5
+    index = _nearest_color(rgb + (spread * threshold)[..., None].astype(np.float32), palette)
+    print(f'Ordered dithered image to {len(palette)} colors')
+    return _palette_image(palette, index, alpha)
+
+
+def error_diffusion(rgb, palette, kernel, opaque=None):
+    """Error-diffuse an (h, w, 3) array onto ``palette``; returns the (h, w) color indices.
+
+    A pixel only depends on pixels up to two columns to its left in its own
+    row and on earlier rows, so all pixels with the same ``x + 2 * y`` can be
+    quantized together: the image is swept in w + 2h such anti-diagonal
+    slices, giving exactly the sequential result.  ``opaque`` (bool, h x w)
+    keeps transparent pixels from spreading error.
+    """
+    h, w = rgb.shape[:2]
+    # padded so every kernel tap lands inside: 2 columns each side, 2 rows below
+    pw = w + 4
+    work = np.zeros(((h + 2) * pw, 3), dtype=np.float32)
+    work.reshape(h + 2, pw, 3)[:h, 2:w + 2] = rgb
+    taps = [(dy * pw + dx, np.float32(weight)) for dy, dx, weight in kernel]
+    transparent = None if opaque is None else ~np.asarray(opaque).ravel()
+    index = np.zeros(h * w, dtype=np.intp)
+    for t in range(w + 2 * (h - 1)):
+        ys = np.arange(max(0, (t - w + 2) // 2), min(h - 1, t // 2) + 1)
+        xs = t - 2 * ys
+        cells = ys * pw + xs + 2
+        values = np.clip(work[cells], 0.0, 255.0)
+        nearest = _nearest_color(values, palette)
+        pixels = ys * w + xs
+        index[pixels] = nearest
+        error = values - palette[nearest]
+        if transparent is not None:
+            error[transparent[pixels]] = 0.0
+        for offset, weight in taps:
+            work[cells + offset] += error * weight
+    index = index.reshape(h, w)
+    return index
+
+
+def _diffuse_image(image, num_colors, kernel, name):
+    rgb_image, alpha = _split_alpha(image)
+    palette = _adaptive_palette(rgb_image, num_colors)
+    opaque = None if alpha is None else np.asarray(alpha) > 0
+    index = error_diffusion(np.asarray(rgb_image), palette, kernel, opaque)
+    print(f'{name} dithered image to {len(palette)} colors')
+    return _palette_image(palette, index, alpha)
+
+
+def process_image_floyd_steinberg(image, num_colors):
+    return _diffuse_image(image, num_colors, FLOYD_STEINBERG, 'Floyd-Steinberg')
+
+
+def process_image_atkinson(image, num_colors):
+    return _diffuse_image(image, num_colors, ATKINSON, 'Atkinson')
+
+
+def process_image_rgb_scatter_nxn(original_img, n, seed=0):
+    """Expand every pixel into an n x n block of scattered red, green and blue sub-pixels.
+
+    Each channel gets ``max(1, int(value / 255 * n*n / 3))`` sub-pixels (at
+    most n*n in total, red first, then green, then blue) at random places in
+    the block; the rest stays background.  The places come from one random
+    permutation per block, drawn from ``seed`` so the same image always gives
+    the same result.
+    """
+    print(f'Processing RGB Scatter {n}x{n}')
+    # Preserve alpha channel if present
+    has_alpha = original_img.mode in ('RGBA', 'LA')
+    if has_alpha:
+        original_img = original_img.convert('RGBA')
+    else:
+        original_img = original_img.convert('RGB')
+    pixels = np.asarray(original_img)
+    height, width = pixels.shape[:2]
+    cells = n * n
+
+    # sub-pixel counts per channel, and where each channel's run ends
+    counts = np.maximum(1, (pixels[..., :3] / 255.0 * (cells / 3)).astype(np.int64))
+    ends = np.minimum(np.cumsum(counts, axis=-1), cells)
+
+    # slot k of a block gets red, green, blue or nothing depending on the runs;
+    # transparent pixels get nothing at all
+    slot = np.arange(cells)
+    codes = 1 + (slot >= ends[..., 0:1]).astype(np.uint8) + (slot >= ends[..., 1:2])
+    codes[slot >= ends[..., 2:3]] = 0
+    if has_alpha:
+        codes[pixels[..., 3] == 0] = 0
+
+    # scatter the slots over the block positions, block position p = i * n + j
+    # being sub-pixel (x * n + i, y * n + j)
+    rng = np.random.default_rng(seed)
+    order = rng.permuted(np.broadcast_to(np.arange(cells, dtype=np.int32), codes.shape), axis=-1)
+    blocks = np.empty_like(codes)
+    np.put_along_axis(blocks, order, codes, axis=-1)
+    blocks = blocks.reshape(height, width, n, n).transpose(0, 3, 1, 2).reshape(height * n, width * n)
+
+    if has_alpha:
+        colors = np.array([(255, 255, 255, 0), (255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)], dtype=np.uint8)
+        return Image.fromarray(colors[blocks], 'RGBA')
+    colors = np.array([(255, 255, 255), (255, 0, 0), (0, 255, 0), (0, 0, 255)], dtype=np.uint8)
+    return Image.fromarray(colors[blocks], 'RGB')
+
+
+def process_image_with_dynamic_base_colors_nxn(original_img, n_base_colors, n, seed=0):
+    """Expand every pixel into an n x n block mixed from ``n_base_colors`` K-means colors.
+
+    Each base color gets a share of the block by inverse distance to the
+    pixel's color; translucent pixels fill fewer sub-pixels.  The sub-pixels
+    are scattered over the block by a per-block permutation drawn from ``seed``.
+    """
+    print(f'Processing Dynamic Scatter {n}x{n}')
+    # Imported here so the other color modes work without scikit-learn
+    from sklearn.cluster import KMeans
+
+    # Preserve alpha channel if present
+    has_alpha = original_img.mode in ('RGBA', 'LA')
+    if has_alpha:
+        original_img = original_img.convert('RGBA')
+    else:
+        original_img = original_img.convert('RGB')
+    width, height = original_img.size
+
+    # The new image is n times the width and height
+    new_width = width * n
+    new_height = height * n
+
+    # Extract pixels from the original image for color clustering
+    pixels = np.array(original_img)
+    if has_alpha:
+        # Exclude transparent pixels
+        mask = pixels[:, :, 3] > 0
+        pixels_rgb = pixels[:, :, :3][mask]
+    else:
+        pixels_rgb = pixels.reshape(-1, 3)
+
+    # Step 1: Use K-means to find the base colors
+    kmeans = KMeans(n_clusters=n_base_colors, random_state=42)
+    kmeans.fit(pixels_rgb)
+    base_colors_rgb = kmeans.cluster_centers_.astype(int)
+    base_colors_rgb = [tuple(color) for color in base_colors_rgb]
+
+    # Step 2: inverse-distance share of every base color, for all pixels at once
+    pixels = pixels.astype(np.float64)
+    base = np.array(base_colors_rgb, dtype=np.float64)
+    distances = np.sqrt(((pixels[:, :, None, :3] - base[None, None, :, :]) ** 2).sum(axis=-1))
+    contributions = 1 / (distances + 1e-5)  # Inverse distance weighting
+    contributions /= contributions.sum(axis=-1, keepdims=True)  # Normalize to sum to 1
+
+    # Step 3: sub-pixels per block (fewer for translucent pixels), split over
+    # the base colors with largest-remainder rounding so they add up exactly
+    cells = n * n
+    if has_alpha:
+        totals = np.round(cells * (pixels[:, :, 3] / 255.0)).astype(np.int64)
+    else:
+        totals = np.full(pixels.shape[:2], cells, dtype=np.int64)
+    quotas = contributions * totals[..., None]
+    pixel_counts = np.floor(quotas).astype(np.int64)
+    shortfall = totals - pixel_counts.sum(axis=-1)
+    by_remainder = np.argsort(-(quotas - pixel_counts), axis=-1, kind='stable')
+    rank = np.empty_like(by_remainder)
+    np.put_along_axis(rank, by_remainder, np.arange(len(base_colors_rgb)), axis=-1)
+    pixel_counts += rank < shortfall[..., None]
+
+    # Step 4: slot k of a block gets base color i when it falls in color i's
+    # run, nothing past the block's total; then the slots are shuffled per
+    # block (position p = i * n + j is sub-pixel (x * n + i, y * n + j))
+    ends = np.cumsum(pixel_counts, axis=-1)
+    slot = np.arange(cells)
+    codes = 1 + (slot[None, None, None, :] >= ends[..., None]).sum(axis=2)
+    codes[slot >= totals[..., None]] = 0
+    rng = np.random.default_rng(seed)
+    order = rng.permuted(np.broadcast_to(np.arange(cells, dtype=np.int32), codes.shape), axis=-1)
+    blocks = np.empty_like(codes)
+    np.put_along_axis(blocks, order, codes, axis=-1)
+    blocks = blocks.reshape(height, width, n, n).transpose(0, 3, 1, 2).reshape(new_height, new_width)
+
+    if has_alpha:
+        background = (255, 255, 255, 0)
+        colors = np.array([background] + [(*color, 255) for color in base_colors_rgb], dtype=np.uint8)
+        return Image.fromarray(colors[blocks], 'RGBA')
+    colors = np.array([(255, 255, 255)] + base_colors_rgb, dtype=np.uint8)
+    return Image.fromarray(colors[blocks], 'RGB')
+
+
+# 3x3 stacking: a channel value of 0-85, 86-172 or 173-255 becomes a column
+# of 1, 2 or 3 sub-pixels of that channel's color in the pixel's 3x3 block.
+STACK_LEVELS = [86, 173]
+
+
+def stack_3x3(levels, colors, background, paint=None):
+    """Build the 3x3 stacked image array from per-pixel channel levels.
+
+    ``levels`` is (h, w, 3) in 1..3; column c of every block gets the top
+    ``levels[..., c]`` sub-pixels in ``colors[c]`` (an (h, w, channels) array
+    or a plain color) and the rest ``background``.  Blocks where ``paint`` is
+    False stay background.
+    """
+    height, width = levels.shape[:2]
+    # filled[y, i, x, c]: sub-pixel row i of column c in the block of pixel (x, y)
+    filled = levels[:, None, :, :] > np.arange(3)[None, :, None, None]
+    if paint is not None:
+        filled &= paint[:, None, :, None]
+    colors = np.broadcast_to(np.asarray(colors, dtype=np.uint8), (height, width, 3, len(background)))
+    out = np.empty((height, 3, width, 3, len(background)), dtype=np.uint8)
+    out[...] = np.asarray(background, dtype=np.uint8)
+    out[filled] = np.broadcast_to(colors[:, None, :, :, :], out.shape)[filled]
+    return out.reshape(height * 3, width * 3, len(background))
+
+
+def process_image_rgb(original_img):
+    # Preserve alpha channel if present
+    has_alpha = original_img.mode in ('RGBA', 'LA')
+    if has_alpha:
+        original_img = original_img.convert('RGBA')
+    else:
+        original_img = original_img.convert('RGB')
+    pixels = np.asarray(original_img)
+
+    # red, green and blue columns, each stacked 1-3 sub-pixels high
+    levels = np.digitize(pixels[..., :3], STACK_LEVELS) + 1
+    if has_alpha:
+        colors = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)]
+        out = stack_3x3(levels, colors, (0, 0, 0, 0), paint=pixels[..., 3] > 0)
+        return Image.fromarray(out, 'RGBA')
+    out = stack_3x3(levels, [(255, 0, 0), (0, 255, 0), (0, 0, 255)], (0, 0, 0))
+    return Image.fromarray(out, 'RGB')
+
+
+def process_image_cmy(original_img):
+    # Preserve alpha channel if present
+    has_alpha = original_img.mode in ('RGBA', 'LA')
+    if has_alpha:
+        # CMYK does not support alpha, so we need to separate it
+        alpha = np.asarray(original_img.split()[-1])
+    original_img = original_img.convert('CMYK')
+    cmyk = np.asarray(original_img).astype(np.int64)
+
+    # Adjust CMY values by combining with K (black) component, then stack
+    # cyan, magenta and yellow columns 1-3 sub-pixels high
+    cmy = np.minimum(255, cmyk[..., :3] + cmyk[..., 3:4])
+    levels = np.digitize(cmy, STACK_LEVELS) + 1
+    if has_alpha:
+        # placed sub-pixels keep the source pixel's alpha
+        colors = np.empty(alpha.shape + (3, 4), dtype=np.uint8)
+        colors[..., :3] = [(0, 255, 255), (255, 0, 255), (255, 255, 0)]
+        colors[..., 3] = alpha[..., None]
+        out = stack_3x3(levels, colors, (0, 0, 0, 0), paint=alpha > 0)
+        return Image.fromarray(out, 'RGBA')
+    out = stack_3x3(levels, [(0, 255, 255), (255, 0, 255), (255, 255, 0)], (0, 0, 0))
+    return Image.fromarray(out, 'RGB')
+
+
+# color mode name -> (stage function, names of the parameters it takes)
+COLOR_MODES = {
+    'RGB': (process_image_rgb, ()),
+    'CMYK': (process_image_cmy, ()),
+    'Simplify Image': (simplify_image_pillow, ('num_colors',)),
+    'Exact Color Match': (exact_color_match, ()),
+    'Ordered Dither': (process_image_ordered_dither, ('num_colors',)),
+    'Floyd-Steinberg Dither': (process_image_floyd_steinberg, ('num_colors',)),
+    'Atkinson Dither': (process_image_atkinson, ('num_colors',)),
+    'RGB Scatter NxN': (process_image_rgb_scatter_nxn, ('n', 'seed')),
+    'Dynamic Scatter NxN': (process_image_with_dynamic_base_colors_nxn, ('n_base_colors', 'n', 'seed')),
+}
+
+
+class ImagePipeline:
+    """Source file -> resized image -> color-mode image, kept in memory.
+
+    ``run`` returns the processed PIL image that the color window and the
+    slicers consume directly.  With an ``image_cache.ImageStageCache`` the
+    resize and color-mode results are looked up by content key first.  When
+    ``dump_dir`` is set the intermediate images are also written there as
+    temp.png and processed_image_path.png for debugging.
+    """
+
+    def __init__(self, file_path, width, color_mode, number_of_colors=2, n_value=3, cache=None, dump_dir=None,
+                 seed=0):
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unsupported color mode selected: {color_mode}")
+        self.file_path = file_path
+        self.width = width
+        self.color_mode = color_mode
+        self.cache = cache
+        self.dump_dir = dump_dir
+        stage_fn, param_names = COLOR_MODES[color_mode]
+        all_params = {"num_colors": number_of_colors, "n": n_value, "n_base_colors": number_of_colors, "seed": seed}
+        self.color_stage = stage_fn
+        self.color_params = {name: all_params[name] for name in param_names}
+        self.reduced = None
+        self.processed = None
+
+    def _keys(self):
+        source_key = self.cache.source_key(self.file_path)
+        if self.color_mode != 'Exact Color Match':
+            resize_key = self.cache.key(source_key, "resize", {"width": self.width})
+        else:
+            resize_key = self.cache.key(source_key, "as-is")
+        return resize_key, self.cache.key(resize_key, self.color_mode, self.color_params)
+
+    def _dump(self, img, name):
+        if self.dump_dir is not None:
+            path = os.path.join(self.dump_dir, name)
+            img.save(path)
+            print(f"Debug image saved as {path}")
+
+    def run(self):
+        instrumentation.reset(instrumentation.IMAGE_STAGES)
+        resize_key = color_key = None
+        if self.cache is not None:
+            resize_key, color_key = self._keys()
+            cached = self.cache.load_image(color_key)
+            if cached is not None:
+                print(f"Using cached {self.color_mode} image; skipping resize and color processing.")
+                self.processed = cached
+                self._dump(self.processed, "processed_image_path.png")
+                return self.processed
+
+        with instrumentation.span("resize"):
+            if self.color_mode == 'Exact Color Match':
+                # Exact Color Match uses the image as-is
+                self.reduced = load_as_is(self.file_path)
+            else:
+                self.reduced = self.cache.load_image(resize_key) if self.cache is not None else None
+                if self.reduced is not None:
+                    print("Using cached resized image.")
+                else:
+                    self.reduced = resize_image(load_source(self.file_path), self.width)
+                    if self.cache is not None:
+                        self.cache.store_image(resize_key, self.reduced)
+        self._dump(self.reduced, "temp.png")
+
+        with instrumentation.span("quantize"):
+            self.processed = self.color_stage(self.reduced, **self.color_params)
+        if self.cache is not None:
+            self.cache.store_image(color_key, self.processed)
+        self._dump(self.processed, "processed_image_path.png")
+        return self.processed
@@ -0,0 +1,150 @@
+import os
+import time
+from contextlib import contextmanager
+
+
+# Timing spans, counters and a log-level switch shared by the pipeline.
+#
+#   with instrumentation.span("resize"):
+#       ...
+#   instrumentation.count("stripes_rendered")
+#   if instrumentation.debug_enabled():
+#       print(...)  # per-stripe / per-call detail
+#
+# Spans and counters accumulate per process until ``reset``; spans may nest
+# and each is reported with its own total.  ImagePipeline.run and the
+# slicers reset their own stages when they start, so a summary describes
+# the last image and the last slice.  "write" is the time the slicer's
+# GcodeWriter spent flushing, recorded by the slicer when it is done.
+#
+# With the timing_summary setting on, utils.create_text_file reserves a
+# block of blank '//' lines in the gcode header and ``write_summary`` fills
+# it in place once the run is over.  It is off by default so the gcode of
+# a run does not depend on how long the run took.
+# The level also goes into MURAL_LOG_LEVEL so slicing worker processes pick
+# it up.
+
+SILENT = 0
+INFO = 1
+DEBUG = 2
+
+LEVELS = {"silent": SILENT, "info": INFO, "debug": DEBUG}
+
+_level = LEVELS.get(os.environ.get("MURAL_LOG_LEVEL", "info").lower(), INFO)
+_spans = {}     # name -> [total seconds, calls]
+_counters = {}  # name -> total
+
+# Spans and counters owned by the image pipeline and by a slicer call
+IMAGE_STAGES = ("resize", "quantize")
+SLICE_STAGES = ("palette", "slice", "write", "stripes_rendered", "stripes_reused")
+
+# Header block reserved for the summary: a title line and SUMMARY_SLOTS
+# comment lines of SUMMARY_WIDTH characters each
+SUMMARY_TITLE = "// timing summary"
+SUMMARY_SLOTS = 12
+SUMMARY_WIDTH = 64
+
+
+def set_log_level(level):
+    """Set the level by name ("silent", "info", "debug") or number."""
+    global _level
+    if isinstance(level, str):
+        if level.lower() not in LEVELS:
+            raise ValueError(f"Unknown log level {level!r}; use one of {', '.join(LEVELS)}")
+        level = LEVELS[level.lower()]
+    _level = level
+    for name, value in LEVELS.items():
+        if value == level:
+            os.environ["MURAL_LOG_LEVEL"] = name
+
+
+def debug_enabled():
+    return _level >= DEBUG
+
+
+def info_enabled():
+    return _level >= INFO
+
+
+def reset(names=None):
+    """Clear every span and counter, or only those in ``names``."""
+    if names is None:
+        _spans.clear()
+        _counters.clear()
+        return
+    for name in names:
+        _spans.pop(name, None)
+        _counters.pop(name, None)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block and add it to the ``name`` total."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record(name, seconds, calls=1):
+    """Add time measured elsewhere (e.g. a GcodeWriter's flushes) to ``name``."""
+    entry = _spans.setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += calls
+
+
+def count(name, amount=1):
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def counted(name, items):
+    """Pass ``items`` through, counting each one under ``name``."""
+    for item in items:
+        _counters[name] = _counters.get(name, 0) + 1
+        yield item
+
+
+def summary_lines():
+    lines = []
+    for name, (seconds, calls) in _spans.items():
+        suffix = f" ({calls} calls)" if calls > 1 else ""
+        lines.append(f"{name:<12} {seconds:10.3f} s{suffix}")
+    for name, total in _counters.items():
+        lines.append(f"{name:<12} {total:>10}")
+    return lines
+
+
+def print_summary():
+    if info_enabled():
+        print("=== timing summary ===")
+        for line in summary_lines():
+            print(line)
+
+
+def summary_placeholder():
+    """Header lines that reserve room for ``write_summary``."""
+    return [SUMMARY_TITLE] + ["//".ljust(SUMMARY_WIDTH)] * SUMMARY_SLOTS
+
+
+def write_summary(gcode_filepath):
+    """Fill the block reserved by ``summary_placeholder`` with the summary.
+
+    The block is overwritten in place with lines of the same length, so the
+    rest of the file is not touched.  Does nothing if the file has no
+    reserved block (timing_summary was off when it was created).
+    """
+    newline = os.linesep.encode('ascii')
+    title = SUMMARY_TITLE.encode('ascii') + newline
+    with open(gcode_filepath, 'r+b') as f:
+        head = f.read(4096)
+        start = head.find(title)
+        if start < 0:
+            return
+        lines = [f"//   {line}" for line in summary_lines()]
+        if len(lines) > SUMMARY_SLOTS:
+            lines = lines[:SUMMARY_SLOTS - 1] + [f"//   ... {len(lines) - SUMMARY_SLOTS + 1} more"]
+        lines += ["//"] * (SUMMARY_SLOTS - len(lines))
+        block = b"".join(line[:SUMMARY_WIDTH].ljust(SUMMARY_WIDTH).encode('ascii') + newline for line in lines)
+        f.seek(start + len(title))
+        f.write(block)
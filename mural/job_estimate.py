@@ -0,0 +1,262 @@
+import argparse
+import sys
+
+import numpy as np
+import binary_gcode
+import firmware
+import kinematics
+import stripe_engine
+
+
+# Job duration and travel estimate for a gcode file.
+#
+# Every stripe is modelled the way parser.cpp runs it:
+#   reposition  move_to_position_blocking to the starting pulley values.  Each
+#               motor runs its own AccelStepper trapezoid and the move blocks
+#               until both are done, so it takes the slower motor's time.
+#   settle      delay(2000), then pauseAtTheTop
+#   paint       drop / (stripeVelocity * stripeVelocityMultiplier)
+#   post        delay(100) after the stripe in run mode
+# A COLOR_CHANGE ("change color to:" line) stops run mode until the operator
+# restarts it; that wait is not a firmware value, so it is a parameter.
+#
+# The robot is assumed to start at the first stripe's starting position.  The
+# stripe arrays are evaluated in one go, so ``estimate_stripes`` is cheap
+# enough to call for every combination of a parameter sweep.
+#
+#   python job_estimate.py gcode.txt [--stripes] [--color-change-s 120]
+
+# Operator time to swap paint and restart after a COLOR_CHANGE, in seconds.
+COLOR_CHANGE_SECONDS = 120.0
+
+_STRIPE = "STRIPE - column #"
+_DROP = "drop: "
+_PULLEY = "starting pulley values:  "
+_PATTERN = "pattern: "
+_SPACING = "pulley spacing = "
+_CHANGE_COLOR = "change color to:"
+
+
+def trapezoid_move_seconds(distance, acceleration, max_speed):
+    """Time for rest-to-rest moves of ``distance`` with a trapezoidal profile.
+
+    Accepts scalars or arrays; units only have to agree (steps or meters).
+    """
+    distance = np.abs(np.asarray(distance, dtype=np.float64))
+    ramp = max_speed * max_speed / acceleration  # distance to reach and leave max_speed
+    short = 2.0 * np.sqrt(distance / acceleration)
+    long = 2.0 * max_speed / acceleration + (distance - ramp) / max_speed
+    seconds = np.where(distance < ramp, short, long)
+    return float(seconds) if seconds.ndim == 0 else seconds
+
+
+def read_stripes(gcode_filepath):
+    """Pull what the estimate needs out of a text or binary gcode file.
+
+    Returns a dict with ``pulley_spacing`` (None when the header lacks it)
+    and per-stripe arrays ``column``, ``start_a``, ``start_b``, ``drop``,
+    ``rows`` (pattern rows), ``reverse`` and ``color_change`` (True when a COLOR_CHANGE comes right
+    before the stripe).  ``color_changes`` counts every COLOR_CHANGE line,
+    including trailing ones with no stripe after them.
+    """
+    pulley_spacing = None
+    columns, start_a, start_b, drops, rows, reverse, changes = [], [], [], [], [], [], []
+    pending_change = False
+    color_changes = 0
+    for line in iter_gcode_lines(gcode_filepath):
+        if line.startswith(_STRIPE):
+            name = line[len(_STRIPE):].strip()
+            columns.append(int(name.split()[0]))
+            reverse.append(line.rstrip().endswith(stripe_engine.REVERSE_SUFFIX))
+            changes.append(pending_change)
+            pending_change = False
+        elif line.startswith(_PATTERN):
+            # every row is one quoted string
+            rows.append(line.count('"') // 2)
+        elif line.startswith(_DROP):
+            drops.append(float(line[len(_DROP):]))
+        elif line.startswith(_PULLEY):
+            la, lb = line[len(_PULLEY):].split(",")
+            start_a.append(float(la))
+            start_b.append(float(lb))
+        elif line.startswith(_CHANGE_COLOR):
+            pending_change = True
+            color_changes += 1
+        elif line.startswith(_SPACING):
+            pulley_spacing = float(line[len(_SPACING):])
+    if not (len(columns) == len(drops) == len(start_a) == len(rows)):
+        raise ValueError(f"{gcode_filepath}: incomplete STRIPE blocks "
+                         f"({len(columns)} headers, {len(drops)} drops, {len(start_a)} pulley lines)")
+    return {
+        "pulley_spacing": pulley_spacing,
+        "column": np.array(columns, dtype=np.int64),
+        "start_a": np.array(start_a, dtype=np.float64),
+        "start_b": np.array(start_b, dtype=np.float64),
+        "drop": np.array(drops, dtype=np.float64),
+        "rows": np.array(rows, dtype=np.int64),
+        "reverse": np.array(reverse, dtype=bool),
+        "color_change": np.array(changes, dtype=bool),
+        "color_changes": color_changes,
+    }
+
+
+def iter_gcode_lines(gcode_filepath):
+    """Lines of a text or binary gcode file (binary files are expanded back to text)."""
+    if binary_gcode.is_binary_gcode(gcode_filepath):
+        with binary_gcode.BinaryGcodeReader(gcode_filepath) as reader:
+            for chunk in reader.iter_text():
+                yield from chunk.splitlines()
+    else:
+        with open(gcode_filepath, 'r') as f:
+            yield from f
+
+
+def layout_stripes(geometry, h, layout, num_nozzles):
+    """Stripe arrays for a ``stripe_engine.stripe_layout`` without rendering any gcode.
+
+    Returns ``(start_a, start_b, drop, reverse)`` for the written stripes, the
+    values the slicers would put in the STRIPE blocks (before rounding).
+    """
+    columns = np.array([c for c, span in enumerate(layout) if span is not None], dtype=np.int64)
+    spans = np.array([span for span in layout if span is not None], dtype=np.int64).reshape(-1, 3)
+    first, last, reverse = spans[:, 0], spans[:, 1], spans[:, 2].astype(bool)
+    row_count = last - first + 1
+    top_y = h - first
+    start_y = np.where(reverse, top_y - row_count, top_y)
+    start_x = columns * num_nozzles + num_nozzles // 2
+    start_a, start_b = geometry.lengths(start_x, start_y)
+    return start_a, start_b, geometry.pixel_size * row_count, reverse
+
+
+def estimate_stripes(start_a, start_b, drop, cable_sepperation, reverse=None, color_change=None,
+                     start_lengths=None, acceleration_multiplier=1.0, max_speed_multiplier=1.0,
+                     stripe_velocity_multiplier=1.0, pause_at_top_ms=firmware.PAUSE_AT_THE_TOP_MS,
+                     color_change_seconds=COLOR_CHANGE_SECONDS):
+    """Per-stripe times and cable travel for stripes given as arrays.
+
+    ``start_a`` / ``start_b`` are the starting pulley values and ``drop`` the
+    stripe lengths, all in meters; ``reverse`` marks stripes painted upwards
+    and ``color_change`` stripes preceded by a COLOR_CHANGE.  The robot
+    starts at ``start_lengths`` (default: the first stripe's start).
+
+    Returns a dict of per-stripe arrays (``reposition_s``, ``wait_s``,
+    ``paint_s``, ``total_s``, ``travel_a_m``, ``travel_b_m``).
+    """
+    start_a = np.asarray(start_a, dtype=np.float64)
+    start_b = np.asarray(start_b, dtype=np.float64)
+    drop = np.broadcast_to(np.asarray(drop, dtype=np.float64), start_a.shape)
+    n = start_a.shape[0]
+    reverse = np.zeros(n, dtype=bool) if reverse is None else np.asarray(reverse, dtype=bool)
+    color_change = np.zeros(n, dtype=bool) if color_change is None else np.asarray(color_change, dtype=bool)
+
+    # a reversed stripe climbs, so its end is ``drop`` above the start
+    end_a, end_b = kinematics.stripe_end_lengths(start_a, start_b, np.where(reverse, -drop, drop),
+                                                 cable_sepperation)
+    if start_lengths is None:
+        start_lengths = (start_a[:1], start_b[:1])
+    from_a = np.concatenate([np.atleast_1d(start_lengths[0]), end_a[:-1]])[:n]
+    from_b = np.concatenate([np.atleast_1d(start_lengths[1]), end_b[:-1]])[:n]
+    travel_a = np.abs(start_a - from_a)
+    travel_b = np.abs(start_b - from_b)
+
+    acceleration = firmware.BASE_ACCELERATION * acceleration_multiplier
+    max_speed = firmware.BASE_MAX_SPEED * max_speed_multiplier
+    reposition = np.maximum(
+        trapezoid_move_seconds(travel_a * firmware.STEPS_PER_METER, acceleration, max_speed),
+        trapezoid_move_seconds(travel_b * firmware.STEPS_PER_METER, acceleration, max_speed),
+    )
+    wait = ((firmware.SETTLE_DELAY_MS + pause_at_top_ms + firmware.POST_STRIPE_DELAY_MS) / 1000.0
+            + np.where(color_change, color_change_seconds, 0.0))
+    paint = drop / (firmware.STRIPE_VELOCITY * stripe_velocity_multiplier)
+    return {
+        "reposition_s": reposition,
+        "wait_s": wait,
+        "paint_s": paint,
+        "total_s": reposition + wait + paint,
+        "travel_a_m": travel_a,
+        "travel_b_m": travel_b,
+    }
+
+
+def summarize(per_stripe, drop, extra_wait_s=0.0):
+    """Totals over ``estimate_stripes`` output; ``extra_wait_s`` is added to the waits."""
+    return {
+        "stripes": int(per_stripe["total_s"].shape[0]),
+        "total_s": float(per_stripe["total_s"].sum()) + extra_wait_s,
+        "reposition_s": float(per_stripe["reposition_s"].sum()),
+        "wait_s": float(per_stripe["wait_s"].sum()) + extra_wait_s,
+        "paint_s": float(per_stripe["paint_s"].sum()),
+        "paint_m": float(np.sum(drop)),
+        "travel_m": float(per_stripe["travel_a_m"].sum() + per_stripe["travel_b_m"].sum()),
+    }
+
+
+def estimate_file(gcode_filepath, cable_sepperation=None, **kwargs):
+    """Read a gcode file and estimate it; returns (stripes dict, per-stripe dict, summary dict).
+
+    ``cable_sepperation`` defaults to the file's "pulley spacing" header.
+    Remaining keyword arguments go to ``estimate_stripes``.
+    """
+    stripes = read_stripes(gcode_filepath)
+    if cable_sepperation is None:
+        cable_sepperation = stripes["pulley_spacing"]
+    if cable_sepperation is None:
+        raise ValueError(f"{gcode_filepath} has no 'pulley spacing' line; pass cable_sepperation")
+    per_stripe = estimate_stripes(stripes["start_a"], stripes["start_b"], stripes["drop"], cable_sepperation,
+                                  reverse=stripes["reverse"], color_change=stripes["color_change"], **kwargs)
+    # a COLOR_CHANGE with no stripe after it still stops the robot
+    trailing = stripes["color_changes"] - int(np.count_nonzero(stripes["color_change"]))
+    summary = summarize(per_stripe, stripes["drop"],
+                        trailing * kwargs.get("color_change_seconds", COLOR_CHANGE_SECONDS))
+    summary["color_changes"] = stripes["color_changes"]
+    return stripes, per_stripe, summary
+
+
+def print_report(summary, per_stripe=None, stripes=None):
+    minutes = summary["total_s"] / 60.0
+    print(f"Stripes: {summary['stripes']}, color changes: {summary.get('color_changes', 0)}")
+    print(f"Estimated job time: {summary['total_s']:.0f} s ({minutes:.1f} min)")
+    print(f"  repositioning {summary['reposition_s']:>10.1f} s")
+    print(f"  painting      {summary['paint_s']:>10.1f} s  ({summary['paint_m']:.2f} m of stripes)")
+    print(f"  waiting       {summary['wait_s']:>10.1f} s")
+    print(f"Repositioning cable travel: {summary['travel_m']:.2f} m")
+    if per_stripe is None:
+        return
+    print(f"{'#':>5} {'column':>6} {'dir':>4} {'move s':>8} {'wait s':>8} {'paint s':>8} {'total s':>8}")
+    for i in range(summary["stripes"]):
+        direction = "up" if stripes["reverse"][i] else "down"
+        print(f"{i + 1:>5} {stripes['column'][i]:>6} {direction:>4} {per_stripe['reposition_s'][i]:>8.2f} "
+              f"{per_stripe['wait_s'][i]:>8.2f} {per_stripe['paint_s'][i]:>8.2f} {per_stripe['total_s'][i]:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate how long the robot takes to paint a gcode file.")
+    parser.add_argument("gcode", help="text or binary gcode file")
+    parser.add_argument("--stripes", action="store_true", help="also print the per-stripe times")
+    parser.add_argument("--pulley-spacing", type=float, help="cable separation in meters (default: from the file)")
+    parser.add_argument("--color-change-s", type=float, default=COLOR_CHANGE_SECONDS,
+                        help="operator pause per COLOR_CHANGE in seconds")
+    parser.add_argument("--pause-at-top-ms", type=float, default=firmware.PAUSE_AT_THE_TOP_MS)
+    parser.add_argument("--acceleration-multiplier", type=float, default=1.0)
+    parser.add_argument("--max-speed-multiplier", type=float, default=1.0)
+    parser.add_argument("--stripe-velocity-multiplier", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    try:
+        stripes, per_stripe, summary = estimate_file(
+            args.gcode, args.pulley_spacing,
+            acceleration_multiplier=args.acceleration_multiplier,
+            max_speed_multiplier=args.max_speed_multiplier,
+            stripe_velocity_multiplier=args.stripe_velocity_multiplier,
+            pause_at_top_ms=args.pause_at_top_ms,
+            color_change_seconds=args.color_change_s,
+        )
+    except Exception as e:
+        print(f"Could not estimate {args.gcode}: {e}")
+        return 1
+    print_report(summary, per_stripe if args.stripes else None, stripes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
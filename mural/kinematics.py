@@ -0,0 +1,187 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+# Cable kinematics of the two-pulley rig, array in / array out.
+#
+# Two frames are used:
+#   pixel frame  -- mural pixels, x to the right, y up from the bottom row
+#                   (the frame of utils.length_a / length_b and the gcode)
+#   pulley frame -- meters, origin at pulley A, x towards pulley B, y down
+#                   (the frame of movement.cpp)
+# A cable length is the distance from a pulley to a point in the pulley frame.
+#
+# ``lengths`` evaluates in the same operation order as utils.length_a/length_b
+# (squares by multiplication, not pow), so it gives bit-identical results and
+# can replace the scalar calls.  Every function accepts scalars or arrays and
+# broadcasts.
+
+
+class PulleyGeometry:
+    """Immutable rig and mural geometry with the derived terms precomputed.
+
+    ``width`` is the mural width in pixels (the slicers pass the image
+    width); the remaining values are in meters as in settings.json.
+    """
+
+    __slots__ = (
+        "pixel_size", "dist_from_pulley", "cable_sepperation", "width", "offset", "x_origin",
+    )
+
+    def __init__(self, pixel_size, dist_from_pulley, cable_sepperation, width, offset=0.0):
+        set_ = object.__setattr__
+        set_(self, "pixel_size", pixel_size)
+        set_(self, "dist_from_pulley", dist_from_pulley)
+        set_(self, "cable_sepperation", cable_sepperation)
+        set_(self, "width", width)
+        set_(self, "offset", offset)
+        # left edge of the mural measured from pulley A, before the offset
+        set_(self, "x_origin", (cable_sepperation / 2) - ((width * pixel_size) / 2))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return (f"PulleyGeometry(pixel_size={self.pixel_size}, dist_from_pulley={self.dist_from_pulley}, "
+                f"cable_sepperation={self.cable_sepperation}, width={self.width}, offset={self.offset})")
+
+    def __eq__(self, other):
+        return isinstance(other, PulleyGeometry) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return (self.pixel_size, self.dist_from_pulley, self.cable_sepperation, self.width, self.offset)
+
+    @classmethod
+    def from_settings(cls, settings, width=None):
+        """Geometry from a settings dict; ``width`` overrides settings["width"]."""
+        return cls(settings["pixel_size"], settings["dist_from_pulley"], settings["cable_sepperation"],
+                   settings["width"] if width is None else width, settings["offset"])
+
+    # pixel frame <-> pulley frame
+
+    def to_pulley_frame(self, x, y):
+        """Pixel coordinates -> (x, y) in meters from pulley A, y down."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        return self.x_origin + x * self.pixel_size + self.offset, self.dist_from_pulley - y * self.pixel_size
+
+    def to_pixel_frame(self, px, py):
+        """Pulley-frame meters -> fractional pixel coordinates."""
+        px = np.asarray(px, dtype=np.float64)
+        py = np.asarray(py, dtype=np.float64)
+        return (px - self.offset - self.x_origin) / self.pixel_size, (self.dist_from_pulley - py) / self.pixel_size
+
+    # forward / inverse
+
+    def lengths(self, x, y):
+        """Cable lengths (A, B) for pixel coordinates, matching utils.length_a/length_b."""
+        x_horizontal, y_component = self.to_pulley_frame(x, y)
+        y_sq = y_component * y_component
+        x_horizontal_b = self.cable_sepperation - x_horizontal
+        length_a = np.sqrt(y_sq + x_horizontal * x_horizontal)
+        length_b = np.sqrt(y_sq + x_horizontal_b * x_horizontal_b)
+        return length_a, length_b
+
+    def pulley_position(self, length_a, length_b):
+        """Cable lengths -> (x, y) in the pulley frame (movement.cpp's xPosition/yPosition)."""
+        return position_from_lengths(length_a, length_b, self.cable_sepperation)
+
+    def pixel_position(self, length_a, length_b):
+        """Cable lengths -> fractional pixel coordinates."""
+        return self.to_pixel_frame(*self.pulley_position(length_a, length_b))
+
+    def stripe_end_lengths(self, start_a, start_b, drop):
+        return stripe_end_lengths(start_a, start_b, drop, self.cable_sepperation)
+
+    def cable_velocities(self, length_a, length_b, vx, vy, dt=None):
+        return cable_velocities(length_a, length_b, vx, vy, self.cable_sepperation, dt)
+
+
+def position_from_lengths(length_a, length_b, cable_sepperation):
+    """Cable lengths -> (x, y) in the pulley frame.
+
+    Points above the pulley line (no real solution) come out as NaN.
+    """
+    a_sq = np.asarray(length_a, dtype=np.float64) ** 2
+    b_sq = np.asarray(length_b, dtype=np.float64) ** 2
+    x = (a_sq - b_sq + cable_sepperation * cable_sepperation) / (2.0 * cable_sepperation)
+    with np.errstate(invalid='ignore'):
+        y = np.sqrt(a_sq - x * x)
+    return x, y
+
+
+def stripe_end_lengths(start_a, start_b, drop, cable_sepperation):
+    """Cable lengths after a stripe moves straight down by ``drop`` meters.
+
+    This is calculateEndingLengths from movement.cpp without its ``(int)``
+    casts, which truncate (A-B)^2 and (A+B)^2 before they are multiplied.
+    """
+    x, y = position_from_lengths(start_a, start_b, cable_sepperation)
+    y_end = y + drop
+    return np.sqrt(x * x + y_end * y_end), np.sqrt((cable_sepperation - x) ** 2 + y_end * y_end)
+
+
+def cable_velocities(length_a, length_b, vx, vy, cable_sepperation, dt=None):
+    """Cable speeds (dA/dt, dB/dt) for a chassis velocity (vx, vy), y down.
+
+    Without ``dt`` this is the exact derivative.  With ``dt`` it is the
+    forward difference the firmware uses in determineStripeVelocities: the
+    length change to the point reached after ``dt`` seconds, divided by ``dt``.
+    Units follow the inputs (meters or steps, as long as they agree).
+    """
+    length_a = np.asarray(length_a, dtype=np.float64)
+    length_b = np.asarray(length_b, dtype=np.float64)
+    x, y = position_from_lengths(length_a, length_b, cable_sepperation)
+    if dt is None:
+        vel_a = (x * vx + y * vy) / length_a
+        vel_b = ((x - cable_sepperation) * vx + y * vy) / length_b
+        return vel_a, vel_b
+    x_next = x + vx * dt
+    y_next = y + vy * dt
+    vel_a = (np.sqrt(x_next * x_next + y_next * y_next) - length_a) / dt
+    vel_b = (np.sqrt((x_next - cable_sepperation) ** 2 + y_next * y_next) - length_b) / dt
+    return vel_a, vel_b
+
+
+def length_grid(geometry, h, w, dtype=np.float32):
+    """(A, B) cable lengths at the center of every pixel of an ``h`` x ``w`` mural.
+
+    Returns an ``(h, w, 2)`` array indexed like the image (row 0 is the top
+    row): ``grid[row, x]`` holds the lengths at pixel-frame point
+    ``(x + 0.5, h - 1 - row + 0.5)``.  Point mode and the stripe slicers
+    write lengths at the integer pixel coordinates (the pixel's lower left
+    corner), so the grid sits half a pixel right of and above those values.
+    """
+    x = np.arange(w) + 0.5
+    y = (h - 1) - np.arange(h)[:, None] + 0.5
+    length_a, length_b = geometry.lengths(x, y)
+    grid = np.empty((h, w, 2), dtype=dtype)
+    grid[..., 0] = length_a
+    grid[..., 1] = length_b
+    return grid
+
+
+def save_length_grid(path, grid):
+    """Write ``grid`` as a .npy file (temp file + rename, so readers never see a partial grid)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, grid)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_length_grid(path):
+    """Open a saved length grid read-only without loading it into memory."""
+    return np.load(path, mmap_mode='r')
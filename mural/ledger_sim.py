@@ -0,0 +1,251 @@
+import argparse
+import heapq
+import json
+import math
+import sys
+
+import firmware
+import job_estimate
+import stripe_engine
+
+
+# Offline model of the chassis spray loop (pattern_interpreter.cpp).
+#
+# sprayAndStripe hands pattern row k to interpretPattern at
+# (k + 1) * movementTime / rows ms; interpretPattern calls schedulePin for
+# every painted nozzle, which coalesces the fire into a pending entry of the
+# same solenoid less than a pulse width away or puts it in the first free slot
+# of the MAX_LEDGER_SIZE ledger ("Ledger full" when there is none).  The loop
+# fires an entry at its trigger time and frees the slot a pulse width later.
+#
+# The model steps through millis() ticks the way the loop sees them: a row
+# is interpreted on the first tick at or after its trigger time, the ledger
+# scan of a tick runs after the row, and the loop stops on the first tick at
+# or after the movement time -- so the last row never plays and entries due
+# after that never fire.
+#
+# The first chassis only fires '1' nozzles (solenoid i + 1, no delay) of the
+# first 8 characters and skips rows shorter than 4 characters.  The
+# shift-register chassis (chassis platformio 2.0) reads 10 characters into
+# three nozzle blocks: a nozzle of block b fires spacing_b / velocity later,
+# rounded to whole ms, so the block passes over the pixel the row was meant
+# for.  ``block_layout`` describes that.  On "(reverse)" stripes, painted
+# upward, those blocks lead instead and fire the row block 3 reaches
+# spacing_b / velocity later, early by the part of a row interval they are
+# ahead.
+#
+#   python ledger_sim.py gcode.txt [--velocity 0.2 0.3 0.4] [--blocks shift-register]
+
+# pattern character -> (solenoid offset, block spacing in meters)
+CURRENT_BLOCKS = {"1": (0, 0.0)}
+
+
+def block_layout(block1_spacing=firmware.CHASSIS2_BLOCK1_SPACING_M,
+                 block2_spacing=firmware.CHASSIS2_BLOCK2_SPACING_M,
+                 solenoids_per_block=firmware.CHASSIS2_SOLENOIDS_PER_BLOCK):
+    """Character map of the shift-register chassis: '1', '2', '3' -> blocks 1, 2, 3."""
+    return {
+        "1": (0, block1_spacing),
+        "2": (solenoids_per_block, block2_spacing),
+        "3": (2 * solenoids_per_block, 0.0),
+    }
+
+
+def simulate_stripe(patterns, drop, stripe_velocity, blocks=CURRENT_BLOCKS,
+                    ledger_size=firmware.CHASSIS_MAX_LEDGER_SIZE, duration_ms=firmware.CHASSIS_DURATION_MS,
+                    num_solenoids=firmware.CHASSIS_NUM_SOLENOIDS, pattern_width=firmware.CHASSIS_PATTERN_WIDTH,
+                    min_pattern_length=firmware.CHASSIS_MIN_PATTERN_LENGTH, reverse=False):
+    """Run one stripe's patterns through the ledger; returns a dict of counters.
+
+    ``reverse`` is a "(reverse)" stripe painted upward: delayed blocks then
+    lead the reference block and fire the row it reaches spacing / velocity
+    later instead (interpretPattern in chassis platformio 2.0).
+
+    ``fires_lost`` counts the fires that never happen because of the ledger
+    (``dropped`` when it was full plus ``coalesced`` into another fire);
+    ``unfired`` are entries still waiting when the loop stops,
+    ``unplayed_fires`` the painted nozzles of rows no block got to (the loop
+    never reached them, or a leading block had passed them already) and
+    ``short_fires`` those of rows shorter than ``min_pattern_length``, which
+    interpretPattern ignores.
+    ``worst_error_ms`` is the largest difference between a fire and the time
+    the nozzle is over its pixel.
+    """
+    stats = {
+        "patterns": len(patterns), "played": 0, "scheduled": 0, "coalesced": 0, "dropped": 0,
+        "unfired": 0, "unplayed_fires": 0, "short_fires": 0, "peak_ledger": 0, "max_late_ms": 0, "worst_error_ms": 0.0,
+    }
+    if stripe_velocity <= 0 or not patterns:
+        return stats
+    movement_ms = drop / stripe_velocity * 1000.0
+    interval_ms = movement_ms / len(patterns)
+    end_ms = math.ceil(movement_ms)
+    width = int(duration_ms + 0.5)
+    # char -> (solenoid offset, rows ahead, delay rounded to whole ms as schedulePin gets it,
+    #          exact time from the row's trigger to the nozzle being over its pixel)
+    delays = {}
+    for char, (offset, spacing) in blocks.items():
+        travel_ms = spacing / stripe_velocity * 1000.0
+        if reverse and spacing > 0:
+            lead = math.ceil(travel_ms / interval_ms)
+            delays[char] = (offset, lead, int(lead * interval_ms - travel_ms + 0.5), -travel_ms)
+        else:
+            delays[char] = (offset, 0, int(travel_ms + 0.5), travel_ms)
+    painted = sum(1 for pattern in patterns for c in pattern[:pattern_width] if c in delays)
+    handled = 0
+
+    releases = []  # heap of the tick each occupied slot is freed on
+    pending = {}   # solenoid -> trigger times that have not fired yet
+    last_tick = None
+    next_trigger = interval_ms
+    for k in range(len(patterns)):
+        tick = math.ceil(next_trigger)
+        if tick >= end_ms:
+            break
+        # the first row of a tick runs before that tick's ledger scan
+        first_in_tick = tick != last_tick
+        last_tick = tick
+        fired_until = tick - 1 if first_in_tick else tick
+        while releases and releases[0] <= fired_until:
+            heapq.heappop(releases)
+        stats["played"] += 1
+        stats["max_late_ms"] = max(stats["max_late_ms"], int(tick - next_trigger + 0.5))
+
+        # the row each block reads now; the first chassis ignores short rows
+        rows = {}
+        for char, (_, lead, _, _) in delays.items():
+            if k + lead >= len(patterns):
+                continue
+            pattern = patterns[k + lead][:pattern_width]
+            if len(patterns[k + lead]) < min_pattern_length:
+                count = pattern.count(char)
+                stats["short_fires"] += count
+                handled += count
+                continue
+            rows[char] = k + lead
+        for i in range(pattern_width):
+            for char, row in rows.items():
+                pattern = patterns[row]
+                if i >= len(pattern) or pattern[i] != char:
+                    continue
+                handled += 1
+                offset, _, delay, exact_delay = delays[char]
+                solenoid = i + 1 + offset
+                if solenoid > num_solenoids:
+                    continue
+                t = tick + delay
+                waiting = [p for p in pending.get(solenoid, ()) if p > fired_until]
+                pending[solenoid] = waiting
+                if any(abs(p - t) < width for p in waiting):
+                    stats["coalesced"] += 1
+                    continue
+                if len(releases) >= ledger_size:
+                    stats["dropped"] += 1
+                    continue
+                heapq.heappush(releases, t + width)
+                waiting.append(t)
+                stats["scheduled"] += 1
+                if t >= end_ms:
+                    stats["unfired"] += 1
+                else:
+                    error = abs(t - ((row + 1) * interval_ms + exact_delay))
+                    stats["worst_error_ms"] = max(stats["worst_error_ms"], error)
+        stats["peak_ledger"] = max(stats["peak_ledger"], len(releases))
+        next_trigger += interval_ms
+    stats["unplayed_fires"] = painted - handled
+    stats["fires_lost"] = stats["dropped"] + stats["coalesced"]
+    return stats
+
+
+def read_patterns(gcode_filepath):
+    """(column, drop, pattern rows, reverse) for every STRIPE block of a text or binary gcode file."""
+    stripes = []
+    column = None
+    reverse = False
+    patterns = None
+    for line in job_estimate.iter_gcode_lines(gcode_filepath):
+        if line.startswith("STRIPE - column #"):
+            column = int(line[len("STRIPE - column #"):].split()[0])
+            reverse = line.rstrip().endswith(stripe_engine.REVERSE_SUFFIX)
+        elif line.startswith("pattern: "):
+            patterns = json.loads(line[len("pattern: "):])
+        elif line.startswith("drop: "):
+            stripes.append((column, float(line[len("drop: "):]), patterns, reverse))
+    return stripes
+
+
+def simulate_file(gcode_filepath, stripe_velocity=firmware.STRIPE_VELOCITY, **kwargs):
+    """Simulate every stripe of a gcode file; returns a list of (column, stats)."""
+    return [(column, simulate_stripe(patterns, drop, stripe_velocity, reverse=reverse, **kwargs))
+            for column, drop, patterns, reverse in read_patterns(gcode_filepath)]
+
+
+def totals(results):
+    keys = ("played", "scheduled", "coalesced", "dropped", "unfired", "unplayed_fires", "short_fires", "fires_lost")
+    total = {key: sum(stats[key] for _, stats in results) for key in keys}
+    total["peak_ledger"] = max((stats["peak_ledger"] for _, stats in results), default=0)
+    total["max_late_ms"] = max((stats["max_late_ms"] for _, stats in results), default=0)
+    total["worst_error_ms"] = max((stats["worst_error_ms"] for _, stats in results), default=0.0)
+    return total
+
+
+def print_stripes(results):
+    print(f"{'#':>5} {'column':>6} {'rows':>6} {'sched':>7} {'coal':>6} {'full':>6} {'unfired':>7} "
+          f"{'peak':>5} {'err ms':>7}")
+    for i, (column, s) in enumerate(results):
+        print(f"{i + 1:>5} {column:>6} {s['patterns']:>6} {s['scheduled']:>7} {s['coalesced']:>6} "
+              f"{s['dropped']:>6} {s['unfired']:>7} {s['peak_ledger']:>5} {s['worst_error_ms']:>7.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a gcode file through the chassis solenoid ledger.")
+    parser.add_argument("gcode", help="text or binary gcode file")
+    parser.add_argument("--velocity", type=float, nargs="+", default=[firmware.STRIPE_VELOCITY],
+                        help="stripe velocities to try, in m/s")
+    parser.add_argument("--blocks", choices=("current", "shift-register"), default="current",
+                        help="'current': only '1' fires, without delay; 'shift-register': three delayed blocks")
+    parser.add_argument("--block1-spacing", type=float, default=firmware.CHASSIS2_BLOCK1_SPACING_M)
+    parser.add_argument("--block2-spacing", type=float, default=firmware.CHASSIS2_BLOCK2_SPACING_M)
+    parser.add_argument("--ledger-size", type=int, default=firmware.CHASSIS_MAX_LEDGER_SIZE)
+    parser.add_argument("--duration-ms", type=float, default=firmware.CHASSIS_DURATION_MS,
+                        help="solenoid pulse width")
+    parser.add_argument("--stripes", action="store_true", help="also print the counters of every stripe")
+    args = parser.parse_args(argv)
+
+    if args.blocks == "current":
+        blocks, num_solenoids = CURRENT_BLOCKS, firmware.CHASSIS_NUM_SOLENOIDS
+        pattern_width, min_pattern_length = firmware.CHASSIS_PATTERN_WIDTH, firmware.CHASSIS_MIN_PATTERN_LENGTH
+    else:
+        blocks, num_solenoids = block_layout(args.block1_spacing, args.block2_spacing), firmware.CHASSIS2_NUM_SOLENOIDS
+        pattern_width, min_pattern_length = firmware.CHASSIS2_SOLENOIDS_PER_BLOCK, 1
+    try:
+        stripes = read_patterns(args.gcode)
+    except Exception as e:
+        print(f"Could not read {args.gcode}: {e}")
+        return 1
+
+    safe = []
+    for velocity in args.velocity:
+        results = [(column, simulate_stripe(patterns, drop, velocity, blocks, args.ledger_size,
+                                            args.duration_ms, num_solenoids, pattern_width, min_pattern_length,
+                                            reverse))
+                   for column, drop, patterns, reverse in stripes]
+        t = totals(results)
+        print(f"velocity {velocity:.4f} m/s: {t['scheduled']} fires, {t['coalesced']} coalesced, "
+              f"{t['dropped']} ledger full, {t['unfired']} unfired at stripe end, "
+              f"{t['unplayed_fires']} in unplayed rows, {t['short_fires']} in short rows; peak ledger {t['peak_ledger']}/{args.ledger_size}, "
+              f"worst fire error {t['worst_error_ms']:.1f} ms, max late {t['max_late_ms']} ms")
+        if args.stripes:
+            print_stripes(results)
+        if t["fires_lost"] == 0:
+            safe.append(velocity)
+    if len(args.velocity) > 1:
+        if safe:
+            print(f"Fastest velocity without ledger losses: {max(safe):.4f} m/s")
+        else:
+            print("Every velocity loses fires in the ledger.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,60 @@
-from PIL import Image
-import json
+import numpy as np
 import utils
+import palette
+import stripe_engine
+import gcode_writer
+import stripe_cache
+import instrumentation
 
 
 # State used to ensure the color mapping is printed only once
 HAS_PRINTED_COLOR_MAPPING = False
 
-def generate_position_data_multi_color_velocity_once(simplified_image_path, all_selected_hex_codes, gcode_filepath, pixel_size, cable_sepperation, dist_from_pulley, width, num_nozzles, offset=0.0, color_index_map=None, skip_black=False):
+
+def build_pattern_plane(index_plane):
+    """Turn a uint8 nozzle-index plane into an ``(h, w)`` array of pattern tokens.
+
+    Each cell holds the text the stripe pattern uses for that pixel: the
+    nozzle index as a string, or ``'x'`` for ``palette.NO_PAINT``.  When every
+    token is a single character the plane is an ``S1`` byte array so stripe
+    rows can be produced as zero-copy views; otherwise it is an object array
+    of ``str``.
+    """
+    if index_plane.size == 0 or int(index_plane.max()) < 10:
+        lut = np.array([b"x"] + [str(i).encode('ascii') for i in range(1, 10)], dtype='S1')
+    else:
+        lut = np.array(["x"] + [str(i) for i in range(1, 256)], dtype=object)
+    return lut[index_plane]
+
+
+def generate_position_data_multi_color_velocity_once(simplified_image_path, all_selected_hex_codes, gcode_filepath, pixel_size, cable_sepperation, dist_from_pulley, width, num_nozzles, offset=0.0, color_index_map=None, skip_black=False, workers=None, incremental=False, serpentine=False, trim=False):
     """Perform multi-color velocity slicing and write results to the given gcode file.
     The ``width`` argument used to be the only measurement of mural width, but
     callers sometimes pass a value that does not match the actual image size.
     The length calculations now use the width of the opened image (``w``)
     instead of the passed-in argument; the parameter is retained solely for
     backward compatibility and is otherwise ignored.
+
+    With ``workers`` > 1 the stripes are rendered on a process pool over a
+    shared-memory copy of the index plane and written in column order; the
+    output is identical to the serial path.
+
+    With ``incremental`` set, per-stripe fingerprints from the previous slice
+    (``stripe_cache.StripeCache``) are compared and only changed stripes are
+    rendered; the rest are copied.  Returns the list of changed stripe
+    numbers in that case.
+
+    With ``serpentine`` set every other stripe is written bottom to top (see
+    ``stripe_engine.format_stripe``) so the bot does not travel back up the
+    whole drop between stripes.  With ``trim`` set stripes without paint are
+    left out and the rest are cut to their first and last painted rows.
     """
     global HAS_PRINTED_COLOR_MAPPING
 
+    instrumentation.reset(instrumentation.SLICE_STAGES)
     try:
-        img = Image.open(simplified_image_path).convert('RGBA')
-        w, h = img.size
+        pixels = utils.load_image_array(simplified_image_path)
+        h, w = pixels.shape[:2]
         
         print("\n=== MULTI-COLOR SLICING DEBUG INFO ===")
         print(f"Image path: {simplified_image_path}")
@@ -46,91 +82,88 @@ def generate_position_data_multi_color_velocity_once(simplified_image_path, all_
             reordered_colors = sorted(color_index_map.keys(),
                                       key=lambda c: color_index_map[c])
 
-        if not HAS_PRINTED_COLOR_MAPPING:
-            with open(gcode_filepath, 'a') as f:
-                f.write("\n-- MULTI-COLOR INDEX MAPPING --\n")
-                for i, hex_col in enumerate(reordered_colors, start=1):
-                    f.write(f"Index {i} => {hex_col}\n")
-                f.write("-- END OF COLOR MAPPING --\n\n")
-            HAS_PRINTED_COLOR_MAPPING = True
-
-        with open(gcode_filepath, 'a') as f:
-            number_of_drawn_columns = w // num_nozzles
-            f.write(f"number of drawn columns = {number_of_drawn_columns}\n")
-            f.write(f"pulley spacing = {cable_sepperation}\n")
-            f.write("BEGIN MULTI-COLOR VELOCITY SLICING\n")
-
-            for c in range(number_of_drawn_columns):
-                f.write(f"STRIPE - column #{c + 1}\n")
-
+        with instrumentation.span("palette"):
+            indexer = palette.PaletteIndexer(color_index_map, skip_black=skip_black)
+            if instrumentation.debug_enabled():
+                for px_hex, count in indexer.unrecognized_colors(pixels).items():
+                    print(f"[DEBUG] Unrecognized color {px_hex} ({count} px); treating as transparent.")
+            index_plane = indexer.index_plane(pixels)
+        geometry = (pixel_size, dist_from_pulley, cable_sepperation, offset)
+
+        number_of_drawn_columns = w // num_nozzles
+        layout = stripe_engine.stripe_layout(index_plane != palette.NO_PAINT, num_nozzles, number_of_drawn_columns,
+                                             serpentine=serpentine, trim=trim)
+        columns = range(number_of_drawn_columns)
+        cache = None
+        if incremental:
+            cache = stripe_cache.StripeCache(gcode_filepath, "multi")
+            fingerprints = stripe_cache.stripe_fingerprints(index_plane, num_nozzles, number_of_drawn_columns,
+                                                            geometry, layout)
+            columns = cache.changed("", fingerprints)
+
+        def serial_stripes():
+            plane = build_pattern_plane(index_plane)
+            for c in columns:
                 # compute the pixel‑coordinate for the centre of the current stripe.
                 # the earlier version hard‑coded "4" and "-2" which assumed 4 pixels
                 # per stripe; changing `num_nozzles` (pixels per stripe) broke the
                 # pulley math.  use the same value for both the human‑readable
                 # pixel report and the pulley calculation so they stay in sync.
                 start_x = (c * num_nozzles) + (num_nozzles // 2)
-                f.write(f"starting/ending position pixel values:  ({start_x},{h}),({start_x},{0})\n")
-                
-                print(f"STRIPE #{c}:")
-                print(f"  c = {c}")
-                print(f"  num_nozzles = {num_nozzles}")
-                print(f"  start_x = (c * num_nozzles) + (num_nozzles // 2) = ({c} * {num_nozzles}) - ({num_nozzles} // 2) = {start_x}")
-                print(f"  start_x in meters = {start_x * pixel_size:.4f} m")
-                print(f"  Mural width in meters = {w * pixel_size:.4f} m")
-                print(f"  Mural center x-position in meters = {(w * pixel_size) / 2:.4f} m")
-                print(f"  Distance from center to start_x = {((w * pixel_size) / 2) - (start_x * pixel_size):.4f} m")
-
-                patterns = []
-                col_start = num_nozzles * c
-
-                for y in range(h):
-                    row_pattern = ""
-                    for nozzle_idx in range(num_nozzles):
-                        x_coord = col_start + nozzle_idx
-                        if x_coord < 0 or x_coord >= w:
-                            row_pattern += "x"
-                            continue
-
-                        r, g, b, a = img.getpixel((x_coord, y))
-                        if a == 0 or (skip_black and r == 0 and g == 0 and b == 0):
-                            row_pattern += "x"
-                        else:
-                            px_hex = "#{:02x}{:02x}{:02x}".format(r, g, b).lower()
-                            if px_hex in color_index_map:
-                                row_pattern += str(color_index_map[px_hex])
-                            else:
-                                print(f"[DEBUG] Unrecognized color {px_hex}; treating as transparent.")
-                                row_pattern += "x"
-
-                    patterns.append(row_pattern)
-
-                f.write('pattern: ' + json.dumps(patterns) + "\n")
-
-                drop_val = pixel_size * h
-                f.write(f"drop: {drop_val}\n")
-
-                print(f"\n  Pulley calculation inputs:")
-                print(f"    start_x = {start_x} pixels")
-                print(f"    h (image height) = {h} pixels")
-                print(f"    dist_from_pulley = {dist_from_pulley} m")
-                print(f"    cable_sepperation = {cable_sepperation} m")
-                print(f"    w (image width) = {w} pixels = {w * pixel_size:.4f} m")
-                print(f"    pixel_size = {pixel_size} m")
+
+                if instrumentation.debug_enabled():
+                    print(f"STRIPE #{c}:")
+                    print(f"  c = {c}")
+                    print(f"  num_nozzles = {num_nozzles}")
+                    print(f"  start_x = (c * num_nozzles) + (num_nozzles // 2) = ({c} * {num_nozzles}) - ({num_nozzles} // 2) = {start_x}")
+                    print(f"  start_x in meters = {start_x * pixel_size:.4f} m")
+                    print(f"  Mural width in meters = {w * pixel_size:.4f} m")
+                    print(f"  Mural center x-position in meters = {(w * pixel_size) / 2:.4f} m")
+                    print(f"  Distance from center to start_x = {((w * pixel_size) / 2) - (start_x * pixel_size):.4f} m")
+
+                    print(f"\n  Pulley calculation inputs:")
+                    print(f"    start_x = {start_x} pixels")
+                    print(f"    h (image height) = {h} pixels")
+                    print(f"    dist_from_pulley = {dist_from_pulley} m")
+                    print(f"    cable_sepperation = {cable_sepperation} m")
+                    print(f"    w (image width) = {w} pixels = {w * pixel_size:.4f} m")
+                    print(f"    pixel_size = {pixel_size} m")
 
                 # use the exact same start_x and the *image* width for the pulley calculation
-                la = round(utils.length_a(start_x, h, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
-                lb = round(utils.length_b(start_x, h, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
-                
-                print(f"\n  Pulley calculation results:")
-                print(f"    length_a = {la} m")
-                print(f"    length_b = {lb} m")
-                print(f"    difference = {abs(lb - la):.6f} m\n")
-                
-                f.write(f"starting pulley values:  {la},{lb}\n")
-
-            f.write("END MULTI-COLOR VELOCITY SLICING\n")
+                yield stripe_engine.render_stripe(plane, c, c, layout[c], num_nozzles, h, w, geometry)
+
+        with instrumentation.span("slice"), gcode_writer.GcodeWriter(gcode_filepath, append=True) as writer:
+            if not HAS_PRINTED_COLOR_MAPPING:
+                writer.write("\n-- MULTI-COLOR INDEX MAPPING --\n")
+                for i, hex_col in enumerate(reordered_colors, start=1):
+                    writer.write(f"Index {i} => {hex_col}\n")
+                writer.write("-- END OF COLOR MAPPING --\n\n")
+
+            writer.write(f"number of drawn columns = {number_of_drawn_columns}\n")
+            writer.write(f"pulley spacing = {cable_sepperation}\n")
+            writer.write("BEGIN MULTI-COLOR VELOCITY SLICING\n")
+
+            if workers and workers > 1 and columns:
+                with stripe_engine.ParallelStripeRenderer(index_plane, num_nozzles, geometry, workers) as renderer:
+                    stripes = instrumentation.counted("stripes_rendered", renderer.render(build_pattern_plane, number_of_drawn_columns, columns, layout))
+                    if cache is not None:
+                        stripes = cache.merge("", fingerprints, stripes)
+                    writer.write_stripes(stripes)
+            else:
+                stripes = instrumentation.counted("stripes_rendered", serial_stripes())
+                if cache is not None:
+                    stripes = cache.merge("", fingerprints, stripes)
+                writer.write_stripes(stripes)
+
+            writer.write("END MULTI-COLOR VELOCITY SLICING\n")
+        instrumentation.record("write", writer.write_seconds, writer.flush_count)
+        HAS_PRINTED_COLOR_MAPPING = True
 
         print("Multi-color velocity slicing complete.")
+        if cache is not None:
+            cache.save()
+            cache.report()
+            return cache.changed_stripes[""]
 
     except Exception as e:
         print(f"Error generating multi-color velocity slicing: {e}")
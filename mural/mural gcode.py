@@ -7,11 +7,10 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.patches as mpatches
 import math
-import random
-from sklearn.cluster import KMeans
 import sys
 import webcolors
 import json
+import utils
 # BEFORE RUNNING:
 # 1) Run the command 'pip install tkinter pillow numpy matplotlib sklearn' in your terminal to install all necessary libraries.
 # 2) Ensure that the folder the script will save files to exists or provide a new path for 'root_folder' below.
@@ -23,23 +22,7 @@ settings_filepath = os.path.join(root_folder, "settings.json")
 
 
 def load_settings():
-    defaults = {
-        "file_path": r"C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/imput images/jules eye 257 wide.jpg",
-        "width": 310,
-        "pixel_size": 0.01,
-        "cable_sepperation": 4.6,
-        "dist_from_pulley": 4.2,
-        "floor_dist_from_pulleys": 6.0,
-        "chassis_length_below_nozzles": 0.3,
-        "offset": 0.0,
-        "color_mode": "Simplify Image",
-        "number_of_colors": 2,
-        "n_value": 3,
-        "peak_velocity": 0.5,
-        "slicing_option": "multi color velocity slicing",
-        "Num_nozzles": 8,
-        "notes": "horizontal sep = 12mm, vertical sep = 20mm\nwall width 9ft → 228px at 12mm/px\nJules eye temp target 257px\n",
-    }
+    defaults = dict(utils.DEFAULT_SETTINGS)
     if os.path.exists(settings_filepath):
         try:
             with open(settings_filepath, 'r') as f:
@@ -57,10 +40,11 @@ def save_settings(settings_dict):
     except Exception as e:
         print(f"Could not save settings: {e}")
 
-reduced_image_path = os.path.join(root_folder, "temp.png")
-processed_image_path = os.path.join(root_folder, "processed_image_path.png")
 preview_image_path = os.path.join(root_folder, "preview_image.png")
 
+# Cached resize / color-mode outputs (see image_cache.py)
+image_cache_folder = os.path.join(root_folder, 'image_cache')
+
 # Create the temp_images folder
 temp_images_folder = os.path.join(root_folder, 'temp_images')
 # Ensure temp_images_folder exists
@@ -81,9 +65,20 @@ offset = _s["offset"]
 color_mode = _s["color_mode"]
 number_of_colors = _s["number_of_colors"]
 n_value = _s["n_value"]
+scatter_seed = _s["scatter_seed"]  # random seed of the scatter color modes, so re-slices are reproducible
 peak_velocity = _s["peak_velocity"]
 slicing_option = _s["slicing_option"]
 Num_nozzles = _s["Num_nozzles"]
+slicing_workers = _s["slicing_workers"]  # >1 renders stripes on a process pool
+incremental_slicing = _s["incremental_slicing"]  # only re-render stripes that changed since the last slice
+serpentine_stripes = _s["serpentine_stripes"]  # paint every other stripe bottom to top, saving the climb back up
+trim_empty_stripes = _s["trim_empty_stripes"]  # leave out unpainted stripes and crop the rest to their painted rows
+image_cache_mb = _s["image_cache_mb"]  # size budget of the resize/color-mode cache, 0 disables it
+debug_dump_images = _s["debug_dump_images"]  # write temp.png / processed_image_path.png for inspection
+length_grid = _s["length_grid"]  # point mode also saves per-pixel A/B lengths next to the gcode
+optimize_point_order = _s["optimize_point_order"]  # point mode reorders points to cut cable travel
+log_level = _s["log_level"]  # "silent", "info" or "debug" (per-stripe and length_a/length_b detail)
+timing_summary = _s["timing_summary"]  # write the stage timings into the gcode header (makes re-slices differ)
 notes = _s["notes"]
 
 
@@ -102,9 +97,11 @@ if not os.path.exists(gcode_dir):
     print(f"Created directory: {gcode_dir}")
 
 # Import the new modules
-import utils
 import slicing_styles
 import multi_color_slicing
+import image_cache
+import image_processing
+import instrumentation
 
 
 def initial_popup():
@@ -149,7 +146,7 @@ def initial_popup():
         floor_dist_from_pulleys = float(floor_dist_entry.get())
         chassis_length_below_nozzles = float(chassis_below_entry.get())
         offset = float(offset_entry.get())
-        if color_mode in ['Simplify Image', 'Dynamic Scatter NxN']:
+        if color_mode in ['Simplify Image', 'Dynamic Scatter NxN', 'Ordered Dither', 'Floyd-Steinberg Dither', 'Atkinson Dither']:
             number_of_colors = int(number_of_colors_entry.get())
         if color_mode in ['RGB Scatter NxN', 'Dynamic Scatter NxN']:
             n_value = int(n_value_entry.get())
@@ -167,9 +164,20 @@ def initial_popup():
             "color_mode": color_mode,
             "number_of_colors": number_of_colors,
             "n_value": n_value,
+            "scatter_seed": scatter_seed,
             "peak_velocity": peak_velocity,
             "slicing_option": slicing_option,
             "Num_nozzles": Num_nozzles,
+            "slicing_workers": slicing_workers,
+            "incremental_slicing": incremental_slicing,
+            "serpentine_stripes": serpentine_stripes,
+            "trim_empty_stripes": trim_empty_stripes,
+            "image_cache_mb": image_cache_mb,
+            "debug_dump_images": debug_dump_images,
+            "length_grid": length_grid,
+            "optimize_point_order": optimize_point_order,
+            "log_level": log_level,
+            "timing_summary": timing_summary,
             "notes": notes,
         })
         root.quit()
@@ -183,7 +191,7 @@ def initial_popup():
         else:
             width_label.grid(row=3, column=0, sticky="e", padx=(0, 8), pady=3)
             width_entry.grid(row=3, column=1, sticky="ew", pady=3)
-        if selected_mode in ['Simplify Image', 'Dynamic Scatter NxN']:
+        if selected_mode in ['Simplify Image', 'Dynamic Scatter NxN', 'Ordered Dither', 'Floyd-Steinberg Dither', 'Atkinson Dither']:
             number_of_colors_label.grid(row=14, column=0, sticky="e", padx=(0, 8), pady=3)
             number_of_colors_entry.grid(row=14, column=1, sticky="ew", pady=3)
         else:
@@ -492,7 +500,8 @@ def initial_popup():
     color_mode_var = tk.StringVar(value=color_mode)
     color_mode_var.trace('w', on_color_mode_change)
     lbl(form_frame, "Color Mode:", 13)
-    color_options = ['RGB', 'CMYK', 'Simplify Image', 'Exact Color Match', 'RGB Scatter NxN', 'Dynamic Scatter NxN']
+    color_options = ['RGB', 'CMYK', 'Simplify Image', 'Exact Color Match', 'RGB Scatter NxN', 'Dynamic Scatter NxN',
+                     'Ordered Dither', 'Floyd-Steinberg Dither', 'Atkinson Dither']
     color_dropdown = tk.OptionMenu(form_frame, color_mode_var, *color_options)
     color_dropdown.config(bg=ENTRY_BG, fg=LABEL_FG, relief="solid",
                           font=("Segoe UI", 12), highlightthickness=0)
@@ -572,445 +581,6 @@ def validate_image(file_path):
     return utils.validate_image(file_path)
 
 
-def resize_image(file_path, new_width):
-    """
-    Resizes the input image to the specified width while maintaining the aspect ratio.
-    If the image is already at the desired width, it does not resize it.
-    """
-    try:
-        if not os.path.isfile(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
-        with Image.open(file_path) as img:
-            # Validate image format
-            if img.format not in ['JPEG', 'PNG', 'BMP', 'GIF', 'TIFF']:
-                raise ValueError(f"Unsupported image format: {img.format}")
-            # Preserve the alpha channel if present
-            if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                img = img.convert('RGBA')
-            else:
-                img = img.convert('RGB')
-            original_width, original_height = img.size
-            if original_width == new_width:
-                print(f"Image is already at the desired width of {new_width}px. Resizing not needed.")
-                img.save(reduced_image_path)
-            else:
-                new_height = int((new_width / original_width) * original_height)
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                resized_img.save(reduced_image_path)
-                print(f"Image resized and saved as {reduced_image_path}")
-    except Exception as e:
-        print(f"Error resizing image: {e}")
-
-
-def simplify_image_pillow(reduced_image_path, num_colors):
-    """
-    Simplifies the image by reducing it to a specified number of colors using the Pillow library.
-    """
-    try:
-        # Load image
-        image = Image.open(reduced_image_path)
-        # Preserve alpha channel if present
-        has_alpha = image.mode == 'RGBA'
-        if has_alpha:
-            alpha = image.split()[-1]
-            image = image.convert('RGB')
-        else:
-            alpha = None
-
-        # Quantize to N colors then convert back to RGBA/RGB so the saved file
-        # is a standard mode PNG that PIL can reliably reopen.
-        simplified_image = image.convert(mode='P', palette=Image.ADAPTIVE, colors=num_colors)
-        if has_alpha:
-            simplified_image = simplified_image.convert('RGBA')
-            simplified_image.putalpha(alpha)
-        else:
-            simplified_image = simplified_image.convert('RGB')
-
-        # Save the new image
-        simplified_image.save(processed_image_path)
-        print(f'Simplified image saved as {processed_image_path}')
-    except Exception as e:
-        print(f"Error simplifying image: {e}")
-
-
-def exact_color_match(reduced_image_path):
-    """
-    Like simplify_image_pillow but auto-detects the palette size from the image.
-    Errors out if the image has more than 10 unique colors.
-    """
-    try:
-        image = Image.open(reduced_image_path)
-        has_alpha = image.mode == 'RGBA'
-        if has_alpha:
-            alpha = image.split()[-1]
-            rgb_image = image.convert('RGB')
-        else:
-            alpha = None
-            rgb_image = image.convert('RGB')
-
-        unique_colors = len(set(rgb_image.getdata()))
-        if unique_colors > 10:
-            raise ValueError(
-                f"this file is not meant for this mode reduce number of colors in your image "
-                f"(found {unique_colors} unique colors, max is 10)"
-            )
-
-        simplified_image = rgb_image.convert(mode='P', palette=Image.ADAPTIVE, colors=unique_colors)
-        if has_alpha:
-            simplified_image = simplified_image.convert('RGBA')
-            simplified_image.putalpha(alpha)
-        else:
-            simplified_image = simplified_image.convert('RGB')
-
-        simplified_image.save(processed_image_path)
-        print(f'Exact color match image saved as {processed_image_path} ({unique_colors} colors)')
-    except Exception as e:
-        print(f"Error in exact color match: {e}")
-        raise
-
-
-def process_image_rgb_scatter_nxn(image_path, n):
-    print(f'Processing RGB Scatter {n}x{n}')
-    try:
-        # Open the input image and preserve alpha channel if present
-        original_img = Image.open(image_path)
-        has_alpha = original_img.mode in ('RGBA', 'LA')
-        if has_alpha:
-            original_img = original_img.convert('RGBA')
-        else:
-            original_img = original_img.convert('RGB')
-        width, height = original_img.size
-
-        # Create a new image with n times the width and height
-        new_width = width * n
-        new_height = height * n
-        if has_alpha:
-            new_img = Image.new('RGBA', (new_width, new_height), (255, 255, 255, 0))
-        else:
-            new_img = Image.new('RGB', (new_width, new_height), 'white')
-
-        # Load pixel data for fast access
-        original_pixels = original_img.load()
-        new_pixels = new_img.load()
-
-        # Process each pixel
-        for x in range(width):
-            for y in range(height):
-                # Map y to start from the bottom
-                orig_y = height - y - 1
-                # Get the RGBA or RGB values
-                pixel = original_pixels[x, orig_y]
-                if has_alpha:
-                    r, g, b, a = pixel
-                    if a == 0:
-                        continue  # Skip transparent pixels
-                else:
-                    r, g, b = pixel
-
-                # Function to assign values based on RGB ranges
-                def assign_value(component):
-                    return max(1, int((component / 255.0) * (n * n / 3)))
-
-                r_value = assign_value(r)
-                g_value = assign_value(g)
-                b_value = assign_value(b)
-
-                total_pixels = r_value + g_value + b_value
-                total_pixels = min(total_pixels, n * n)  # Ensure we don't exceed the block size
-
-                positions = [(i, j) for i in range(n) for j in range(n)]
-                random_positions = random.sample(positions, total_pixels)
-
-                # Place red pixels
-                for _ in range(r_value):
-                    if random_positions:
-                        pos = random_positions.pop()
-                        new_x = x * n + pos[0]
-                        new_y = new_height - (y + 1) * n + pos[1]
-                        new_pixels[new_x, new_y] = (255, 0, 0, 255) if has_alpha else (255, 0, 0)
-                    else:
-                        break
-
-                # Place green pixels
-                for _ in range(g_value):
-                    if random_positions:
-                        pos = random_positions.pop()
-                        new_x = x * n + pos[0]
-                        new_y = new_height - (y + 1) * n + pos[1]
-                        new_pixels[new_x, new_y] = (0, 255, 0, 255) if has_alpha else (0, 255, 0)
-                    else:
-                        break
-
-                # Place blue pixels
-                for _ in range(b_value):
-                    if random_positions:
-                        pos = random_positions.pop()
-                        new_x = x * n + pos[0]
-                        new_y = new_height - (y + 1) * n + pos[1]
-                        new_pixels[new_x, new_y] = (0, 0, 255, 255) if has_alpha else (0, 0, 255)
-                    else:
-                        break
-
-        # Save the new image
-        new_img.save(processed_image_path)
-    except Exception as e:
-        print(f"Error in RGB Scatter NxN processing: {e}")
-
-
-def process_image_with_dynamic_base_colors_nxn(image_path, n_base_colors, n):
-    print(f'Processing Dynamic Scatter {n}x{n}')
-    try:
-        # Open the input image and preserve alpha channel if present
-        original_img = Image.open(image_path)
-        has_alpha = original_img.mode in ('RGBA', 'LA')
-        if has_alpha:
-            original_img = original_img.convert('RGBA')
-        else:
-            original_img = original_img.convert('RGB')
-        width, height = original_img.size
-
-        # Create a new image with n times the width and height
-        new_width = width * n
-        new_height = height * n
-        if has_alpha:
-            new_img = Image.new('RGBA', (new_width, new_height), (255, 255, 255, 0))
-        else:
-            new_img = Image.new('RGB', (new_width, new_height), 'white')
-
-        # Extract pixels from the original image for color clustering
-        pixels = np.array(original_img)
-        if has_alpha:
-            # Exclude transparent pixels
-            mask = pixels[:, :, 3] > 0
-            pixels_rgb = pixels[:, :, :3][mask]
-        else:
-            pixels_rgb = pixels.reshape(-1, 3)
-
-        # Step 1: Use K-means to find the base colors
-        kmeans = KMeans(n_clusters=n_base_colors, random_state=42)
-        kmeans.fit(pixels_rgb)
-        base_colors_rgb = kmeans.cluster_centers_.astype(int)
-        base_colors_rgb = [tuple(color) for color in base_colors_rgb]
-
-        # Load pixel data for fast access
-        original_pixels = original_img.load()
-        new_pixels = new_img.load()
-
-        # Process each pixel in the original image
-        for x in range(width):
-            for y in range(height):
-                # Get the RGBA values of the original pixel
-                pixel = original_pixels[x, y]
-                if has_alpha:
-                    r, g, b, a = pixel
-                    if a == 0:
-                        continue  # Skip fully transparent pixels
-                    # Calculate transparency factor (0 to 1)
-                    transparency = a / 255.0
-                else:
-                    r, g, b = pixel
-                    transparency = 1.0  # No transparency
-
-                # Calculate the relative contribution of each base color
-                target_color = np.array([r, g, b])
-                color_distances = [np.linalg.norm(target_color - np.array(color)) for color in base_colors_rgb]
-                contributions = np.array(color_distances)
-                contributions = 1 / (contributions + 1e-5)  # Inverse distance weighting
-                contributions /= contributions.sum()  # Normalize to sum to 1
-
-                # Calculate total number of pixels based on transparency
-                total_pixels = int(round(n * n * transparency))
-
-                # Calculate the number of pixels for each base color
-                if total_pixels > 0:
-                    pixel_counts = (contributions * total_pixels).round().astype(int)
-                    
-                    # Ensure the sum matches total_pixels by adjusting for rounding errors
-                    while pixel_counts.sum() < total_pixels:
-                        pixel_counts[np.argmin(pixel_counts)] += 1
-                    while pixel_counts.sum() > total_pixels:
-                        pixel_counts[np.argmax(pixel_counts)] -= 1
-                else:
-                    continue  # Skip if no pixels should be drawn
-
-                # Fill the NxN block with the assigned pixels
-                block_x = x * n
-                block_y = y * n
-
-                # Assign colors to each pixel in the block based on calculated pixel counts
-                positions = [(i, j) for i in range(n) for j in range(n)]
-                random.shuffle(positions)
-                pos_index = 0
-
-                for color_index, count in enumerate(pixel_counts):
-                    for _ in range(count):
-                        if pos_index < len(positions):
-                            px_offset, py_offset = positions[pos_index]
-                            px = block_x + px_offset
-                            py = block_y + py_offset
-                            color = base_colors_rgb[color_index]
-                            if has_alpha:
-                                new_pixels[px, py] = (*color, 255)  # Full opacity for placed pixels
-                            else:
-                                new_pixels[px, py] = color
-                            pos_index += 1
-
-        # Save the new image
-        new_img.save(processed_image_path)
-    except Exception as e:
-        print(f"Error in Dynamic Scatter NxN processing: {e}")
-
-
-def process_image_rgb(image_path):
-    try:
-        # Open the input image and preserve alpha channel if present
-        original_img = Image.open(image_path)
-        has_alpha = original_img.mode in ('RGBA', 'LA')
-        if has_alpha:
-            original_img = original_img.convert('RGBA')
-        else:
-            original_img = original_img.convert('RGB')
-        width, height = original_img.size
-
-        # Create a new image with 3 times the width and height
-        new_width = width * 3
-        new_height = height * 3
-        if has_alpha:
-            new_img = Image.new('RGBA', (new_width, new_height), (0, 0, 0, 0))
-        else:
-            new_img = Image.new('RGB', (new_width, new_height), 'black')
-
-        # Load pixel data for fast access
-        original_pixels = original_img.load()
-        new_pixels = new_img.load()
-
-        # Process each pixel starting from the bottom-left corner
-        for x in range(width):
-            for y in range(height):
-                # Map y to start from the bottom
-                orig_y = height - y - 1
-                # Get the RGBA or RGB values of the original pixel
-                pixel = original_pixels[x, orig_y]
-                if has_alpha:
-                    r, g, b, a = pixel
-                    if a == 0:
-                        continue  # Skip transparent pixels
-                else:
-                    r, g, b = pixel
-
-                # Function to assign values based on RGB ranges
-                def assign_value(component):
-                    if 0 <= component <= 85:
-                        return 1
-                    elif 86 <= component <= 172:
-                        return 2
-                    else:  # 173 to 255
-                        return 3
-
-                # Assign values for red, green, and blue components
-                r_value = assign_value(r)
-                g_value = assign_value(g)
-                b_value = assign_value(b)
-
-                # Calculate the position of the 3x3 block in the new image
-                block_x = x * 3
-                block_y = new_height - (y + 1) * 3  # Start from bottom
-
-                # Stack red pixels in the first column from bottom to top
-                for i in range(r_value):
-                    new_pixels[block_x, block_y + i] = (255, 0, 0, 255) if has_alpha else (255, 0, 0)
-                # Stack green pixels in the second column from bottom to top
-                for i in range(g_value):
-                    new_pixels[block_x + 1, block_y + i] = (0, 255, 0, 255) if has_alpha else (0, 255, 0)
-                # Stack blue pixels in the third column from bottom to top
-                for i in range(b_value):
-                    new_pixels[block_x + 2, block_y + i] = (0, 0, 255, 255) if has_alpha else (0, 0, 255)
-
-        # Save the new image
-        new_img.save(processed_image_path)
-    except Exception as e:
-        print(f"Error processing image in RGB mode: {e}")
-
-
-def process_image_cmy(image_path):
-    try:
-        # Open the input image and preserve alpha channel if present
-        original_img = Image.open(image_path)
-        has_alpha = original_img.mode in ('RGBA', 'LA')
-        if has_alpha:
-            # CMYK does not support alpha, so we need to separate it
-            alpha = original_img.split()[-1]
-            original_img = original_img.convert('CMYK')
-        else:
-            original_img = original_img.convert('CMYK')
-        width, height = original_img.size
-
-        # Create a new image with 3 times the width and height
-        new_width = width * 3
-        new_height = height * 3
-        if has_alpha:
-            new_img = Image.new('RGBA', (new_width, new_height), (0, 0, 0, 0))
-        else:
-            new_img = Image.new('RGB', (new_width, new_height), 'black')
-
-        # Load pixel data for fast access
-        original_pixels = original_img.load()
-        new_pixels = new_img.load()
-
-        # Process each pixel starting from the bottom-left corner
-        for x in range(width):
-            for y in range(height):
-                # Map y to start from the bottom
-                orig_y = height - y - 1
-                # Get the CMYK values of the original pixel
-                c, m, y_val, k = original_pixels[x, orig_y]
-
-                if has_alpha:
-                    a = alpha.getpixel((x, orig_y))
-                    if a == 0:
-                        continue  # Skip transparent pixels
-                else:
-                    a = 255  # Fully opaque
-
-                # Adjust CMY values by combining with K (black) component
-                c = min(255, c + k)
-                m = min(255, m + k)
-                y_val = min(255, y_val + k)
-
-                # Function to assign values based on CMY ranges
-                def assign_value(component):
-                    if 0 <= component <= 85:
-                        return 1
-                    elif 86 <= component <= 172:
-                        return 2
-                    else:  # 173 to 255
-                        return 3
-
-                # Assign values for cyan, magenta, and yellow components
-                c_value = assign_value(c)
-                m_value = assign_value(m)
-                y_value = assign_value(y_val)
-
-                # Calculate the position of the 3x3 block in the new image
-                block_x = x * 3
-                block_y = new_height - (y + 1) * 3  # Start from bottom
-
-                # Stack cyan pixels in the first column from bottom to top
-                for i in range(c_value):
-                    new_pixels[block_x, block_y + i] = (0, 255, 255, a) if has_alpha else (0, 255, 255)
-                # Stack magenta pixels in the second column from bottom to top
-                for i in range(m_value):
-                    new_pixels[block_x + 1, block_y + i] = (255, 0, 255, a) if has_alpha else (255, 0, 255)
-                # Stack yellow pixels in the third column from bottom to top
-                for i in range(y_value):
-                    new_pixels[block_x + 2, block_y + i] = (255, 255, 0, a) if has_alpha else (255, 255, 0)
-
-        # Save the new image
-        new_img.save(processed_image_path)
-    except Exception as e:
-        print(f"Error processing image in CMYK mode: {e}")
-
-
 def count_unique_hex_colors(image_path):
     return utils.count_unique_hex_colors(image_path)
 
@@ -1019,22 +589,22 @@ def extract_color(image_path, hex_color):
     return utils.extract_color(image_path, hex_color, temp_images_folder)
 
 
-def create_text_file(file_path):
+def create_text_file(file_path, timing_summary=False):
     """
     Creates a new text file for storing G-code instructions and writes the starting lines.
     """
-    return utils.create_text_file(file_path)
+    return utils.create_text_file(file_path, timing_summary)
 
 
 def append_to_text_file(line):
     return utils.append_to_text_file(line, gcode_filepath)
 
 
-def generate_preview_image(selected_hex_codes):
+def generate_preview_image(processed_image):
     """
     Displays the processed image.
     """
-    return utils.generate_preview_image(processed_image_path)
+    return utils.generate_preview_image(processed_image)
 
 
 def length_a(x, y):
@@ -1063,15 +633,16 @@ def generate_position_data(hex_path, hex_code):
     Generates position data for the painting robot by recording the coordinates of the pixels
     for a specific color and appends it to the G-code file.
     """
-    return slicing_styles.generate_position_data(hex_path, hex_code, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, offset, Num_nozzles)
+    length_grid_path = os.path.splitext(gcode_filepath)[0] + ".lengths.npy" if length_grid else None
+    return slicing_styles.generate_position_data(hex_path, hex_code, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, offset, Num_nozzles, length_grid_path, optimize_point_order)
 
 
-def generate_position_data_mono_velocity_sequential_colors(hex_paths_and_codes):
+def generate_position_data_mono_velocity_sequential_colors(simplified_image_path, hex_codes):
     """
     Generates position data for the painting robot in a 'mono color velocity slicing' manner.
-    hex_paths_and_codes: list of (hex_path, hex_code) tuples.
+    hex_codes: list of hex color strings, painted one after another.
     """
-    return slicing_styles.generate_position_data_mono_velocity_sequential_colors(hex_paths_and_codes, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, Num_nozzles, offset)
+    return slicing_styles.generate_position_data_mono_velocity_sequential_colors(simplified_image_path, hex_codes, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, Num_nozzles, offset, workers=slicing_workers, incremental=incremental_slicing, serpentine=serpentine_stripes, trim=trim_empty_stripes)
 
 
 def get_color_name(hex_code):
@@ -1095,7 +666,7 @@ def generate_position_data_multi_color_velocity_once(
 ):
     """
     Perform multi-color velocity slicing in a single pass.
-    - Scans the entire 'simplified_image_path' (which is your processed_image_path).
+    - Scans the entire 'simplified_image_path' (the processed image from the pipeline, in memory or on disk).
     - Breaks columns in 4-pixel increments (same as the mono function).
     - For each pixel:
         * If alpha=0 => prints 'x'.
@@ -1115,102 +686,100 @@ def generate_position_data_multi_color_velocity_once(
         offset,
         color_index_map=color_index_map,
         skip_black=skip_black,
+        workers=slicing_workers,
+        incremental=incremental_slicing,
+        serpentine=serpentine_stripes,
+        trim=trim_empty_stripes,
     )
 
-# Initiate the GUI at the beginning
-visualize_only = False
-visualize_gcode_path = None
-initial_popup()
-
-if visualize_only:
-    _viewer_ns = {"__name__": "not_main"}
-    with open("C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/gcode viewer.py") as _f:
-        exec(_f.read(), _viewer_ns)
-    _color_map, _stripes = _viewer_ns["parse_gcode_file"](visualize_gcode_path)
-    _img = _viewer_ns["create_image_from_stripes"](_color_map, _stripes)
-    _final_img = _viewer_ns["add_legend_to_image"](_img, _color_map)
-    plt.figure()
-    plt.imshow(_final_img)
-    plt.axis('off')
-    plt.show()
-    sys.exit(0)
-
-# Validate the image
-if not validate_image(file_path):
-    print("Exiting due to invalid image file.")
-    sys.exit(1)
-
-if color_mode != 'Exact Color Match':
-    resize_image(file_path, width)
-else:
-    # Exact Color Match uses the image as-is — just copy to reduced_image_path
-    import shutil
-    shutil.copy2(file_path, reduced_image_path)
-
-try:
-    # Process image based on selected color mode
-    if color_mode == 'RGB':
-        process_image_rgb(reduced_image_path)
-    elif color_mode == 'CMYK':
-        process_image_cmy(reduced_image_path)
-    elif color_mode == 'Simplify Image':
-        simplify_image_pillow(reduced_image_path, number_of_colors)
-    elif color_mode == 'Exact Color Match':
-        exact_color_match(reduced_image_path)
-    elif color_mode == 'RGB Scatter NxN':
-        process_image_rgb_scatter_nxn(reduced_image_path, n_value)
-    elif color_mode == 'Dynamic Scatter NxN':
-        process_image_with_dynamic_base_colors_nxn(reduced_image_path, number_of_colors, n_value)
-    else:
-        print(f"Unsupported color mode selected: {color_mode}")
-except Exception as e:
-    print(f"Error during image processing: {e}")
-    sys.exit(1)
-
-# Close matplotlib figures so the embedded Tk backend doesn't poison the next Tk root
-import matplotlib.pyplot as _plt
-_plt.close('all')
-
-print("[DEBUG] Opening color assignment window...")
-selected_hex_codes, color_index_map = count_unique_hex_colors(processed_image_path)
-print(f"[DEBUG] Color window closed. Got {len(selected_hex_codes)} colors: {selected_hex_codes}")
-create_text_file(gcode_filepath)
-
-if slicing_option == "multi color velocity slicing":
-    generate_position_data_multi_color_velocity_once(processed_image_path, selected_hex_codes, color_index_map, skip_black=color_mode in ('RGB', 'CMYK'))
-elif slicing_option == "mono color velocity slicing":
-    hex_paths_and_codes = []
-    for hex_code in selected_hex_codes:
-        extract_color(processed_image_path, hex_code)
-        hex_code_stripped = hex_code.lstrip("#")
-        hex_path = os.path.join(temp_images_folder, hex_code_stripped + ".png")
-        hex_paths_and_codes.append((hex_path, hex_code))
-    generate_position_data_mono_velocity_sequential_colors(hex_paths_and_codes)
-
-# Print the global variables to verify the input data
-print("File Path:", file_path)
-print("Width:", width)
-print("Pixel Size:", pixel_size)
-print("Pulley Spacing:", cable_sepperation)
-print("Distance from Pulleys to Bottom of Mural:", dist_from_pulley)
-print("Offset:", offset)
-print("Color Mode:", color_mode)
-if color_mode in ['Simplify Image', 'Dynamic Scatter NxN']:
-    print("Number of Colors:", number_of_colors)
-if color_mode in ['RGB Scatter NxN', 'Dynamic Scatter NxN']:
-    print("Value of N:", n_value)
-print("Slicing Option:", slicing_option)
-print("Nozzles per stripe:", Num_nozzles)
-
-if slicing_option == "multi color velocity slicing":
-    with open("C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/gcode viewer.py") as f:
-        exec(f.read())
-else:
-    generate_preview_image(selected_hex_codes)
-
-import shutil as _shutil
-_arduino_data = r"C:\Users\oewil\OneDrive\Desktop\Mural-Bot\Arduino scripts\Base Module Platformio\data"
-_shutil.copy2(gcode_filepath, os.path.join(_arduino_data, os.path.basename(gcode_filepath)))
-print(f"GCode also copied to {_arduino_data}")
-
-print("GCODE GENERATOR IS DONE")
+# Slicing worker processes (slicing_workers > 1) re-import this script, so
+# everything interactive only runs when it is executed directly.
+if __name__ == "__main__":
+    # Initiate the GUI at the beginning
+    visualize_only = False
+    visualize_gcode_path = None
+    initial_popup()
+    instrumentation.set_log_level(log_level)
+
+    if visualize_only:
+        _viewer_ns = {"__name__": "not_main"}
+        with open("C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/gcode viewer.py") as _f:
+            exec(_f.read(), _viewer_ns)
+        _color_map, _stripes = _viewer_ns["parse_gcode_file"](visualize_gcode_path)
+        _img = _viewer_ns["create_image_from_stripes"](_color_map, _stripes)
+        _final_img = _viewer_ns["add_legend_to_image"](_img, _color_map)
+        plt.figure()
+        plt.imshow(_final_img)
+        plt.axis('off')
+        plt.show()
+        sys.exit(0)
+
+    # Validate the image
+    if not validate_image(file_path):
+        print("Exiting due to invalid image file.")
+        sys.exit(1)
+
+    # The image stages run in memory; temp.png / processed_image_path.png are
+    # only written when debug_dump_images is on.  Resize and color-mode
+    # outputs are cached by source hash, stage and parameters, so a re-run
+    # that only changes slicing or geometry settings skips image processing.
+    stage_cache = None
+    if image_cache_mb > 0:
+        stage_cache = image_cache.ImageStageCache(image_cache_folder, int(image_cache_mb * 1024 * 1024))
+    try:
+        pipeline = image_processing.ImagePipeline(
+            file_path, width, color_mode, number_of_colors, n_value,
+            cache=stage_cache,
+            dump_dir=root_folder if debug_dump_images else None,
+            seed=scatter_seed,
+        )
+        processed_image = pipeline.run()
+    except Exception as e:
+        print(f"Error during image processing: {e}")
+        sys.exit(1)
+
+    # Close matplotlib figures so the embedded Tk backend doesn't poison the next Tk root
+    import matplotlib.pyplot as _plt
+    _plt.close('all')
+
+    print("[DEBUG] Opening color assignment window...")
+    selected_hex_codes, color_index_map = count_unique_hex_colors(processed_image)
+    print(f"[DEBUG] Color window closed. Got {len(selected_hex_codes)} colors: {selected_hex_codes}")
+    create_text_file(gcode_filepath, timing_summary)
+
+    if slicing_option == "multi color velocity slicing":
+        generate_position_data_multi_color_velocity_once(processed_image, selected_hex_codes, color_index_map, skip_black=color_mode in ('RGB', 'CMYK'))
+    elif slicing_option == "mono color velocity slicing":
+        generate_position_data_mono_velocity_sequential_colors(processed_image, selected_hex_codes)
+
+    # Print the global variables to verify the input data
+    print("File Path:", file_path)
+    print("Width:", width)
+    print("Pixel Size:", pixel_size)
+    print("Pulley Spacing:", cable_sepperation)
+    print("Distance from Pulleys to Bottom of Mural:", dist_from_pulley)
+    print("Offset:", offset)
+    print("Color Mode:", color_mode)
+    if color_mode in ['Simplify Image', 'Dynamic Scatter NxN', 'Ordered Dither', 'Floyd-Steinberg Dither', 'Atkinson Dither']:
+        print("Number of Colors:", number_of_colors)
+    if color_mode in ['RGB Scatter NxN', 'Dynamic Scatter NxN']:
+        print("Value of N:", n_value)
+    print("Slicing Option:", slicing_option)
+    print("Nozzles per stripe:", Num_nozzles)
+
+    with instrumentation.span("preview"):
+        if slicing_option == "multi color velocity slicing":
+            with open("C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/gcode viewer.py") as f:
+                exec(f.read())
+        else:
+            generate_preview_image(processed_image)
+    if timing_summary:
+        instrumentation.write_summary(gcode_filepath)
+    instrumentation.print_summary()
+
+    import shutil as _shutil
+    _arduino_data = r"C:\Users\oewil\OneDrive\Desktop\Mural-Bot\Arduino scripts\Base Module Platformio\data"
+    _shutil.copy2(gcode_filepath, os.path.join(_arduino_data, os.path.basename(gcode_filepath)))
+    print(f"GCode also copied to {_arduino_data}")
+
+    print("GCODE GENERATOR IS DONE")
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+# Index 0 in an index plane means "do not paint this pixel" (transparent,
+# skipped black, or a color that is not in the map).
+NO_PAINT = 0
+
+# One slot per possible 24-bit RGB value.
+LUT_SIZE = 1 << 24
+
+
+def pack_rgb(pixels):
+    """Pack the RGB channels of an ``(h, w, 3|4)`` uint8 array into uint32."""
+    rgb = pixels[..., :3].astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def hex_to_packed(hex_code):
+    return int(hex_code.lstrip('#')[:6], 16)
+
+
+def packed_to_hex(value):
+    return "#{:06x}".format(int(value))
+
+
+def count_colors(pixels):
+    """Count opaque pixels per color.
+
+    Returns a dict of lower-case hex string -> pixel count, ordered by each
+    color's first appearance in the image (row-major).
+    """
+    packed = pack_rgb(pixels)
+    if pixels.shape[2] == 4:
+        packed = packed[pixels[:, :, 3] != 0]
+    colors, first, counts = np.unique(packed.ravel(), return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    return {packed_to_hex(c): n for c, n in zip(colors[order].tolist(), counts[order].tolist())}
+
+
+class PaletteIndexer:
+    """Map whole images to nozzle-index planes through a 24-bit lookup table.
+
+    ``color_index_map`` is the usual hex string -> nozzle index dict produced
+    by the color assignment window.  Every pixel is resolved with a single
+    table lookup on its packed RGB value, so an ``(h, w, 4)`` image becomes an
+    ``(h, w)`` uint8 plane where ``NO_PAINT`` marks pixels that are
+    transparent, pure black when ``skip_black`` is set, or not in the map.
+    """
+
+    def __init__(self, color_index_map, skip_black=False):
+        self.color_index_map = {}
+        for hex_code, index in color_index_map.items():
+            index = int(index)
+            if not 1 <= index <= 255:
+                raise ValueError(f"Nozzle index for {hex_code} must be between 1 and 255, got {index}")
+            self.color_index_map[hex_code.lower()] = index
+        self.skip_black = skip_black
+
+        self.lut = np.zeros(LUT_SIZE, dtype=np.uint8)
+        for hex_code, index in self.color_index_map.items():
+            self.lut[hex_to_packed(hex_code)] = index
+
+    @classmethod
+    def from_hex_codes(cls, hex_codes, skip_black=False):
+        """Build an indexer that numbers ``hex_codes`` 1..n in list order."""
+        return cls({c: i for i, c in enumerate(hex_codes, start=1)}, skip_black=skip_black)
+
+    def index_plane(self, pixels):
+        """Return the ``(h, w)`` uint8 nozzle-index plane for an RGBA array."""
+        packed = pack_rgb(pixels)
+        plane = self.lut[packed]
+        if pixels.shape[2] == 4:
+            plane[pixels[:, :, 3] == 0] = NO_PAINT
+        if self.skip_black:
+            plane[packed == 0] = NO_PAINT
+        return plane
+
+    def unrecognized_colors(self, pixels):
+        """Return {hex: count} for paintable pixels whose color is not mapped."""
+        packed = pack_rgb(pixels)
+        candidates = self.lut[packed] == NO_PAINT
+        if pixels.shape[2] == 4:
+            candidates &= pixels[:, :, 3] != 0
+        if self.skip_black:
+            candidates &= packed != 0
+        colors, counts = np.unique(packed[candidates], return_counts=True)
+        return {packed_to_hex(c): n for c, n in zip(colors.tolist(), counts.tolist())}
+
+    def palette(self, background=(255, 255, 255, 0)):
+        """Return a ``(256, 4)`` uint8 array mapping nozzle index -> RGBA."""
+        table = np.tile(np.array(background, dtype=np.uint8), (256, 1))
+        for hex_code, index in self.color_index_map.items():
+            value = hex_to_packed(hex_code)
+            table[index] = ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF, 255)
+        return table
+
+    def colorize(self, plane, background=(255, 255, 255, 0)):
+        """Render an index plane back to an ``(h, w, 4)`` RGBA array."""
+        return self.palette(background)[plane]
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import image_cache
+import image_processing
+import job_estimate
+import kinematics
+import palette
+import slice_mural
+import stripe_engine
+import utils
+
+
+# Parameter sweep over width / pixel_size / Num_nozzles / number_of_colors.
+#
+# Only width and the color count change the processed image, so combinations
+# are grouped by (width, number_of_colors): each group runs the image pipeline
+# once in a worker process -- resizes for the same width come out of the
+# shared stage cache -- and then scores every pixel_size / Num_nozzles pair
+# against that one index plane.  Nothing is sliced to disk; the numbers come
+# straight from the plane.
+#
+#   python parameter_sweep.py settings.json mural.png --width 200 250 300 \
+#       --pixel-size 0.01 0.012 --nozzles 4 8 --colors 2 3 --jobs 4 --csv sweep.csv
+
+
+def score_plane(index_plane, hex_codes, settings, pixel_size, num_nozzles):
+    """Stripe count, painted pixels per color, total drop and estimated time.
+
+    The time comes from job_estimate run on the stripes the slicer would
+    write (same layout options as ``settings``), without rendering gcode.
+    """
+    h, w = index_plane.shape
+    columns = w // num_nozzles
+    drawn = index_plane[:, :columns * num_nozzles]
+    counts = np.bincount(drawn.ravel(), minlength=len(hex_codes) + 1)
+    painted = {hex_code: int(counts[i]) for i, hex_code in enumerate(hex_codes, start=1)}
+    geometry = kinematics.PulleyGeometry(pixel_size, settings["dist_from_pulley"], settings["cable_sepperation"],
+                                         w, settings["offset"])
+    mono = settings["slicing_option"] == "mono color velocity slicing"
+    if mono:
+        layers = [index_plane == color_number for color_number in range(1, len(hex_codes) + 1)]
+    else:
+        layers = [index_plane != palette.NO_PAINT]
+    start_a, start_b, drop, reverse, color_change = [], [], [], [], []
+    empty_layers = 0
+    for layer_mask in layers:
+        layout = stripe_engine.stripe_layout(layer_mask, num_nozzles, columns,
+                                             serpentine=settings["serpentine_stripes"],
+                                             trim=settings["trim_empty_stripes"])
+        layer = job_estimate.layout_stripes(geometry, h, layout, num_nozzles)
+        if len(layer[0]) == 0:
+            empty_layers += 1
+            continue
+        for values, part in zip((start_a, start_b, drop, reverse), layer):
+            values.append(part)
+        change = np.zeros(len(layer[0]), dtype=bool)
+        change[0] = mono
+        color_change.append(change)
+    if start_a:
+        start_a, start_b, drop, reverse, color_change = (
+            np.concatenate(v) for v in (start_a, start_b, drop, reverse, color_change))
+    else:
+        start_a = start_b = drop = np.zeros(0)
+        reverse = color_change = np.zeros(0, dtype=bool)
+    per_stripe = job_estimate.estimate_stripes(start_a, start_b, drop, geometry.cable_sepperation,
+                                               reverse=reverse, color_change=color_change)
+    # a mono layer with nothing to paint still gets its COLOR_CHANGE
+    extra_wait = job_estimate.COLOR_CHANGE_SECONDS * empty_layers
+    summary = job_estimate.summarize(per_stripe, drop, extra_wait)
+    return {
+        "stripes": summary["stripes"],
+        "painted_px": painted,
+        "total_drop_m": summary["paint_m"],
+        "est_time_s": summary["total_s"],
+        "mural_w_m": w * pixel_size,
+        "mural_h_m": h * pixel_size,
+    }
+
+
+def _sweep_group(job):
+    image_path, settings, width, number_of_colors, geometry_pairs, cache_dir = job
+    try:
+        stage_cache = image_cache.ImageStageCache(cache_dir) if cache_dir else None
+        processed = image_processing.ImagePipeline(
+            image_path, width, settings["color_mode"], number_of_colors, settings["n_value"],
+            cache=stage_cache, seed=settings["scatter_seed"],
+        ).run()
+        hex_codes, color_index_map = slice_mural.select_colors(processed)
+        skip_black = (settings["slicing_option"] == "multi color velocity slicing"
+                      and settings["color_mode"] in ('RGB', 'CMYK'))
+        indexer = palette.PaletteIndexer(color_index_map, skip_black=skip_black)
+        index_plane = indexer.index_plane(utils.load_image_array(processed))
+        rows = []
+        for pixel_size, num_nozzles in geometry_pairs:
+            row = {"width": width, "pixel_size": pixel_size, "Num_nozzles": num_nozzles,
+                   "number_of_colors": number_of_colors, "error": None}
+            row.update(score_plane(index_plane, hex_codes, settings, pixel_size, num_nozzles))
+            rows.append(row)
+        return rows
+    except Exception as e:
+        return [{"width": width, "pixel_size": pixel_size, "Num_nozzles": num_nozzles,
+                 "number_of_colors": number_of_colors, "error": f"{type(e).__name__}: {e}"}
+                for pixel_size, num_nozzles in geometry_pairs]
+
+
+def run_sweep(image_path, settings, widths, pixel_sizes, nozzles, colors, jobs=1, cache_dir=None):
+    """Score every combination; returns the rows sorted by estimated paint time."""
+    geometry_pairs = list(itertools.product(pixel_sizes, nozzles))
+    tasks = [(image_path, settings, width, number_of_colors, geometry_pairs, cache_dir)
+             for width, number_of_colors in itertools.product(widths, colors)]
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            groups = list(executor.map(_sweep_group, tasks))
+    else:
+        groups = [_sweep_group(task) for task in tasks]
+    rows = [row for group in groups for row in group]
+    return sorted(rows, key=lambda r: (r["error"] is not None, r.get("est_time_s", 0.0)))
+
+
+def print_table(rows):
+    header = f"{'width':>6} {'px size':>8} {'nozzles':>7} {'colors':>6} {'stripes':>7} {'drop m':>9} {'time min':>9} {'size m':>13}  painted px per color"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        prefix = f"{r['width']:>6} {r['pixel_size']:>8} {r['Num_nozzles']:>7} {r['number_of_colors']:>6}"
+        if r["error"]:
+            print(f"{prefix}  ERROR {r['error']}")
+            continue
+        minutes = r["est_time_s"] / 60.0
+        size = f"{r['mural_w_m']:.2f}x{r['mural_h_m']:.2f}"
+        painted = ", ".join(f"{c}:{n}" for c, n in r["painted_px"].items())
+        print(f"{prefix} {r['stripes']:>7} {r['total_drop_m']:>9.2f} {minutes:>9.1f} {size:>13}  {painted}")
+
+
+def write_csv(rows, csv_path):
+    colors = sorted({c for r in rows if not r["error"] for c in r["painted_px"]})
+    fields = ["width", "pixel_size", "Num_nozzles", "number_of_colors", "stripes",
+              "total_drop_m", "est_time_s", "mural_w_m", "mural_h_m", "error"]
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields + [f"px {c}" for c in colors])
+        for r in rows:
+            painted = r.get("painted_px", {})
+            writer.writerow([r.get(k, "") for k in fields] + [painted.get(c, 0) for c in colors])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep width / pixel size / nozzles / colors for one mural.")
+    parser.add_argument("settings", help="base settings JSON (same keys as settings.json)")
+    parser.add_argument("image", help="source image")
+    parser.add_argument("--width", type=int, nargs="+", help="mural widths in pixels")
+    parser.add_argument("--pixel-size", type=float, nargs="+", help="pixel sizes in meters")
+    parser.add_argument("--nozzles", type=int, nargs="+", help="Num_nozzles values")
+    parser.add_argument("--colors", type=int, nargs="+", help="number_of_colors values")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--cache-dir", help="image stage cache shared by the workers (temp dir when omitted)")
+    parser.add_argument("--csv", help="also write the table as CSV")
+    args = parser.parse_args(argv)
+
+    settings = slice_mural.load_settings_file(args.settings)
+    widths = args.width or [settings["width"]]
+    pixel_sizes = args.pixel_size or [settings["pixel_size"]]
+    nozzles = args.nozzles or [settings["Num_nozzles"]]
+    colors = args.colors or [settings["number_of_colors"]]
+
+    with tempfile.TemporaryDirectory(prefix="mural-sweep-") as temp_cache:
+        rows = run_sweep(args.image, settings, widths, pixel_sizes, nozzles, colors,
+                         jobs=args.jobs, cache_dir=args.cache_dir or temp_cache)
+    print_table(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
+        print(f"Sweep table written to {args.csv}")
+    return 1 if any(r["error"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+# Travel-minimizing order for point-mode output.
+#
+# Points are (A, B) cable lengths.  The cost of going from one point to the
+# next is the total cable-length change |dA| + |dB|.  A tour is built greedily
+# (nearest unvisited point, found through a grid of buckets over the A/B
+# plane) and then improved with a windowed 2-opt pass that reverses a
+# segment whenever that shortens the path.  The tour is an open path starting
+# at the first point of the original order.
+
+
+def travel(length_a, length_b):
+    """Total cable-length change of visiting the points in the given order."""
+    return float(np.abs(np.diff(length_a)).sum() + np.abs(np.diff(length_b)).sum())
+
+
+def nearest_neighbour_order(length_a, length_b, cell_size):
+    """Greedy tour: from each point go to the closest unvisited one.
+
+    The A/B plane is cut into ``cell_size`` squares; the search looks at
+    rings of cells around the current point until no closer point can lie
+    further out.
+    """
+    n = len(length_a)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+    cells_a = np.floor((length_a - length_a.min()) / cell_size).astype(np.int64)
+    cells_b = np.floor((length_b - length_b.min()) / cell_size).astype(np.int64)
+    buckets = {}
+    for i, key in enumerate(zip(cells_a.tolist(), cells_b.tolist())):
+        buckets.setdefault(key, []).append(i)
+    la = length_a.tolist()
+    lb = length_b.tolist()
+    max_ring = int(max(cells_a.max(), cells_b.max())) + 1
+
+    order = np.empty(n, dtype=np.intp)
+    current = 0
+    buckets[(int(cells_a[0]), int(cells_b[0]))].remove(0)
+    for step in range(1, n):
+        order[step - 1] = current
+        ca, cb = int(cells_a[current]), int(cells_b[current])
+        a, b = la[current], lb[current]
+        best = None
+        best_cost = float("inf")
+        for ring in range(max_ring + 1):
+            # any point in this ring is at least (ring - 1) cells away on one axis
+            if best is not None and (ring - 1) * cell_size > best_cost:
+                break
+            for da in range(-ring, ring + 1):
+                edge = abs(da) == ring
+                for db in (range(-ring, ring + 1) if edge else (-ring, ring)):
+                    bucket = buckets.get((ca + da, cb + db))
+                    if not bucket:
+                        continue
+                    for j in bucket:
+                        cost = abs(la[j] - a) + abs(lb[j] - b)
+                        if cost < best_cost:
+                            best, best_cost = j, cost
+        buckets[(int(cells_a[best]), int(cells_b[best]))].remove(best)
+        current = best
+    order[n - 1] = current
+    return order
+
+
+def two_opt(length_a, length_b, order, window=64, max_passes=4, min_edge=0.0):
+    """Improve ``order`` by reversing segments of up to ``window`` points.
+
+    For every edge (i, i+1) longer than ``min_edge`` all edges (j, j+1) with
+    i+1 < j < i+window are checked at once; the best improving reversal is
+    applied.  Edges between neighbouring pixels cannot get shorter, so
+    skipping them keeps the pass cheap on dense layers.  Stops after a pass
+    without improvement or ``max_passes`` passes.
+    """
+    order = np.array(order, dtype=np.intp)
+    a = length_a[order]
+    b = length_b[order]
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        edges = np.abs(np.diff(a)) + np.abs(np.diff(b))
+        for i in np.flatnonzero(edges[:n - 3] > min_edge).tolist():
+            if abs(a[i] - a[i + 1]) + abs(b[i] - b[i + 1]) <= min_edge:
+                continue
+            stop = min(i + window, n - 1)
+            j = np.arange(i + 2, stop)
+            if len(j) == 0:
+                continue
+            old = (abs(a[i] - a[i + 1]) + abs(b[i] - b[i + 1])
+                   + np.abs(a[j] - a[j + 1]) + np.abs(b[j] - b[j + 1]))
+            new = (np.abs(a[i] - a[j]) + np.abs(b[i] - b[j])
+                   + np.abs(a[i + 1] - a[j + 1]) + np.abs(b[i + 1] - b[j + 1]))
+            gain = old - new
+            k = int(np.argmax(gain))
+            if gain[k] > 1e-12:
+                j = int(j[k])
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1].copy()
+                a[i + 1:j + 1] = a[i + 1:j + 1][::-1].copy()
+                b[i + 1:j + 1] = b[i + 1:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def optimize_order(length_a, length_b, step, window=64, max_passes=4):
+    """Return (order, travel before, travel after) for the given points.
+
+    ``step`` is the pixel size: it sizes the search buckets and sets the
+    edge length below which 2-opt leaves an edge alone.
+    """
+    length_a = np.asarray(length_a, dtype=np.float64)
+    length_b = np.asarray(length_b, dtype=np.float64)
+    before = travel(length_a, length_b)
+    if len(length_a) < 3:
+        return np.arange(len(length_a)), before, before
+    # neighbouring pixels are at most 2 * step apart in |dA| + |dB|
+    order = nearest_neighbour_order(length_a, length_b, 2 * step)
+    order = two_opt(length_a, length_b, order, window, max_passes, min_edge=2 * step)
+    after = travel(length_a[order], length_b[order])
+    if after >= before:
+        # the column-by-column order was already at least as good
+        return np.arange(len(length_a)), before, before
+    return order, before, after
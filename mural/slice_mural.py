@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import palette
+import utils
+import image_cache
+import image_processing
+import instrumentation
+import multi_color_slicing
+import slicing_styles
+
+
+# Headless entry point: image + settings JSON (+ optional color-index map)
+# in, gcode out.  Runs the same image pipeline and slicers as mural gcode.py
+# but never opens a Tk window or imports matplotlib, so it can be scripted or
+# run many times in parallel on a build box.
+#
+#   python slice_mural.py settings.json mural.png -o gcode.txt
+#   python slice_mural.py settings.json a.png b.png c.png --out-dir out --jobs 3
+#
+# The settings file uses the same keys as settings.json; missing keys fall
+# back to utils.DEFAULT_SETTINGS.  The color-index map is a JSON object of
+# hex color -> nozzle index; without one every color in the processed image
+# is used, numbered like the color assignment window's auto-guess.
+
+END_MARKERS = {
+    "multi color velocity slicing": "END MULTI-COLOR VELOCITY SLICING",
+    "mono color velocity slicing": "END MONO COLOR VELOCITY SLICING",
+}
+
+
+def load_settings_file(settings_path):
+    settings = dict(utils.DEFAULT_SETTINGS)
+    if settings_path:
+        with open(settings_path, 'r') as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def load_color_index_map(map_path):
+    with open(map_path, 'r') as f:
+        raw = json.load(f)
+    return {hex_code.lower(): int(index) for hex_code, index in raw.items()}
+
+
+def select_colors(processed_image, color_index_map=None):
+    """Return (hex codes in nozzle order, color_index_map) without the Tk window."""
+    if color_index_map is None:
+        color_counts = palette.count_colors(utils.load_image_array(processed_image))
+        ordered = utils.auto_color_order(color_counts)
+        return ordered, {hex_code: i for i, hex_code in enumerate(ordered, start=1)}
+    ordered = sorted(color_index_map, key=lambda c: color_index_map[c])
+    return ordered, dict(color_index_map)
+
+
+def _slicing_finished(gcode_filepath, marker):
+    # The slicers report errors instead of raising, and their writer only
+    # commits complete sections, so a finished run ends with the END marker.
+    with open(gcode_filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 256))
+        return marker.encode('ascii') in f.read()
+
+
+def slice_mural(image_path, settings, gcode_filepath, color_index_map=None, cache_dir=None, dump_dir=None):
+    """Run the image pipeline and the configured slicer for one mural.
+
+    Returns the list of hex codes that were sliced.  Raises on any failure
+    so batch callers can tell which murals did not come out.
+    """
+    slicing_option = settings["slicing_option"]
+    if slicing_option not in END_MARKERS:
+        raise ValueError(f"Unsupported slicing option: {slicing_option}")
+
+    instrumentation.reset()
+    instrumentation.set_log_level(settings["log_level"])
+    stage_cache = None
+    if cache_dir and settings["image_cache_mb"] > 0:
+        stage_cache = image_cache.ImageStageCache(cache_dir, int(settings["image_cache_mb"] * 1024 * 1024))
+    pipeline = image_processing.ImagePipeline(
+        image_path, settings["width"], settings["color_mode"],
+        settings["number_of_colors"], settings["n_value"],
+        cache=stage_cache, dump_dir=dump_dir, seed=settings["scatter_seed"],
+    )
+    processed_image = pipeline.run()
+    selected_hex_codes, color_index_map = select_colors(processed_image, color_index_map)
+    if not selected_hex_codes:
+        raise ValueError(f"No colors to paint in {image_path}")
+
+    gcode_dir = os.path.dirname(os.path.abspath(gcode_filepath))
+    if not os.path.exists(gcode_dir):
+        os.makedirs(gcode_dir)
+    utils.create_text_file(gcode_filepath, settings["timing_summary"])
+
+    if slicing_option == "multi color velocity slicing":
+        # a fresh file always needs its own color mapping block
+        multi_color_slicing.HAS_PRINTED_COLOR_MAPPING = False
+        multi_color_slicing.generate_position_data_multi_color_velocity_once(
+            processed_image,
+            selected_hex_codes,
+            gcode_filepath,
+            settings["pixel_size"],
+            settings["cable_sepperation"],
+            settings["dist_from_pulley"],
+            settings["width"],
+            settings["Num_nozzles"],
+            settings["offset"],
+            color_index_map=color_index_map,
+            skip_black=settings["color_mode"] in ('RGB', 'CMYK'),
+            workers=settings["slicing_workers"],
+            incremental=settings["incremental_slicing"],
+            serpentine=settings["serpentine_stripes"],
+            trim=settings["trim_empty_stripes"],
+        )
+    else:
+        slicing_styles.generate_position_data_mono_velocity_sequential_colors(
+            processed_image,
+            selected_hex_codes,
+            gcode_filepath,
+            settings["dist_from_pulley"],
+            settings["cable_sepperation"],
+            settings["width"],
+            settings["pixel_size"],
+            settings["Num_nozzles"],
+            settings["offset"],
+            workers=settings["slicing_workers"],
+            incremental=settings["incremental_slicing"],
+            serpentine=settings["serpentine_stripes"],
+            trim=settings["trim_empty_stripes"],
+        )
+
+    if not _slicing_finished(gcode_filepath, END_MARKERS[slicing_option]):
+        raise RuntimeError(f"Slicing {image_path} failed; see the messages above")
+    if settings["timing_summary"]:
+        instrumentation.write_summary(gcode_filepath)
+    instrumentation.print_summary()
+    return selected_hex_codes
+
+
+def _slice_job(job):
+    image_path, settings, gcode_filepath, color_index_map, cache_dir, dump_dir = job
+    try:
+        colors = slice_mural(image_path, settings, gcode_filepath, color_index_map, cache_dir, dump_dir)
+        return image_path, gcode_filepath, colors, None
+    except Exception as e:
+        return image_path, gcode_filepath, None, f"{type(e).__name__}: {e}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Slice murals to gcode without the GUI.")
+    parser.add_argument("settings", help="settings JSON (same keys as settings.json)")
+    parser.add_argument("images", nargs="+", help="source image(s)")
+    parser.add_argument("-o", "--output", help="gcode file (single image only)")
+    parser.add_argument("--out-dir", help="directory for <image name>.txt gcode files")
+    parser.add_argument("--color-map", help="JSON object of hex color -> nozzle index")
+    parser.add_argument("--cache-dir", help="image stage cache directory (off when omitted)")
+    parser.add_argument("--dump-dir", help="write intermediate images here (single image only)")
+    parser.add_argument("--jobs", type=int, default=1, help="murals to slice in parallel")
+    parser.add_argument("--log-level", choices=sorted(instrumentation.LEVELS),
+                        help="override the settings file's log_level")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.images) > 1:
+        parser.error("--output takes a single image; use --out-dir for several")
+    if not args.output and not args.out_dir:
+        parser.error("give --output or --out-dir")
+    if args.dump_dir and len(args.images) > 1:
+        parser.error("--dump-dir takes a single image")
+
+    settings = load_settings_file(args.settings)
+    if args.log_level:
+        settings["log_level"] = args.log_level
+    color_index_map = load_color_index_map(args.color_map) if args.color_map else None
+
+    jobs = []
+    for image_path in args.images:
+        if args.output:
+            gcode_filepath = args.output
+        else:
+            name = os.path.splitext(os.path.basename(image_path))[0]
+            gcode_filepath = os.path.join(args.out_dir, name + ".txt")
+        jobs.append((image_path, settings, gcode_filepath, color_index_map, args.cache_dir, args.dump_dir))
+
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(_slice_job, jobs))
+    else:
+        results = [_slice_job(job) for job in jobs]
+
+    failed = 0
+    for image_path, gcode_filepath, colors, error in results:
+        if error:
+            failed += 1
+            print(f"FAILED {image_path}: {error}")
+        else:
+            print(f"OK     {image_path} -> {gcode_filepath} ({len(colors)} colors)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
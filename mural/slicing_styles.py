@@ -1,8 +1,20 @@
 from PIL import Image
-import json
+import numpy as np
 import random
 import os
+import functools
 import utils
+import palette
+import stripe_engine
+import gcode_writer
+import stripe_cache
+import instrumentation
+import kinematics
+import path_order
+
+
+# Lines formatted per write in point mode (generate_position_data).
+POSITION_BLOCK_LINES = 65536
 
 
 def generate_column_pattern(img, column_index, num_nozzles):
@@ -23,84 +35,145 @@ def generate_column_pattern(img, column_index, num_nozzles):
     return patterns
 
 
-def generate_position_data(hex_path, hex_code, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, offset, num_nozzles):
+def generate_position_data(hex_path, hex_code, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, offset, num_nozzles, length_grid_path=None, optimize_order=False):
+    """Append one '(A,B),(x,y),hex' line per opaque pixel of ``hex_path``.
+
+    Pixels go column by column, top to bottom, with y counted up from the
+    bottom row.  The opaque pixels are picked with a mask, their lengths come
+    from one ``kinematics.PulleyGeometry.lengths`` call and the lines are
+    written in blocks of ``POSITION_BLOCK_LINES``.
+
+    With ``length_grid_path`` the (A, B) lengths of every pixel center are
+    also saved there as a float32 .npy grid (see ``kinematics.length_grid``)
+    that other tools can open with ``kinematics.load_length_grid``; the
+    gcode lines themselves keep the integer pixel coordinates.
+
+    With ``optimize_order`` the points are reordered to cut the total cable
+    travel between them (see ``path_order``) and the before/after travel is
+    printed.
+    """
     try:
         img = Image.open(hex_path).convert('RGBA')
         w, h = img.size
-
-        with open(gcode_filepath, 'a') as f:
+        alpha = np.asarray(img)[:, :, 3]
+
+        # transposed so nonzero() walks x outer, y inner like the gcode
+        xs, rows = np.nonzero(alpha.T)
+        y_flipped = (h - 1) - rows
+        geometry = kinematics.PulleyGeometry(pixel_size, dist_from_pulley, cable_sepperation, width, offset)
+        if length_grid_path:
+            kinematics.save_length_grid(length_grid_path, kinematics.length_grid(geometry, h, w))
+        length_a_values, length_b_values = geometry.lengths(xs, y_flipped)
+
+        if optimize_order:
+            order, before, after = path_order.optimize_order(length_a_values, length_b_values, pixel_size)
+            xs, y_flipped = xs[order], y_flipped[order]
+            length_a_values, length_b_values = length_a_values[order], length_b_values[order]
+            saved = (1 - after / before) * 100 if before else 0.0
+            print(f"Point order for {hex_code}: cable travel {before:.2f} m -> {after:.2f} m ({saved:.1f}% less)")
+
+        with gcode_writer.GcodeWriter(gcode_filepath, append=True) as f:
             f.write(f"change color to:{hex_code}\n")
-            for x in range(w):
-                for y in range(h):
-                    r, g, b, a = img.getpixel((x, y))
-                    if a != 0:
-                        y_flipped = h - 1 - y
-                        length_a_value = utils.length_a(x, y_flipped, dist_from_pulley, cable_sepperation, width, pixel_size, offset)
-                        length_b_value = utils.length_b(x, y_flipped, dist_from_pulley, cable_sepperation, width, pixel_size, offset)
-                        f.write(f"({length_a_value},{length_b_value}),({x},{y_flipped}),{hex_code}\n")
+            for start in range(0, len(xs), POSITION_BLOCK_LINES):
+                block = slice(start, start + POSITION_BLOCK_LINES)
+                f.write("".join(
+                    f"({la},{lb}),({x},{y}),{hex_code}\n"
+                    for la, lb, x, y in zip(length_a_values[block].tolist(), length_b_values[block].tolist(),
+                                            xs[block].tolist(), y_flipped[block].tolist())
+                ))
 
         print(f"Position data has been appended to {gcode_filepath}")
     except Exception as e:
         print(f"Error generating position data: {e}")
 
 
-def generate_position_data_mono_velocity_sequential_colors(hex_paths_and_codes, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, num_nozzles, offset=0.0):
+def generate_position_data_mono_velocity_sequential_colors(simplified_image_path, hex_codes, gcode_filepath, dist_from_pulley, cable_sepperation, width, pixel_size, num_nozzles, offset=0.0, workers=None, incremental=False, serpentine=False, trim=False):
     """
-    hex_paths_and_codes: list of (hex_path, hex_code) tuples, one per color.
+    hex_codes: list of hex color strings, painted one after another.
 
     Writes one STRIPE block per column.  Inside each stripe all colors are
     handled sequentially with a 'change color to:' line followed by a pattern
     array.  Pattern characters: '1' = paint this color, 'x' = skip.
     Format mirrors the multi-color gcode so the two outputs are consistent.
+
+    The processed image is indexed once with a ``PaletteIndexer``; each color
+    layer is then a comparison against that index plane rather than a
+    separate per-color image.  With ``workers`` > 1 the stripes are rendered
+    on a process pool (see ``stripe_engine.ParallelStripeRenderer``); the file
+    is identical either way.
+
+    With ``incremental`` set only stripes whose fingerprint changed since the
+    last slice are rendered (see ``stripe_cache.StripeCache``); returns
+    {hex_code: changed stripe numbers} in that case.
+
+    With ``serpentine`` set every other stripe of each color layer is written
+    bottom to top.  With ``trim`` set a layer's stripes without that color
+    are left out and the rest are cut to their first and last painted rows
+    (see ``stripe_engine.stripe_layout``).
     """
+    instrumentation.reset(instrumentation.SLICE_STAGES)
     try:
-        color_images = []
-        for hex_path, hex_code in hex_paths_and_codes:
-            img = Image.open(hex_path).convert('RGBA')
-            color_images.append((img, hex_code))
-
-        if not color_images:
+        if not hex_codes:
             print("No color images to process.")
             return
 
-        w, h = color_images[0][0].size
+        pixels = utils.load_image_array(simplified_image_path)
+        h, w = pixels.shape[:2]
         number_of_drawn_columns = w // num_nozzles
-
-        with open(gcode_filepath, 'a') as f:
+        with instrumentation.span("palette"):
+            index_plane = palette.PaletteIndexer.from_hex_codes(hex_codes).index_plane(pixels)
+        geometry = (pixel_size, dist_from_pulley, cable_sepperation, offset)
+
+        cache = stripe_cache.StripeCache(gcode_filepath, "mono") if incremental else None
+
+        def plan_layer(color_number, hex_code):
+            """Layout of one color layer, the columns to render and the layer's fingerprints."""
+            layer_mask = index_plane == color_number
+            layout = stripe_engine.stripe_layout(layer_mask, num_nozzles, number_of_drawn_columns,
+                                                 serpentine=serpentine, trim=trim)
+            if cache is None:
+                return layout, range(number_of_drawn_columns), None
+            fingerprints = stripe_cache.stripe_fingerprints(layer_mask, num_nozzles, number_of_drawn_columns,
+                                                            geometry, layout)
+            return layout, cache.changed(hex_code, fingerprints), fingerprints
+
+        def layer_stripes(hex_code, fingerprints, stripes):
+            stripes = instrumentation.counted("stripes_rendered", stripes)
+            if cache is None:
+                return stripes
+            return cache.merge(hex_code, fingerprints, stripes)
+
+        def serial_stripes(color_number, columns, layout):
+            layer = stripe_engine.color_layer_tokens(index_plane, color_number)
+            for c in columns:
+                yield stripe_engine.render_stripe(layer, c, c, layout[c], num_nozzles, h, w, geometry)
+
+        with instrumentation.span("slice"), gcode_writer.GcodeWriter(gcode_filepath, append=True) as f:
             f.write(f"number of drawn columns = {number_of_drawn_columns}\n")
             f.write(f"pulley spacing = {cable_sepperation}\n")
             f.write("BEGIN MONO COLOR VELOCITY SLICING\n")
 
-            for img, hex_code in color_images:
-                f.write(f"change color to:{hex_code}\n")
-
-                for c in range(number_of_drawn_columns):
-                    f.write(f"STRIPE - column #{c + 1}\n")
-
-                    start_x = (c * num_nozzles) + (num_nozzles // 2)
-                    f.write(f"starting/ending position pixel values:  ({start_x},{h}),({start_x},{0})\n")
-
-                    col_start = num_nozzles * c
-                    patterns = []
-                    for y in range(h):
-                        row_pattern = ""
-                        for nozzle_idx in range(num_nozzles):
-                            x_coord = col_start + nozzle_idx
-                            if x_coord < 0 or x_coord >= w:
-                                row_pattern += "x"
-                                continue
-                            r, g, b, a = img.getpixel((x_coord, y))
-                            row_pattern += "1" if a > 0 else "x"
-                        patterns.append(row_pattern)
-                    f.write('pattern: ' + json.dumps(patterns) + "\n")
-
-                    drop_val = pixel_size * h
-                    f.write(f"drop: {drop_val}\n")
-                    la = round(utils.length_a(start_x, h, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
-                    lb = round(utils.length_b(start_x, h, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
-                    f.write(f"starting pulley values:  {la},{lb}\n")
+            if workers and workers > 1:
+                with stripe_engine.ParallelStripeRenderer(index_plane, num_nozzles, geometry, workers) as renderer:
+                    for color_number, hex_code in enumerate(hex_codes, start=1):
+                        f.write(f"change color to:{hex_code}\n")
+                        layout, columns, fingerprints = plan_layer(color_number, hex_code)
+                        token_fn = functools.partial(stripe_engine.color_layer_tokens, color_number=color_number)
+                        stripes = renderer.render(token_fn, number_of_drawn_columns, columns, layout)
+                        f.write_stripes(layer_stripes(hex_code, fingerprints, stripes))
+            else:
+                for color_number, hex_code in enumerate(hex_codes, start=1):
+                    f.write(f"change color to:{hex_code}\n")
+                    layout, columns, fingerprints = plan_layer(color_number, hex_code)
+                    f.write_stripes(layer_stripes(hex_code, fingerprints, serial_stripes(color_number, columns, layout)))
 
             f.write("END MONO COLOR VELOCITY SLICING\n")
+        instrumentation.record("write", f.write_seconds, f.flush_count)
+
+        if cache is not None:
+            cache.save()
+            cache.report()
+            return cache.changed_stripes
 
     except Exception as e:
         print(f"Error generating position data: {e}")
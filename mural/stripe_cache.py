@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import gcode_writer
+import instrumentation
+
+
+# Incremental re-slicing. Every stripe gets a fingerprint made from its block
+# of the (index or color-layer) plane plus every input of length_a/length_b,
+# and the fingerprints and STRIPE text of the last slice are kept next to the
+# gcode file. On the next slice only stripes whose fingerprint changed are
+# rendered again; the rest are copied from the cache.
+
+CACHE_SUFFIX = ".stripes.json"
+CACHE_VERSION = 1
+
+
+def stripe_fingerprints(plane, num_nozzles, number_of_drawn_columns, geometry, layout=None):
+    """Return one hex fingerprint per stripe of ``plane``.
+
+    ``geometry`` is ``(pixel_size, dist_from_pulley, cable_sepperation,
+    offset)``; together with the column index, stripe width and image size it
+    covers everything the pulley values depend on.  ``layout`` is the
+    ``stripe_engine.stripe_layout`` of the slice: a stripe's span and
+    direction can change with other columns (serpentine parity), so they are
+    hashed too whenever they differ from the plain full-height stripe.
+    """
+    h, w = plane.shape[:2]
+    full_span = (0, h - 1, False)
+    fingerprints = []
+    for c in range(number_of_drawn_columns):
+        block = np.ascontiguousarray(plane[:, c * num_nozzles:(c + 1) * num_nozzles])
+        digest = hashlib.blake2b(block.tobytes(), digest_size=16)
+        digest.update(repr((str(block.dtype), c, num_nozzles, h, w, tuple(geometry))).encode('ascii'))
+        if layout is not None and layout[c] != full_span:
+            digest.update(repr(layout[c]).encode('ascii'))
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+class StripeCache:
+    """Fingerprints and STRIPE text from the previous slice of one gcode file.
+
+    The cache lives in ``<gcode_filepath>.stripes.json`` and keeps one entry
+    per slicing ``mode`` ("multi", "mono"), each split into named sections
+    (one per color layer for mono).  Use ``changed`` to find the stripes that
+    need rendering, ``merge`` to interleave fresh and cached text in column
+    order, then ``save`` once the gcode has been written.
+    """
+
+    def __init__(self, gcode_filepath, mode):
+        self.path = gcode_filepath + CACHE_SUFFIX
+        self.mode = mode
+        self._all_modes = {}
+        self.previous = {}
+        self.current = {}
+        self.changed_stripes = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self._all_modes = data.get("modes", {})
+                    self.previous = self._all_modes.get(mode, {})
+            except Exception as e:
+                print(f"Could not load stripe cache, re-slicing every stripe: {e}")
+
+    def changed(self, section, fingerprints):
+        """Return the column indices whose fingerprint differs from the last slice."""
+        old = self.previous.get(section, {}).get("fingerprints", [])
+        columns = [c for c, fp in enumerate(fingerprints) if c >= len(old) or old[c] != fp]
+        self.changed_stripes[section] = [c + 1 for c in columns]
+        return columns
+
+    def merge(self, section, fingerprints, rendered):
+        """Yield every stripe in column order, taking changed ones from ``rendered``.
+
+        ``rendered`` must produce the text of the columns returned by
+        ``changed`` in ascending order.
+        """
+        changed = set(c - 1 for c in self.changed_stripes[section])
+        old_stripes = self.previous.get(section, {}).get("stripes", [])
+        rendered = iter(rendered)
+        stripes = []
+        for c in range(len(fingerprints)):
+            if c in changed:
+                text = next(rendered)
+            else:
+                text = old_stripes[c]
+                instrumentation.count("stripes_reused")
+            stripes.append(text)
+            yield text
+        self.current[section] = {"fingerprints": list(fingerprints), "stripes": stripes}
+
+    def report(self):
+        """Print which stripe numbers were re-rendered, per section."""
+        for section, numbers in self.changed_stripes.items():
+            total = len(self.current.get(section, {}).get("fingerprints", []))
+            label = self.mode if section == "" else f"{self.mode} {section}"
+            if numbers:
+                print(f"Re-sliced {len(numbers)} of {total} stripes ({label}): {numbers}")
+            else:
+                print(f"No stripes changed ({label}); reused all {total} from the cache.")
+
+    def save(self):
+        self._all_modes[self.mode] = self.current
+        try:
+            with gcode_writer.GcodeWriter(self.path) as writer:
+                writer.write(json.dumps({"version": CACHE_VERSION, "modes": self._all_modes}))
+        except Exception as e:
+            print(f"Could not save stripe cache: {e}")
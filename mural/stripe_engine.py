@@ -0,0 +1,219 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import utils
+
+
+# Stripe rendering shared by the velocity slicers. A slicer reduces the
+# processed image to a uint8 index plane (see palette.PaletteIndexer), picks a
+# token function that turns a slice of that plane into pattern characters,
+# and lets this module produce the STRIPE blocks -- serially or on a process
+# pool that reads the plane from shared memory.
+
+# Header flag of a stripe painted bottom to top (serpentine order).  The
+# firmware checks for it to run the stripe upward.
+REVERSE_SUFFIX = " (reverse)"
+
+
+def stripe_rows(plane, column_index, num_nozzles):
+    """Return the pattern rows (top to bottom) for one stripe of ``plane``."""
+    col_start = num_nozzles * column_index
+    block = plane[:, col_start:col_start + num_nozzles]
+    if block.dtype == np.dtype('S1'):
+        rows = np.ascontiguousarray(block).view(f'S{num_nozzles}').ravel()
+        return [row.decode('ascii') for row in rows.tolist()]
+    return ["".join(row) for row in block.tolist()]
+
+
+def format_pattern_rows(rows):
+    """Serialize pattern rows exactly like ``json.dumps`` does for plain tokens."""
+    if not rows:
+        return "[]"
+    return '["' + '", "'.join(rows) + '"]'
+
+
+def color_layer_tokens(index_plane, color_number):
+    """Mono-color tokens: '1' where the plane holds ``color_number``, else 'x'."""
+    return np.where(index_plane == color_number, b"1", b"x").astype('S1')
+
+
+def stripe_layout(paint_mask, num_nozzles, number_of_drawn_columns, serpentine=False, trim=False):
+    """Return one ``(first_row, last_row, reverse)`` span per stripe, or None to skip it.
+
+    ``paint_mask`` is an ``(h, w)`` bool array of the pixels this layer paints.
+    Without options every stripe covers all rows top to bottom.  With
+    ``trim`` stripes without paint are skipped and the rest are cut down to
+    their first and last painted rows.  With ``serpentine`` every other
+    written stripe is painted bottom to top.
+    """
+    h = paint_mask.shape[0]
+    if trim:
+        block = paint_mask[:, :number_of_drawn_columns * num_nozzles]
+        painted_rows = block.reshape(h, number_of_drawn_columns, num_nozzles).any(axis=2)
+        has_paint = painted_rows.any(axis=0)
+        first_rows = painted_rows.argmax(axis=0)
+        last_rows = h - 1 - painted_rows[::-1].argmax(axis=0)
+        spans = [(first, last) if painted else None
+                 for first, last, painted in zip(first_rows.tolist(), last_rows.tolist(), has_paint.tolist())]
+    else:
+        spans = [(0, h - 1)] * number_of_drawn_columns
+    layout = []
+    written = 0
+    for span in spans:
+        if span is None:
+            layout.append(None)
+            continue
+        layout.append(span + (serpentine and written % 2 == 1,))
+        written += 1
+    return layout
+
+
+def render_stripe(tokens, column_index, local_index, span, num_nozzles, h, w, geometry):
+    """STRIPE block of column ``column_index`` (column ``local_index`` of ``tokens``).
+
+    ``span`` comes from ``stripe_layout``; None means the stripe is skipped
+    and gives an empty string.
+    """
+    if span is None:
+        return ""
+    first, last, reverse = span
+    rows = stripe_rows(tokens[first:last + 1], local_index, num_nozzles)
+    return format_stripe(column_index, rows, num_nozzles, h, w, *geometry, reverse=reverse, first_row=first)
+
+
+def format_stripe(column_index, rows, num_nozzles, h, w, pixel_size, dist_from_pulley, cable_sepperation, offset, reverse=False, first_row=0):
+    """Return the full text block (header, pattern, drop, pulley values) for one stripe.
+
+    ``rows`` run top to bottom starting at image row ``first_row``; the drop
+    covers exactly those rows.  A ``reverse`` stripe starts at the bottom of
+    its rows and is painted upward: its rows are listed bottom to top and the
+    pulley values are those of the bottom end.
+    """
+    start_x = (column_index * num_nozzles) + (num_nozzles // 2)
+    top_y = h - first_row
+    bottom_y = top_y - len(rows)
+    start_y, end_y = (bottom_y, top_y) if reverse else (top_y, bottom_y)
+    la = round(utils.length_a(start_x, start_y, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
+    lb = round(utils.length_b(start_x, start_y, dist_from_pulley, cable_sepperation, w, pixel_size, offset), 6)
+    drop_val = pixel_size * len(rows)
+    if reverse:
+        rows = rows[::-1]
+    return format_stripe_block(column_index + 1, (start_x, start_y), (start_x, end_y), rows, drop_val, la, lb, reverse)
+
+
+def format_stripe_block(column_number, start, end, rows, drop_val, la, lb, reverse=False):
+    """Lay out one STRIPE block from already computed values.
+
+    ``column_number`` is the 1-based number printed in the header and
+    ``start``/``end`` are the (x, y) pixel positions of the stripe ends.
+    ``reverse`` adds the REVERSE_SUFFIX flag to the header.
+    """
+    suffix = REVERSE_SUFFIX if reverse else ""
+    return (
+        f"STRIPE - column #{column_number}{suffix}\n"
+        f"starting/ending position pixel values:  ({start[0]},{start[1]}),({end[0]},{end[1]})\n"
+        'pattern: ' + format_pattern_rows(rows) + "\n"
+        f"drop: {drop_val}\n"
+        f"starting pulley values:  {la},{lb}\n"
+    )
+
+
+def render_column_range(index_plane, token_fn, start, stop, num_nozzles, w, geometry, spans=None):
+    """Render stripes ``start``..``stop - 1`` of ``index_plane``, one string per stripe.
+
+    Only the columns covered by the range are tokenized.  ``geometry`` is
+    ``(pixel_size, dist_from_pulley, cable_sepperation, offset)`` and
+    ``spans`` the ``stripe_layout`` entries of the range, if any.
+    """
+    h = index_plane.shape[0]
+    tokens = token_fn(index_plane[:, start * num_nozzles:stop * num_nozzles])
+    if spans is None:
+        spans = [(0, h - 1, False)] * (stop - start)
+    return [
+        render_stripe(tokens, c, c - start, span, num_nozzles, h, w, geometry)
+        for c, span in zip(range(start, stop), spans)
+    ]
+
+
+# Per-process state for pool workers, filled in by _init_worker.
+_worker_shm = None
+_worker_plane = None
+_worker_args = None
+
+
+def _init_worker(shm_name, shape, num_nozzles, w, geometry):
+    global _worker_shm, _worker_plane, _worker_args
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_plane = np.ndarray(shape, dtype=np.uint8, buffer=_worker_shm.buf)
+    _worker_args = (num_nozzles, w, geometry)
+
+
+def _render_task(task):
+    token_fn, start, stop, spans = task
+    num_nozzles, w, geometry = _worker_args
+    return render_column_range(_worker_plane, token_fn, start, stop, num_nozzles, w, geometry, spans)
+
+
+class ParallelStripeRenderer:
+    """Process pool that renders stripes from an index plane in shared memory.
+
+    The plane is copied once into a ``SharedMemory`` block that every worker
+    maps read-only, so only column ranges and token functions cross the
+    process boundary.  ``render`` yields the stripe text in column order no
+    matter which worker finishes first.  Use as a context manager so the pool
+    and the shared block are always released.
+
+    Worker processes import the calling script, so scripts that use this must
+    keep their top-level work behind ``if __name__ == "__main__":``.
+    """
+
+    def __init__(self, index_plane, num_nozzles, geometry, workers):
+        index_plane = np.ascontiguousarray(index_plane, dtype=np.uint8)
+        self.shape = index_plane.shape
+        self.num_nozzles = num_nozzles
+        self.workers = workers
+        self.shm = shared_memory.SharedMemory(create=True, size=max(index_plane.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)[...] = index_plane
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.shm.name, self.shape, num_nozzles, self.shape[1], geometry),
+        )
+
+    def render(self, token_fn, number_of_drawn_columns, columns=None, layout=None):
+        """Yield the STRIPE block of every column (or only of ``columns``) in order.
+
+        ``layout`` is the ``stripe_layout`` of all columns; skipped stripes
+        come out as empty strings.
+        """
+        if columns is None:
+            columns = range(number_of_drawn_columns)
+        columns = sorted(columns)
+        # A few ranges per worker keeps the pool busy when stripes differ in cost.
+        chunk = max(1, math.ceil(len(columns) / (self.workers * 4)))
+        tasks = []
+        run_start = None
+        for i, c in enumerate(columns):
+            if run_start is None:
+                run_start = c
+            last = i + 1 == len(columns) or columns[i + 1] != c + 1
+            if last or c + 1 - run_start >= chunk:
+                spans = None if layout is None else layout[run_start:c + 1]
+                tasks.append((token_fn, run_start, c + 1, spans))
+                run_start = None
+        for stripes in self.executor.map(_render_task, tasks):
+            yield from stripes
+
+    def close(self):
+        self.executor.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import gcode_compiler
+import slice_mural
+
+
+def _slice(tmp_path, **overrides):
+    image_path = tmp_path / "mural.png"
+    if not image_path.exists():
+        pixels = np.full((16, 24, 3), 255, dtype=np.uint8)
+        pixels[2:14, 1:9] = (0, 0, 0)
+        pixels[4:12, 9:17] = (255, 107, 82)
+        pixels[6:16, 17:23] = (40, 90, 200)
+        Image.fromarray(pixels).save(image_path)
+    settings = slice_mural.load_settings_file(None)
+    settings.update({"width": 24, "number_of_colors": 4, "slicing_workers": 1, "image_cache_mb": 0,
+                     "log_level": "silent"})
+    settings.update(overrides)
+    gcode_path = tmp_path / f"gcode_{len(list(tmp_path.glob('gcode_*.txt')))}.txt"
+    slice_mural.slice_mural(str(image_path), settings, str(gcode_path))
+    return gcode_path
+
+
+def _round_trip(text_path):
+    compiled_path = text_path.with_suffix(".cmp")
+    count = gcode_compiler.compile_gcode(str(text_path), str(compiled_path))
+    expected = gcode_compiler.parse_commands(str(text_path))
+    assert count == len(expected.commands)
+    assert gcode_compiler.read_compiled(str(compiled_path)) == expected
+    assert gcode_compiler.verify_compiled(str(text_path), str(compiled_path)) == []
+    return expected
+
+
+def test_record_size():
+    assert gcode_compiler.COMMAND_RECORD.size == 32
+
+
+def test_round_trip_multi_color(tmp_path):
+    gcode = _round_trip(_slice(tmp_path))
+    assert gcode.commands
+    assert all(cmd.type == gcode_compiler.COMMAND_STRIPE for cmd in gcode.commands)
+
+
+def test_round_trip_mono_with_color_changes(tmp_path):
+    gcode = _round_trip(_slice(tmp_path, slicing_option="mono color velocity slicing"))
+    kinds = {cmd.type for cmd in gcode.commands}
+    assert kinds == {gcode_compiler.COMMAND_COLOR_CHANGE, gcode_compiler.COMMAND_STRIPE}
+
+
+def test_round_trip_serpentine(tmp_path):
+    gcode = _round_trip(_slice(tmp_path, serpentine_stripes=True, trim_empty_stripes=True))
+    assert any(cmd.name.endswith("(reverse)") for cmd in gcode.commands)
+
+
+def _write_stripe(path, rows):
+    path.write_text(
+        "number of drawn columns = 1\n"
+        "pulley spacing = 4.6\n"
+        "STRIPE - column #1\n"
+        f"pattern: {rows}\n".replace("'", '"') +
+        "drop: 0.1\n"
+        "starting pulley values:  3.0,3.1\n"
+    )
+
+
+@pytest.mark.parametrize("rows", [
+    ["x1x1", "x1x"],          # ragged
+    ["x1a1"],                 # nozzle index above 9
+    ["x" * 0x10000],          # wider than a record can describe
+])
+def test_unpackable_pattern_raises(tmp_path, rows):
+    text_path = tmp_path / "gcode.txt"
+    _write_stripe(text_path, rows)
+    with pytest.raises(ValueError):
+        gcode_compiler.compile_gcode(str(text_path), str(tmp_path / "gcode.cmp"))
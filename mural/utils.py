@@ -1,13 +1,48 @@
 import os
 import math
-import webcolors
+import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
 from datetime import datetime
+import palette
+import gcode_writer
+import instrumentation
 
 
 # Utilities extracted from the main script. These functions are pure helpers and
-# accept explicit parameters to avoid relying on globals.
+# accept explicit parameters to avoid relying on globals. Tk, matplotlib and
+# webcolors are imported inside the functions that need them so headless runs
+# (slice_mural.py) never load them.
+
+
+# Settings used when settings.json (or a headless settings file) leaves a key out.
+DEFAULT_SETTINGS = {
+    "file_path": r"C:/Users/oewil/OneDrive/Desktop/Mural-Bot/mural/imput images/jules eye 257 wide.jpg",
+    "width": 310,
+    "pixel_size": 0.01,
+    "cable_sepperation": 4.6,
+    "dist_from_pulley": 4.2,
+    "floor_dist_from_pulleys": 6.0,
+    "chassis_length_below_nozzles": 0.3,
+    "offset": 0.0,
+    "color_mode": "Simplify Image",
+    "number_of_colors": 2,
+    "n_value": 3,
+    "scatter_seed": 0,
+    "peak_velocity": 0.5,
+    "slicing_option": "multi color velocity slicing",
+    "Num_nozzles": 8,
+    "slicing_workers": 1,
+    "incremental_slicing": False,
+    "serpentine_stripes": False,
+    "trim_empty_stripes": False,
+    "image_cache_mb": 512,
+    "debug_dump_images": False,
+    "log_level": "info",
+    "timing_summary": False,
+    "length_grid": False,
+    "optimize_point_order": False,
+    "notes": "horizontal sep = 12mm, vertical sep = 20mm\nwall width 9ft → 228px at 12mm/px\nJules eye temp target 257px\n",
+}
 
 
 def validate_image(file_path):
@@ -20,25 +55,51 @@ def validate_image(file_path):
         return False
 
 
-def create_text_file(file_path):
+def load_image_array(image):
+    """Return an image as an ``(h, w, 4)`` uint8 RGBA array.
+
+    ``image`` may be a file path, a PIL image (e.g. from
+    ``image_processing.ImagePipeline``) or an array that is already RGBA.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('RGBA'))
+    with Image.open(image) as img:
+        return np.asarray(img.convert('RGBA'))
+
+
+def create_text_file(file_path, timing_summary=False):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    starting_lines = ["//this is the start of the gcode", f"// generated {timestamp}", "\n"]
+    starting_lines = ["//this is the start of the gcode", f"// generated {timestamp}"]
+    if timing_summary:
+        # filled in by instrumentation.write_summary once the run is over
+        starting_lines += instrumentation.summary_placeholder()
+    starting_lines.append("\n")
 
-    with open(file_path, 'w') as file:
+    with gcode_writer.GcodeWriter(file_path) as writer:
         for line in starting_lines:
-            file.write(line + '\n')
+            writer.write_line(line)
     print(f"File created and written to {file_path}")
 
 
 def append_to_text_file(line, gcode_filepath):
+    """Append a single line. Slicers stream through ``gcode_writer.GcodeWriter``
+    instead; this is only for one-off lines."""
     with open(gcode_filepath, 'a') as file:
         file.write(line + '\n')
     print(f"Line appended to {gcode_filepath}")
 
 
-def generate_preview_image(processed_image_path):
+def generate_preview_image(processed_image):
+    import matplotlib.pyplot as plt
     try:
-        with Image.open(processed_image_path) as img:
+        if isinstance(processed_image, Image.Image):
+            plt.imshow(processed_image)
+            plt.axis('off')
+            plt.show()
+            return
+        with Image.open(processed_image) as img:
             plt.imshow(img)
             plt.axis('off')
             plt.show()
@@ -50,16 +111,17 @@ def length_a(x, y, dist_from_pulley, cable_sepperation, width, pixel_size, offse
     y_component = dist_from_pulley - y * pixel_size
     x_horizontal_no_offset = (cable_sepperation / 2) - ((width * pixel_size) / 2) + x * pixel_size
     x_horizontal = x_horizontal_no_offset + offset
-    length_A = math.sqrt(y_component ** 2 + x_horizontal ** 2)
-
-    print(f"\n    length_a calculation:")
-    print(f"      y_component = dist_from_pulley - y*pixel_size = {dist_from_pulley} - {y}*{pixel_size} = {y_component:.4f}")
-    print(f"      x_horizontal (no offset) = (cable_sep/2) - (width*pixel_size/2) + x*pixel_size")
-    print(f"               = ({cable_sepperation/2:.2f}) - ({width * pixel_size / 2:.4f}) + {x * pixel_size:.4f}")
-    print(f"               = {x_horizontal_no_offset:.4f}")
-    print(f"      apply offset: x_horizontal = x_horizontal_no_offset + offset = {x_horizontal_no_offset:.4f} + {offset:.4f} = {x_horizontal:.4f}")
-    print(f"      (positive offset shifts image right of center)")
-    print(f"      length_A = sqrt({y_component:.4f}² + {x_horizontal:.4f}²) = sqrt({y_component**2:.6f} + {x_horizontal**2:.6f}) = {length_A:.6f}")
+    length_A = math.sqrt(y_component * y_component + x_horizontal * x_horizontal)
+
+    if instrumentation.debug_enabled():
+        print(f"\n    length_a calculation:")
+        print(f"      y_component = dist_from_pulley - y*pixel_size = {dist_from_pulley} - {y}*{pixel_size} = {y_component:.4f}")
+        print(f"      x_horizontal (no offset) = (cable_sep/2) - (width*pixel_size/2) + x*pixel_size")
+        print(f"               = ({cable_sepperation/2:.2f}) - ({width * pixel_size / 2:.4f}) + {x * pixel_size:.4f}")
+        print(f"               = {x_horizontal_no_offset:.4f}")
+        print(f"      apply offset: x_horizontal = x_horizontal_no_offset + offset = {x_horizontal_no_offset:.4f} + {offset:.4f} = {x_horizontal:.4f}")
+        print(f"      (positive offset shifts image right of center)")
+        print(f"      length_A = sqrt({y_component:.4f}² + {x_horizontal:.4f}²) = sqrt({y_component**2:.6f} + {x_horizontal**2:.6f}) = {length_A:.6f}")
 
     return length_A
 
@@ -68,20 +130,22 @@ def length_b(x, y, dist_from_pulley, cable_sepperation, width, pixel_size, offse
     y_component = dist_from_pulley - y * pixel_size
     x_horizontal_a = (cable_sepperation / 2) - ((width * pixel_size) / 2) + x * pixel_size + offset
     x_horizontal = cable_sepperation - x_horizontal_a
-    length_B = math.sqrt(y_component ** 2 + x_horizontal ** 2)
+    length_B = math.sqrt(y_component * y_component + x_horizontal * x_horizontal)
 
-    print(f"\n    length_b calculation:")
-    print(f"      y_component = dist_from_pulley - y*pixel_size = {dist_from_pulley} - {y}*{pixel_size} = {y_component:.4f}")
-    print(f"      x_horizontal_a = (cable_sep/2) - (width*pixel_size/2) + x*pixel_size + offset")
-    print(f"               = ({cable_sepperation/2:.2f}) - ({width * pixel_size / 2:.4f}) + {x * pixel_size:.4f} + {offset:.4f}")
-    print(f"               = {x_horizontal_a:.4f}")
-    print(f"      x_horizontal = cable_sep - x_horizontal_a = {cable_sepperation} - {x_horizontal_a:.4f} = {x_horizontal:.4f}")
-    print(f"      length_B = sqrt({y_component:.4f}² + {x_horizontal:.4f}²) = sqrt({y_component**2:.6f} + {x_horizontal**2:.6f}) = {length_B:.6f}")
+    if instrumentation.debug_enabled():
+        print(f"\n    length_b calculation:")
+        print(f"      y_component = dist_from_pulley - y*pixel_size = {dist_from_pulley} - {y}*{pixel_size} = {y_component:.4f}")
+        print(f"      x_horizontal_a = (cable_sep/2) - (width*pixel_size/2) + x*pixel_size + offset")
+        print(f"               = ({cable_sepperation/2:.2f}) - ({width * pixel_size / 2:.4f}) + {x * pixel_size:.4f} + {offset:.4f}")
+        print(f"               = {x_horizontal_a:.4f}")
+        print(f"      x_horizontal = cable_sep - x_horizontal_a = {cable_sepperation} - {x_horizontal_a:.4f} = {x_horizontal:.4f}")
+        print(f"      length_B = sqrt({y_component:.4f}² + {x_horizontal:.4f}²) = sqrt({y_component**2:.6f} + {x_horizontal**2:.6f}) = {length_B:.6f}")
 
     return length_B
 
 
 def get_color_name(hex_code):
+    import webcolors
     try:
         return webcolors.hex_to_name(hex_code)
     except ValueError:
@@ -97,6 +161,20 @@ def get_color_name(hex_code):
         return closest_name
 
 
+def auto_color_order(color_counts):
+    """Auto-guess the nozzle order: white last, others sorted by pixel count desc.
+
+    Index ``i`` (1-based) of the returned list is the default nozzle index.
+    """
+    white_hex = '#ffffff'
+    non_white = sorted(
+        [c for c in color_counts if c.lower() != white_hex],
+        key=lambda c: color_counts[c], reverse=True
+    )
+    has_white = white_hex in color_counts
+    return non_white + ([white_hex] if has_white else [])
+
+
 def count_unique_hex_colors(image_path):
     """Show a window listing all unique colors in the image.
 
@@ -105,26 +183,12 @@ def count_unique_hex_colors(image_path):
     """
     try:
         import tkinter as tk
-        from collections import Counter
-
-        print(f"[DEBUG] count_unique_hex_colors called with: {image_path}")
-        image = Image.open(image_path).convert("RGBA")
-        pixels = list(image.getdata())
-        total_opaque = sum(1 for r, g, b, a in pixels if a != 0)
-
-        # Count pixels per color
-        color_counts = Counter(
-            f'#{r:02x}{g:02x}{b:02x}' for r, g, b, a in pixels if a != 0
-        )
-
-        # Auto-guess indices: white last, others sorted by pixel count desc
-        white_hex = '#ffffff'
-        non_white = sorted(
-            [c for c in color_counts if c.lower() != white_hex],
-            key=lambda c: color_counts[c], reverse=True
-        )
-        has_white = white_hex in color_counts
-        ordered = non_white + ([white_hex] if has_white else [])
+
+        print(f"[DEBUG] count_unique_hex_colors called with: {image_path if isinstance(image_path, str) else 'in-memory image'}")
+        color_counts = palette.count_colors(load_image_array(image_path))
+        total_opaque = sum(color_counts.values())
+
+        ordered = auto_color_order(color_counts)
 
         # --- Build UI ---
         BG = "#f5f5f5"
@@ -237,21 +301,13 @@ def count_unique_hex_colors(image_path):
 def extract_color(image_path, hex_color, temp_images_folder):
     try:
         hex_color_stripped = hex_color.lstrip('#')
-        target_color = tuple(int(hex_color_stripped[i:i+2], 16) for i in (0, 2, 4))
-
-        image = Image.open(image_path).convert('RGBA')
-        data = image.getdata()
-
-        new_image = Image.new('RGBA', image.size, (255, 255, 255, 0))
-        new_data = []
-
-        for item in data:
-            if item[:3] == target_color and item[3] != 0:
-                new_data.append((*item[:3], 255))
-            else:
-                new_data.append((255, 255, 255, 0))
+        pixels = load_image_array(image_path)
+        indexer = palette.PaletteIndexer({hex_color: 1})
+        plane = indexer.index_plane(pixels)
 
-        new_image.putdata(new_data)
+        # Matching pixels keep their color at full opacity; everything else is
+        # transparent white.
+        new_image = Image.fromarray(indexer.colorize(plane), 'RGBA')
         output_path = os.path.join(temp_images_folder, hex_color_stripped + ".png")
         new_image.save(output_path, 'PNG')
         print(f"Image saved to {output_path}")
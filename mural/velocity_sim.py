@@ -0,0 +1,214 @@
+import argparse
+import csv
+import sys
+
+import numpy as np
+import firmware
+import job_estimate
+import kinematics
+
+
+# Offline replay of the base module's stripe loop (parser.cpp / movement.cpp).
+#
+# During a stripe the firmware re-solves the cable speeds every
+# velocityCalcDelay ms with determineStripeVelocities and lets runSpeed hold
+# them until the next update:
+#   t = 0            motors at rest on the start position (move_to_position_blocking
+#                    truncates the target to whole steps)
+#   t = k * delay    speeds recomputed from the current step counts
+#   t = drop / v     loop ends, motors stop
+# The chassis fires pattern row k at (k + 1) * (drop / v) / rows
+# (sprayAndStripe), so the error of a row is the simulated chassis position at
+# that moment minus where the straight stripe path puts it.
+#
+# All stripes advance together: one array operation per velocity update, so
+# a whole mural takes a few hundred steps.  The update rule runs in float32
+# like the firmware's floats; stepper positions are whole steps.  Positions
+# and errors are in the pulley frame (meters, y down), see kinematics.py.
+#
+#   python velocity_sim.py gcode.txt [--delay-ms 50] [--csv rows.csv]
+
+
+def stripe_velocities(pos_a, pos_b, pulley_spacing, steps_per_meter, stripe_velocity, delay_ms, direction,
+                      dtype=np.float32):
+    """determineStripeVelocities for arrays of step counts; returns (velA, velB) in steps/s."""
+    pos_a = np.asarray(pos_a).astype(dtype)
+    pos_b = np.asarray(pos_b).astype(dtype)
+    direction = np.asarray(direction).astype(dtype)
+    steps_per_meter = dtype(steps_per_meter)
+    delay = dtype(delay_ms) / dtype(1000)
+    spacing = dtype(pulley_spacing) * steps_per_meter
+    spread = pos_a * pos_a - pos_b * pos_b + spacing * spacing
+    x = spread / spacing / dtype(2.0)
+    with np.errstate(invalid='ignore'):
+        y = np.sqrt(dtype(4.0) * pos_a * pos_a - spread * spread / (spacing * spacing)) / dtype(2.0)
+    desired_y = direction * steps_per_meter * dtype(stripe_velocity) * delay + y
+    length_a = np.sqrt(x * x + desired_y * desired_y)
+    length_b = np.sqrt((x - spacing) * (x - spacing) + desired_y * desired_y)
+    return (length_a - pos_a) / delay, (length_b - pos_b) / delay
+
+
+def simulate_stripes(start_a, start_b, drop, rows, cable_sepperation, reverse=None,
+                     steps_per_meter=firmware.STEPS_PER_METER, rig_steps_per_meter=None,
+                     delay_ms=firmware.VELOCITY_CALC_DELAY_MS, velocity_multiplier=1.0, dtype=np.float32):
+    """Replay the stripe loop for every stripe at once.
+
+    ``start_a`` / ``start_b`` / ``drop`` are the gcode values in meters and
+    ``rows`` the pattern row count of each stripe.  ``steps_per_meter`` is the
+    firmware setting; ``rig_steps_per_meter`` the rig's real calibration
+    (default: the same), which turns step counts back into meters on the wall.
+
+    Returns a dict of flat per-row arrays (``stripe``, ``row``, ``time_s``,
+    ``x_err_m``, ``y_err_m``) and per-stripe arrays (``end_x_err_m``,
+    ``end_y_err_m``, ``max_err_m``, ``updates``).
+    """
+    start_a = np.asarray(start_a, dtype=np.float64)
+    start_b = np.asarray(start_b, dtype=np.float64)
+    drop = np.asarray(drop, dtype=np.float64)
+    rows = np.asarray(rows, dtype=np.int64)
+    n = start_a.shape[0]
+    direction = np.ones(n) if reverse is None else np.where(np.asarray(reverse, dtype=bool), -1.0, 1.0)
+    rig_steps_per_meter = steps_per_meter if rig_steps_per_meter is None else rig_steps_per_meter
+    velocity = firmware.STRIPE_VELOCITY * velocity_multiplier
+    delay = delay_ms / 1000.0
+
+    # loop length in whole milliseconds, and the updates that fit before it
+    duration_ms = drop / velocity * 1000.0
+    end_s = np.ceil(duration_ms) / 1000.0
+    updates = np.maximum(np.ceil(duration_ms / delay_ms).astype(np.int64) - 1, 0)
+    steps = int(updates.max()) if n else 0
+
+    # positions at t = k * delay (plus the end), speeds held from each update
+    pos_a = np.empty((n, steps + 2))
+    pos_b = np.empty((n, steps + 2))
+    vel_a = np.zeros((n, steps + 1))
+    vel_b = np.zeros((n, steps + 1))
+    pos_a[:, 0] = np.trunc(start_a * steps_per_meter)
+    pos_b[:, 0] = np.trunc(start_b * steps_per_meter)
+    for k in range(steps + 1):
+        if k > 0:
+            active = k <= updates
+            va, vb = stripe_velocities(np.rint(pos_a[:, k]), np.rint(pos_b[:, k]), cable_sepperation,
+                                       steps_per_meter, velocity, delay_ms, direction, dtype)
+            vel_a[:, k] = np.where(active, va, 0.0)
+            vel_b[:, k] = np.where(active, vb, 0.0)
+        held = np.clip(end_s - k * delay, 0.0, delay)
+        pos_a[:, k + 1] = pos_a[:, k] + vel_a[:, k] * held
+        pos_b[:, k + 1] = pos_b[:, k] + vel_b[:, k] * held
+
+    # chassis position when each pattern row fires
+    stripe = np.repeat(np.arange(n), rows)
+    row = np.arange(stripe.shape[0]) - np.repeat(np.cumsum(rows) - rows, rows)
+    time_s = (row + 1) * (drop / velocity / np.maximum(rows, 1))[stripe]
+    k = np.minimum((time_s / delay).astype(np.int64), steps)
+    dt = time_s - k * delay
+    a = (pos_a[stripe, k] + vel_a[stripe, k] * dt) / rig_steps_per_meter
+    b = (pos_b[stripe, k] + vel_b[stripe, k] * dt) / rig_steps_per_meter
+    x, y = kinematics.position_from_lengths(a, b, cable_sepperation)
+    x0, y0 = kinematics.position_from_lengths(start_a, start_b, cable_sepperation)
+    x_err = x - x0[stripe]
+    y_err = y - (y0[stripe] + direction[stripe] * velocity * time_s)
+
+    # where each stripe really stops against where it should
+    end_x, end_y = kinematics.position_from_lengths(pos_a[:, -1] / rig_steps_per_meter,
+                                                    pos_b[:, -1] / rig_steps_per_meter, cable_sepperation)
+    error = np.hypot(x_err, y_err)
+    max_err = np.zeros(n)
+    np.maximum.at(max_err, stripe, error)
+    return {
+        "stripe": stripe,
+        "row": row,
+        "time_s": time_s,
+        "x_err_m": x_err,
+        "y_err_m": y_err,
+        "end_x_err_m": end_x - x0,
+        "end_y_err_m": end_y - (y0 + direction * drop),
+        "max_err_m": max_err,
+        "updates": updates,
+    }
+
+
+def simulate_file(gcode_filepath, cable_sepperation=None, **kwargs):
+    """Read a gcode file and simulate it; returns (stripes dict, result dict).
+
+    ``cable_sepperation`` defaults to the file's "pulley spacing" header.
+    Remaining keyword arguments go to ``simulate_stripes``.
+    """
+    stripes = job_estimate.read_stripes(gcode_filepath)
+    if cable_sepperation is None:
+        cable_sepperation = stripes["pulley_spacing"]
+    if cable_sepperation is None:
+        raise ValueError(f"{gcode_filepath} has no 'pulley spacing' line; pass cable_sepperation")
+    result = simulate_stripes(stripes["start_a"], stripes["start_b"], stripes["drop"], stripes["rows"],
+                              cable_sepperation, reverse=stripes["reverse"], **kwargs)
+    return stripes, result
+
+
+def print_report(stripes, result, per_stripe=False):
+    error = np.hypot(result["x_err_m"], result["y_err_m"]) * 1000.0
+    print(f"Stripes: {len(stripes['column'])}, pattern rows: {error.size}")
+    if error.size == 0:
+        return
+    print(f"Row error (mm): max {error.max():.2f}, rms {np.sqrt(np.mean(error * error)):.2f}, "
+          f"mean x {result['x_err_m'].mean() * 1000.0:+.2f}, mean y {result['y_err_m'].mean() * 1000.0:+.2f}")
+    end = np.hypot(result["end_x_err_m"], result["end_y_err_m"]) * 1000.0
+    worst = int(np.argmax(result["max_err_m"]))
+    print(f"Stripe end error (mm): max {end.max():.2f}, mean {end.mean():.2f}")
+    print(f"Worst stripe: #{worst + 1} (column {stripes['column'][worst]}), "
+          f"{result['max_err_m'][worst] * 1000.0:.2f} mm")
+    if not per_stripe:
+        return
+    print(f"{'#':>5} {'column':>6} {'updates':>7} {'max mm':>8} {'end x mm':>9} {'end y mm':>9}")
+    for i in range(len(stripes["column"])):
+        print(f"{i + 1:>5} {stripes['column'][i]:>6} {result['updates'][i]:>7} "
+              f"{result['max_err_m'][i] * 1000.0:>8.2f} {result['end_x_err_m'][i] * 1000.0:>9.2f} "
+              f"{result['end_y_err_m'][i] * 1000.0:>9.2f}")
+
+
+def write_rows_csv(stripes, result, csv_path):
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["stripe", "column", "row", "time_s", "x_err_mm", "y_err_mm"])
+        columns = stripes["column"][result["stripe"]]
+        for values in zip((result["stripe"] + 1).tolist(), columns.tolist(), result["row"].tolist(),
+                          result["time_s"].round(4).tolist(), (result["x_err_m"] * 1000.0).round(3).tolist(),
+                          (result["y_err_m"] * 1000.0).round(3).tolist()):
+            writer.writerow(values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a gcode file through the firmware's stripe velocity loop.")
+    parser.add_argument("gcode", help="text or binary gcode file")
+    parser.add_argument("--pulley-spacing", type=float, help="cable separation in meters (default: from the file)")
+    parser.add_argument("--steps-per-meter", type=float, default=firmware.STEPS_PER_METER,
+                        help="stepsPerMeter in the firmware")
+    parser.add_argument("--rig-steps-per-meter", type=float, help="real steps per meter of the rig (default: same)")
+    parser.add_argument("--delay-ms", type=float, default=firmware.VELOCITY_CALC_DELAY_MS,
+                        help="velocityCalcDelay in ms")
+    parser.add_argument("--velocity-multiplier", type=float, default=1.0, help="stripeVelocityMultiplier")
+    parser.add_argument("--float64", action="store_true", help="run the update rule in double precision")
+    parser.add_argument("--stripes", action="store_true", help="also print the per-stripe errors")
+    parser.add_argument("--csv", help="write the error of every pattern row to this CSV file")
+    args = parser.parse_args(argv)
+
+    try:
+        stripes, result = simulate_file(
+            args.gcode, args.pulley_spacing,
+            steps_per_meter=args.steps_per_meter,
+            rig_steps_per_meter=args.rig_steps_per_meter,
+            delay_ms=args.delay_ms,
+            velocity_multiplier=args.velocity_multiplier,
+            dtype=np.float64 if args.float64 else np.float32,
+        )
+    except Exception as e:
+        print(f"Could not simulate {args.gcode}: {e}")
+        return 1
+    print_report(stripes, result, args.stripes)
+    if args.csv:
+        write_rows_csv(stripes, result, args.csv)
+        print(f"Row errors written to {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())